@@ -5,7 +5,7 @@ setuptools.setup(
 	name = 'stl-plot',
 	version = '0.1',
 	packages = ['stl_plot'],
-	install_requires = ['numpy-stl'],
+	install_requires = ['numpy-stl', 'pyclipper'],
 	entry_points = dict(
 		console_scripts = [
 			'stl-plot=stl_plot:script_main']))
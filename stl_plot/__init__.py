@@ -1,24 +1,226 @@
 import argparse
+import math
 import os
+import re
+import sys
 
-from stl_plot.plot import main
+# Only lightweight modules are imported here, so that argument errors and --help are reported without loading numpy and the hidden-line code. The modules used by each command are imported after the arguments are parsed.
+from stl_plot import engines
+
+
+def _parse_size(value):
+	match = re.fullmatch(r'([0-9]+(?:\.[0-9]*)?)([kMGT]?)', value)
+
+	if match is None:
+		raise argparse.ArgumentTypeError('Invalid size: {}'.format(value))
+
+	number, unit = match.groups()
+
+	return int(float(number) * 1024 ** ' kMGT'.index(unit or ' '))
+
+
+def parse_camera(value):
+	try:
+		numbers = [float(i) for i in value.split(',')]
+	except ValueError:
+		numbers = None
+
+	if numbers is None or len(numbers) not in [2, 9, 16]:
+		raise argparse.ArgumentTypeError('Invalid camera: {}'.format(value))
+
+	return numbers
 
 
 def parse_args():
 	parser = argparse.ArgumentParser()
 
-	parser.add_argument('input_file')
-	parser.add_argument('-o', '--output-file')
+	parser.add_argument(
+		'input_files',
+		nargs = '+',
+		metavar = 'input_file',
+		help = 'Mesh files to plot. The format is selected by the extension: .stl, .obj, binary .ply, .json or .bjson, a binary variant of the JSON format. A .scene file is a JSON file listing mesh files to combine, each placed with a 4x4 transform.')
+	parser.add_argument(
+		'-o',
+		'--output-file',
+		help = 'Path of the generated PDF file. Only allowed with a single input file. Defaults to the input file with the suffix replaced by .pdf.')
+	parser.add_argument(
+		'--camera',
+		type = parse_camera,
+		default = [14.4, 21.6],
+		help = 'Direction from which the mesh is viewed. Either given as AZIMUTH,ELEVATION in degrees, where 0,0 looks at the mesh along the y axis with the z axis pointing up, or as the 9 comma-separated entries of a 3x3 rotation matrix in row-major order, which transforms the mesh into the coordinate system of the drawing. The 16 entries of a 4x4 matrix are also accepted, if it does not contain a translation or perspective part. Defaults to 14.4,21.6.')
+	parser.add_argument(
+		'--max-error',
+		type = float,
+		help = 'Simplify the mesh before plotting, moving no vertex farther than this distance (in mm on the drawing) from the original surface.')
+	parser.add_argument(
+		'--min-angle',
+		type = float,
+		# Slightly more than 360° divided by $fn = 32.
+		default = math.degrees(6.3 / 32),
+		help = 'Minimum angle in degrees between the normals of two visible faces for the edge between them to be drawn. Defaults to about 11.3°.')
+	parser.add_argument(
+		'--shading',
+		type = int,
+		metavar = 'SHADES',
+		help = 'Fill the visible faces using this number of shades of gray depending on their orientation.')
+
+	parser.add_argument(
+		'--max-memory',
+		type = _parse_size,
+		help = 'Render the drawing in tiles so that the memory used stays approximately below this size in bytes. Suffixes k, M, G and T are supported.')
+
+	parser.add_argument(
+		'--sidecar',
+		action = 'store_true',
+		help = 'Store the preprocessed mesh in a directory next to each input file and reuse it in later runs as long as the input file is unchanged.')
+	parser.add_argument(
+		'--engine',
+		choices = engines.names(),
+		default = 'exact',
+		help = 'Algorithm used to find the visible parts of the edges. exact tests each part of each edge on its own, qi propagates the number of faces hiding an edge along chains of connected edges, which is faster. clip clips the edges against the area covered by the faces in front of them using floating-point arithmetic, which is faster for meshes with many small faces. Defaults to exact.')
+	parser.add_argument(
+		'--shard-dir',
+		help = 'Split finding the visible lines into shards, which are written to this directory and can be processed by `stl-plot worker` processes on this or other hosts in parallel. This process also processes shards and merges the results.')
+	parser.add_argument(
+		'--shards',
+		dest = 'shard_count',
+		type = int,
+		default = 64,
+		help = 'Number of shards into which the drawn edges are split. Defaults to 64.')
+	parser.add_argument(
+		'--shard-timeout',
+		type = float,
+		default = 60,
+		help = 'Time in seconds after which a shard claimed by a worker which stopped responding is processed again. Defaults to 60.')
+	parser.add_argument(
+		'--resume',
+		action = 'store_true',
+		help = 'Write a checkpoint to <output>.checkpoint next to each output file and continue from an existing one, skipping the segments processed by an interrupted run. The checkpoint is only used if the input file and the settings are unchanged and is removed once the output file has been written.')
+	parser.add_argument(
+		'--progressive',
+		action = 'store_true',
+		help = 'Write a draft containing only the approximate silhouettes first and replace the output file with refined drawings while the exact lines are being found.')
+	parser.add_argument(
+		'--time-budget',
+		type = float,
+		help = 'Stop refining a progressive drawing after this many seconds and use the draft lines for the silhouettes which have not been refined by then. The budget can be exceeded by the time needed to prepare the mesh and to process a single segment. Implies --progressive.')
+	parser.add_argument(
+		'-j',
+		'--jobs',
+		type = int,
+		default = os.cpu_count() or 1,
+		help = 'Maximum number of drawings compiled at the same time. Defaults to the number of CPUs.')
+	parser.add_argument(
+		'--compile-timeout',
+		type = float,
+		help = 'Abort compiling a drawing after this many seconds.')
 
 	args = parser.parse_args()
 
 	if args.output_file is None:
-		basename, _ = os.path.splitext(args.input_file)
+		def get_output_file(input_file):
+			basename, _ = os.path.splitext(input_file)
+
+			return basename + '.pdf'
+
+		args.output_files = [get_output_file(i) for i in args.input_files]
+	elif len(args.input_files) == 1:
+		args.output_files = [args.output_file]
+	else:
+		parser.error('--output-file cannot be used with multiple input files.')
+
+	del args.output_file
 
-		args.output_file = basename + '.pdf'
+	if args.time_budget is not None:
+		args.progressive = True
 
 	return args
 
 
+def parse_serve_args(args):
+	parser = argparse.ArgumentParser(
+		prog = 'stl-plot serve',
+		description = 'Run a local HTTP service rendering STL files to PDF or SVG files, which keeps recently used meshes loaded.')
+
+	parser.add_argument(
+		'--host',
+		default = '127.0.0.1',
+		help = 'Address on which to listen. Defaults to 127.0.0.1.')
+	parser.add_argument(
+		'--port',
+		type = int,
+		default = 8420,
+		help = 'Port on which to listen. Defaults to 8420.')
+	parser.add_argument(
+		'--socket',
+		help = 'Listen on a Unix socket at this path instead of a TCP port.')
+	parser.add_argument(
+		'-j',
+		'--jobs',
+		type = int,
+		default = os.cpu_count() or 1,
+		help = 'Number of requests processed at the same time. The hidden-line removal of these requests runs in threads of the server process, which do not run Python code in parallel, so this mainly allows the Asymptote processes of several requests to run in parallel. Defaults to the number of CPUs.')
+	parser.add_argument(
+		'--max-queue',
+		type = int,
+		default = 64,
+		help = 'Number of requests which can wait for a worker. Further requests are rejected with status 503. Defaults to 64.')
+	parser.add_argument(
+		'--cache-size',
+		type = int,
+		default = 16,
+		help = 'Number of loaded meshes kept in memory. Defaults to 16.')
+	parser.add_argument(
+		'--root',
+		help = 'Allow rendering files read by the server from paths given relative to this directory. Files outside of it cannot be read. Without this option, meshes can only be sent in the request body.')
+	parser.add_argument(
+		'--sidecar',
+		action = 'store_true',
+		help = 'Use sidecars when loading meshes from a path, as with stl-plot --sidecar. The sidecars are written next to the files inside of the directory given by --root.')
+	parser.add_argument(
+		'--compile-timeout',
+		type = float,
+		help = 'Abort compiling a drawing after this many seconds.')
+
+	return parser.parse_args(args)
+
+
+def parse_worker_args(args):
+	parser = argparse.ArgumentParser(
+		prog = 'stl-plot worker',
+		description = 'Process the shards of drawings started with stl-plot --shard-dir.')
+
+	parser.add_argument('shard_dir', help = 'Directory passed to --shard-dir.')
+	parser.add_argument(
+		'--shard-timeout',
+		dest = 'timeout',
+		type = float,
+		default = 60,
+		help = 'Time in seconds after which a shard claimed by a worker which stopped responding is processed again. Must be the same as used by stl-plot --shard-dir. Defaults to 60.')
+	parser.add_argument(
+		'--wait',
+		action = 'store_true',
+		help = 'Keep waiting for new shards instead of exiting when there are none left.')
+
+	return parser.parse_args(args)
+
+
 def script_main():
-	main(**vars(parse_args()))
+	if sys.argv[1:2] == ['worker']:
+		args = parse_worker_args(sys.argv[2:])
+
+		from stl_plot import shards
+
+		shards.main(**vars(args))
+	elif sys.argv[1:2] == ['serve']:
+		args = parse_serve_args(sys.argv[2:])
+
+		from stl_plot import server
+
+		server.main(**vars(args))
+	else:
+		args = parse_args()
+
+		from stl_plot import plot
+
+		plot.main(**vars(args))
@@ -0,0 +1,121 @@
+"""
+Checkpoints of a running hidden-line removal, so that a run which has been interrupted can be resumed without finding the visible parts of the segments already processed again.
+
+A checkpoint is an append-only text file. The first line is a JSON object containing the version of the format and a key identifying the input mesh and the settings of the run. Each following line records a completed drawn segment as its index followed by the start and end positions of its visible parts, as fractions of the form numerator/denominator. A line which has been cut off when the process was killed is ignored.
+"""
+
+import contextlib, fractions, json, os, time
+from stl_plot import util
+
+
+# Incremented whenever the format of the checkpoint changes.
+_version = 1
+
+# Maximum interval in seconds between writes of the completed segments to the file.
+_flush_interval = 60
+
+
+def _parse_records(data):
+	"""
+	Return a dict mapping the indices of the completed segments to lists of their visible intervals, and the number of bytes containing complete records.
+	"""
+
+	completed = { }
+	size = 0
+
+	while True:
+		end = data.find(b'\n', size)
+
+		if end < 0:
+			return completed, size
+
+		index, *positions = data[size:end].split()
+		positions = [fractions.Fraction(i.decode('ascii')) for i in positions]
+		completed[int(index)] = list(zip(positions[::2], positions[1::2]))
+		size = end + 1
+
+
+class Checkpoint:
+	"""
+	An open checkpoint file, to which completed segments are added.
+	"""
+
+	def __init__(self, *, file, completed):
+		self._file = file
+		self._pending = []
+		self._last_flush = time.monotonic()
+
+		self.completed = completed
+		"""Dict mapping the indices of the segments completed by a previous run to the lists of their visible intervals."""
+
+	def add(self, index, intervals):
+		"""
+		Record the visible intervals, given as pairs of positions along the segment, of the drawn segment with the specified index.
+		"""
+
+		self._pending.append(' '.join([str(index)] + [str(i) for interval in intervals for i in interval]) + '\n')
+
+		if time.monotonic() - self._last_flush >= _flush_interval:
+			self.flush()
+
+	def flush(self):
+		self._file.write(''.join(self._pending).encode('ascii'))
+		self._file.flush()
+		os.fsync(self._file.fileno())
+
+		self._pending = []
+		self._last_flush = time.monotonic()
+
+
+def _read_checkpoint(path, header):
+	"""
+	Return the completed segments and the number of valid bytes of an existing checkpoint, or None, if the file does not exist or was written for a different key.
+	"""
+
+	try:
+		data = util.read_file(path)
+	except FileNotFoundError:
+		return None
+
+	header_end = data.find(b'\n') + 1
+
+	if data[:header_end] != header:
+		return None
+
+	completed, size = _parse_records(data[header_end:])
+
+	return completed, header_end + size
+
+
+@contextlib.contextmanager
+def open_checkpoint(path, key, resume):
+	"""
+	Open the checkpoint at the specified path for a run identified by key and yield it as a Checkpoint instance. Pending records are written when the context is exited, also if the run failed.
+
+	If resume is true and the checkpoint exists and has been written for the same key, the segments completed by the previous run are loaded and new segments are appended. Otherwise, an empty checkpoint is written.
+	"""
+
+	header = (json.dumps(dict(version = _version, key = key), sort_keys = True) + '\n').encode('ascii')
+	existing = _read_checkpoint(path, header) if resume else None
+
+	if existing is None:
+		if resume:
+			util.log('No checkpoint found to resume from.')
+
+		util.write_file(path, header)
+		completed = { }
+	else:
+		completed, size = existing
+
+		util.log('Resuming with {} completed segments.', len(completed))
+
+		# Remove a cut-off record.
+		os.truncate(path, size)
+
+	with open(path, 'ab') as file:
+		checkpoint = Checkpoint(file = file, completed = completed)
+
+		try:
+			yield checkpoint
+		finally:
+			checkpoint.flush()
@@ -0,0 +1,286 @@
+"""
+Object-space hidden-line engine, which finds the visible parts of the drawn segments by clipping them against the area of the drawing covered by the faces in front of them.
+
+The drawing is divided into a grid of cells. Each cell keeps a running union of the front patches overlapping it as a paths.Polygon instance. The drawn segments are processed from front to back and the patches lying entirely in front of the current segment are added to the unions, nearest first. Clipping a segment against the unions of the cells it crosses yields its visible parts directly, without testing a point between each pair of crossings with the border segments. Patches whose range of depths overlaps that of the segment are clipped against one by one and only hide the parts of the segment behind their plane.
+
+The positions along the segments are calculated using floating-point numbers and the integer coordinates used by clipper. Unlike with the exact engine, the ends of the visible parts which do not lie at a vertex are therefore approximate.
+"""
+
+import bisect, collections, fractions, math, numpy
+from stl_plot.fabricate import geometry, paths
+from stl_plot import plot, engines
+
+
+# Size of the cells of the grid relative to the median size of the patches.
+_cell_size_factor = 8
+
+# Tolerance used when comparing depths and positions, relative to the size of the drawing.
+_relative_tolerance = 1e-9
+
+
+def _get_patch_polygon(patch: plot.Patch):
+	"""
+	Return a paths.Polygon instance covering a patch, whose boundary segments can form multiple loops.
+	"""
+
+	segments_by_start = collections.defaultdict(list)
+
+	for i in patch.boundary:
+		segments_by_start[id(i.start)].append(i)
+
+	def iter_loops():
+		while segments_by_start:
+			start = next(iter(segments_by_start))
+			loop = []
+			point_id = start
+
+			while point_id in segments_by_start:
+				segments = segments_by_start[point_id]
+				segment = segments.pop()
+
+				if not segments:
+					del segments_by_start[point_id]
+
+				loop.append((float(segment.start.x), float(segment.start.y)))
+				point_id = id(segment.end)
+
+			yield loop
+
+	return paths.polygon(*(i for i in iter_loops() if len(i) > 2))
+
+
+class _Cell:
+	"""
+	The front patches overlapping a cell of the grid, nearest first by their minimum depth, and the union of the area covered by the patches added to it so far.
+	"""
+
+	def __init__(self, patch_ids, min_zs):
+		self.patch_ids = patch_ids[numpy.argsort(-min_zs[patch_ids], kind = 'stable')]
+
+		# Negated, so that the list is sorted in ascending order as needed by bisect.
+		self.negated_min_zs = (-min_zs[self.patch_ids]).tolist()
+
+		# Number of patches from the start of patch_ids which have been added to the union.
+		self.added_count = 0
+		self.covered_area = paths.union()
+
+
+def iter_visible_ranges_clip(drawn_segments, border_segments, patches, bounds = None, checkpoint = None):
+	"""
+	Alternative to plot.iter_visible_ranges(), which clips the drawn segments against the area covered by the front patches in front of them. The segments are yielded from front to back.
+
+	A checkpoint is used as by plot.iter_visible_ranges().
+	"""
+
+	patches = [i for i in patches if i.is_front]
+	polygons = [_get_patch_polygon(i) for i in patches]
+
+	def patch_array(get_value):
+		return numpy.array([float(get_value(i)) for i in patches], dtype = numpy.float64)
+
+	min_xs = patch_array(lambda x: x.min_x)
+	max_xs = patch_array(lambda x: x.max_x)
+	min_ys = patch_array(lambda x: x.min_y)
+	max_ys = patch_array(lambda x: x.max_y)
+	min_zs = patch_array(lambda x: x.min_z)
+	max_zs = patch_array(lambda x: x.max_z)
+
+	# Plane of each patch, given by a point and the derivatives of the depth.
+	plane_xs = patch_array(lambda x: x.p1.x)
+	plane_ys = patch_array(lambda x: x.p1.y)
+	plane_zs = patch_array(lambda x: x.p1.z)
+	dz_dxs = patch_array(lambda x: x.dz_dx)
+	dz_dys = patch_array(lambda x: x.dz_dy)
+
+	# Coordinates of the start and end point of each drawn segment.
+	coordinates = numpy.array(
+		[[float(j) for j in (i.start.x, i.start.y, i.start.z, i.end.x, i.end.y, i.end.z)] for i in drawn_segments],
+		dtype = numpy.float64).reshape((-1, 6))
+
+	all_xs = numpy.concatenate([min_xs, max_xs, coordinates[:, 0], coordinates[:, 3]])
+	all_ys = numpy.concatenate([min_ys, max_ys, coordinates[:, 1], coordinates[:, 4]])
+	size = max(numpy.ptp(all_xs), numpy.ptp(all_ys)) if len(all_xs) else 0
+	tolerance = size * _relative_tolerance
+
+	# Sort the patches into a grid of cells.
+	extents = numpy.maximum(max_xs - min_xs, max_ys - min_ys)
+	cell_size = float(numpy.median(extents)) * _cell_size_factor if len(patches) else 1.
+	origin_x, origin_y = (float(min_xs.min()), float(min_ys.min())) if len(patches) else (0., 0.)
+
+	def get_cell(x, y):
+		return math.floor((x - origin_x) / cell_size), math.floor((y - origin_y) / cell_size)
+
+	patch_ids_by_cell = collections.defaultdict(list)
+
+	for i, (min_x, min_y, max_x, max_y) in enumerate(zip(min_xs.tolist(), min_ys.tolist(), max_xs.tolist(), max_ys.tolist())):
+		(cell_min_x, cell_min_y), (cell_max_x, cell_max_y) = get_cell(min_x, min_y), get_cell(max_x, max_y)
+
+		for x in range(cell_min_x, cell_max_x + 1):
+			for y in range(cell_min_y, cell_max_y + 1):
+				patch_ids_by_cell[x, y].append(i)
+
+	cells = {
+		k: _Cell(numpy.array(v, dtype = numpy.int64), min_zs)
+		for k, v in patch_ids_by_cell.items()}
+
+	# Ids of the patches by their boundary segments, identified by the ids of their points. Patches only contain the points strictly inside of them, so a segment lying on the boundary of a patch is not hidden by it, even where the patch is not quite planar.
+	patch_ids_by_edge = collections.defaultdict(list)
+
+	for i, patch in enumerate(patches):
+		for j in patch.boundary:
+			patch_ids_by_edge[frozenset([id(j.start), id(j.end)])].append(i)
+
+	def z_at(patch_id, x, y):
+		return plane_zs[patch_id] \
+			+ dz_dxs[patch_id] * (x - plane_xs[patch_id]) \
+			+ dz_dys[patch_id] * (y - plane_ys[patch_id])
+
+	def get_hidden_ranges(index):
+		"""
+		Return the positions along a segment delimiting the parts hidden by the front patches, as a list of pairs of floats.
+		"""
+
+		sx, sy, sz, ex, ey, ez = coordinates[index].tolist()
+		segment_path = paths.path((sx, sy), (ex, ey))
+		dx = ex - sx
+		dy = ey - sy
+		length_squared = dx * dx + dy * dy
+		min_z, max_z = min(sz, ez), max(sz, ez)
+
+		def get_position(vertex):
+			x, y = vertex
+
+			if (x, y) == (sx, sy):
+				return 0.
+			elif (x, y) == (ex, ey):
+				return 1.
+
+			return min(max(((x - sx) * dx + (y - sy) * dy) / length_squared, 0.), 1.)
+
+		def clip(polygon):
+			for i in paths.clip_path(segment_path, polygon):
+				positions = [get_position(j) for j in i.vertices]
+
+				yield min(positions), max(positions)
+
+		hidden_ranges = []
+		candidate_ids = set()
+		(cell_min_x, cell_min_y), (cell_max_x, cell_max_y) = get_cell(min(sx, ex), min(sy, ey)), get_cell(max(sx, ex), max(sy, ey))
+
+		for x in range(cell_min_x, cell_max_x + 1):
+			for y in range(cell_min_y, cell_max_y + 1):
+				cell = cells.get((x, y))
+
+				if cell is None:
+					continue
+
+				# Patches lying entirely in front of the segment.
+				front_count = bisect.bisect_left(cell.negated_min_zs, -(max_z + tolerance))
+
+				# These are always clipped against as a union, as a segment lying on the boundary between two such patches is not inside of either of them.
+				if front_count > cell.added_count:
+					covered_area = paths.union(
+						cell.covered_area,
+						*(polygons[i] for i in cell.patch_ids[cell.added_count:front_count].tolist()))
+
+					# Replaced with a concrete polygon so that the unions of the earlier steps are not kept alive as operands.
+					cell.covered_area = paths.polygon(*covered_area.paths)
+					cell.added_count = front_count
+
+				if cell.added_count:
+					hidden_ranges.extend(clip(cell.covered_area))
+
+				# The remaining patches which may hide part of the segment.
+				ids = cell.patch_ids[cell.added_count:]
+				ids = ids[
+					(max_zs[ids] > min_z + tolerance)
+					& (min_xs[ids] < max(sx, ex)) & (max_xs[ids] > min(sx, ex))
+					& (min_ys[ids] < max(sy, ey)) & (max_ys[ids] > min(sy, ey))]
+
+				candidate_ids.update(ids.tolist())
+
+		segment = drawn_segments[index]
+		candidate_ids.difference_update(patch_ids_by_edge.get(frozenset([id(segment.start), id(segment.end)]), []))
+
+		for i in candidate_ids:
+			# Distance by which the plane of the patch lies in front of the segment at its ends. It changes linearly along the segment.
+			start_depth = z_at(i, sx, sy) - sz
+			end_depth = z_at(i, ex, ey) - ez
+
+			for a, b in clip(polygons[i]):
+				depth_a = start_depth + (end_depth - start_depth) * a
+				depth_b = start_depth + (end_depth - start_depth) * b
+
+				if depth_a > tolerance and depth_b > tolerance:
+					hidden_ranges.append((a, b))
+				elif depth_a > tolerance or depth_b > tolerance:
+					# The segment passes through the plane of the patch.
+					c = a + (b - a) * (depth_a - tolerance) / (depth_a - depth_b)
+
+					hidden_ranges.append((a, c) if depth_a > tolerance else (c, b))
+
+		return hidden_ranges
+
+	def get_visible_ranges(index, t_min, t_max):
+		"""
+		Return the visible parts of a segment between the positions t_min and t_max as a list of pairs of Fractions.
+		"""
+
+		sx, sy, _, ex, ey, _ = coordinates[index].tolist()
+		length = numpy.hypot(ex - sx, ey - sy)
+
+		if length <= tolerance:
+			# The segment is seen end-on and does not need to be drawn.
+			return []
+
+		# Gaps between hidden parts shorter than this are closed.
+		min_length = tolerance / length
+		segment_ranges = []
+		start = t_min
+
+		for a, b in sorted(get_hidden_ranges(index)):
+			if a - min_length > start:
+				segment_ranges.append((start, min(fractions.Fraction(a), t_max)))
+
+			start = max(start, fractions.Fraction(b))
+
+			if start >= t_max:
+				break
+
+		if start < t_max:
+			segment_ranges.append((start, t_max))
+
+		return [(a, b) for a, b in segment_ranges if b - a > min_length]
+
+	# Nearest segments first, so that the patches in front of a segment can be added to the unions in order.
+	order = numpy.argsort(-numpy.maximum(coordinates[:, 2], coordinates[:, 5]), kind = 'stable').tolist()
+
+	for i in plot.iter_progress(order):
+		if checkpoint is not None and i in checkpoint.completed:
+			yield i, checkpoint.completed[i]
+
+			continue
+
+		segment = drawn_segments[i]
+
+		if bounds is None:
+			t_min, t_max = fractions.Fraction(0), fractions.Fraction(1)
+		else:
+			clipped = geometry.clip_segment(segment, *bounds, half_open = True)
+
+			if clipped is None:
+				yield i, []
+
+				continue
+
+			t_min, t_max = clipped
+
+		segment_ranges = get_visible_ranges(i, t_min, t_max)
+
+		if checkpoint is not None:
+			checkpoint.add(i, segment_ranges)
+
+		yield i, segment_ranges
+
+
+engines.register('clip', plot.SegmentEngine(iter_visible_ranges = iter_visible_ranges_clip))
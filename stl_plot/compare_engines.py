@@ -0,0 +1,361 @@
+"""
+Differential test harness, which runs two hidden-line engines on the same meshes and reports the differences between the visible lines found by them, together with their relative runtimes.
+
+Run as `python -m stl_plot.compare_engines exact qi [input_file ...]`. Without input files, a set of generated meshes is used, including meshes whose edges line up exactly when seen from a specific camera.
+"""
+
+import argparse, math, numpy, sys, time
+import stl_plot
+from stl_plot import engines, plot, scenes, sidecar, util
+
+
+def _box_triangles(min_corner, max_corner):
+	corners = numpy.array([
+		[max_corner[j] if i >> j & 1 else min_corner[j] for j in range(3)]
+		for i in range(8)], dtype = numpy.float64)
+
+	# Two counter-clockwise triangles per side, seen from outside.
+	faces = [
+		[0, 2, 3], [0, 3, 1], [4, 5, 7], [4, 7, 6],
+		[0, 1, 5], [0, 5, 4], [2, 6, 7], [2, 7, 3],
+		[0, 4, 6], [0, 6, 2], [1, 3, 7], [1, 7, 5]]
+
+	return corners[faces]
+
+
+def _grid_triangles(point_at, u_count, v_count):
+	"""
+	Triangulate a closed surface given by a function mapping arrays of u and v coordinates to points, both of which wrap around at 1.
+	"""
+
+	u, v = numpy.meshgrid(
+		numpy.arange(u_count + 1) / u_count,
+		numpy.arange(v_count + 1) / v_count,
+		indexing = 'ij')
+
+	# Wrap around exactly so that the vertices on the seam are welded.
+	points = point_at(u % 1, v % 1)
+	a = points[:-1, :-1]
+	b = points[1:, :-1]
+	c = points[1:, 1:]
+	d = points[:-1, 1:]
+
+	return numpy.concatenate([
+		numpy.stack([a, b, c], axis = 2).reshape((-1, 3, 3)),
+		numpy.stack([a, c, d], axis = 2).reshape((-1, 3, 3))])
+
+
+def _torus_triangles(major_radius, minor_radius, center, u_count, v_count):
+	def point_at(u, v):
+		r = major_radius + minor_radius * numpy.cos(2 * math.pi * v)
+
+		return numpy.stack([
+			r * numpy.cos(2 * math.pi * u),
+			r * numpy.sin(2 * math.pi * u),
+			minor_radius * numpy.sin(2 * math.pi * v)], axis = -1) + center
+
+	return _grid_triangles(point_at, u_count, v_count)
+
+
+def _sphere_triangles(radius, center, u_count, v_count):
+	def point(i, j):
+		latitude = math.pi * (j / v_count - .5)
+		longitude = 2 * math.pi * (i % u_count) / u_count
+
+		return center + radius * numpy.array([
+			math.cos(latitude) * math.cos(longitude),
+			math.cos(latitude) * math.sin(longitude),
+			math.sin(latitude)])
+
+	triangles = []
+
+	for i in range(u_count):
+		for j in range(v_count):
+			# Use the same point for all vertices at each pole.
+			a, b, c, d = (
+				point(0 if k in (0, v_count) else i, k)
+				for i, k in [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1)])
+
+			if j > 0:
+				triangles.append([a, b, c])
+
+			if j < v_count - 1:
+				triangles.append([a, c, d])
+
+	return numpy.array(triangles)
+
+
+def _prism_triangles(profile, min_x, max_x):
+	"""
+	Return the triangles of a prism extending along the x axis, whose cross-section is the convex polygon given by a list of (y, z) coordinates.
+	"""
+
+	profile = numpy.array(profile, dtype = numpy.float64)
+	ends = [numpy.column_stack([numpy.full(len(profile), x), profile]) for x in (min_x, max_x)]
+	triangles = [[ends[0][0], ends[0][i], ends[0][i + 1]] for i in range(1, len(profile) - 1)]
+	triangles += [[ends[1][0], ends[1][i], ends[1][i + 1]] for i in range(1, len(profile) - 1)]
+
+	for i in range(len(profile)):
+		j = (i + 1) % len(profile)
+		triangles += [[ends[0][i], ends[1][i], ends[1][j]], [ends[0][i], ends[1][j], ends[0][j]]]
+
+	triangles = numpy.array(triangles)
+
+	# Orient the triangles counter-clockwise, seen from outside.
+	normals = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+	is_inverted = numpy.sum(normals * (triangles.mean(axis = 1) - triangles.mean(axis = (0, 1))), axis = 1) < 0
+	triangles[is_inverted] = triangles[is_inverted][:, ::-1]
+
+	return triangles
+
+
+def _aligned_meshes():
+	"""
+	Return a dict mapping names to pairs of triangles, as returned by _generated_meshes(), and a camera, from which edges of the mesh line up exactly in the drawing.
+	"""
+
+	# Looking along the z axis.
+	camera = [1, 0, 0, 0, 1, 0, 0, 0, 1]
+
+	return {
+		# The silhouette along the ridge of the rear prism lies exactly behind the edge along the ridge of the front prism, i.e. on the boundary between two front faces.
+		'ridges': (
+			numpy.concatenate([
+				_prism_triangles([(-1, 0), (1, 0), (0, 1)], -1, 1),
+				_prism_triangles([(-1.2, -4), (0, -3), (-1, -2)], -1.5, 1.5)]),
+			camera)}
+
+
+def _generated_meshes():
+	"""
+	Return a dict mapping names to arrays of shape (n, 3, 3) containing the triangles of a few meshes, which do not intersect themselves.
+	"""
+
+	random = numpy.random.RandomState(0)
+
+	def boxes():
+		# Boxes of random sizes placed in the cells of a grid, so that they overlap in the drawing but do not intersect.
+		for x in range(3):
+			for y in range(3):
+				size = random.uniform(.3, 1, 3)
+				min_corner = numpy.array([x, y, x - y]) * 1.2 + random.uniform(0, 1 - size)
+
+				yield _box_triangles(min_corner, min_corner + size)
+
+	return {
+		'cube': _box_triangles([0, 0, 0], [1, 1, 1]),
+		'sphere': _sphere_triangles(5, numpy.zeros(3), 24, 12),
+		'torus': _torus_triangles(4, 1.5, numpy.zeros(3), 24, 12),
+		'tori': numpy.concatenate([
+			_torus_triangles(4, 1, numpy.array([0, 0, 0]), 20, 8),
+			_torus_triangles(4, 1, numpy.array([3, 0, 3]), 20, 8)]),
+		'boxes': numpy.concatenate(list(boxes())),
+		'scene': numpy.concatenate([
+			_sphere_triangles(2, numpy.array([0, 0, 2]), 16, 8),
+			_box_triangles([-3, -3, -1], [3, 3, 0]),
+			_torus_triangles(3, .5, numpy.array([0, 0, 2]), 20, 8)])}
+
+
+# Number of points at which the lines are compared along a distance equal to the size of the drawing.
+_samples_per_size = 1000
+
+
+def _segments(polylines):
+	"""
+	Return an array of shape (n, 2, 2) containing the segments of all polylines.
+	"""
+
+	segments = [numpy.stack([i[:-1], i[1:]], axis = 1) for i in polylines]
+
+	if not segments:
+		return numpy.zeros((0, 2, 2))
+
+	return numpy.concatenate(segments)
+
+
+def _uncovered_length(segments, other_segments, step, tolerance):
+	"""
+	Return the total length of the parts of the segments which are farther than tolerance from all other segments, sampled in intervals of step.
+	"""
+
+	lengths = numpy.linalg.norm(segments[:, 1] - segments[:, 0], axis = 1)
+
+	if not len(other_segments):
+		return lengths.sum()
+
+	counts = numpy.maximum(numpy.ceil(lengths / step).astype(int), 1)
+	segment_ids = numpy.repeat(numpy.arange(len(segments)), counts)
+	offsets = numpy.arange(len(segment_ids)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+	t = (offsets + .5) / counts[segment_ids]
+	starts = segments[segment_ids, 0]
+	samples = starts + (segments[segment_ids, 1] - starts) * t[:, None]
+	weights = lengths[segment_ids] / counts[segment_ids]
+
+	a = other_segments[:, 0]
+	d = other_segments[:, 1] - a
+	squared_lengths = numpy.maximum(numpy.sum(d * d, axis = 1), 1e-300)
+	uncovered = numpy.zeros(len(samples), dtype = bool)
+
+	# Limit the size of the temporary arrays.
+	chunk_size = max(1, 1 << 22 // len(other_segments))
+
+	for i in range(0, len(samples), chunk_size):
+		p = samples[i:i + chunk_size, None, :] - a
+		u = numpy.clip(numpy.sum(p * d, axis = 2) / squared_lengths, 0, 1)
+		distances = numpy.linalg.norm(p - d * u[:, :, None], axis = 2).min(axis = 1)
+		uncovered[i:i + chunk_size] = distances > tolerance
+
+	return weights[uncovered].sum()
+
+
+def compare_lines(polylines_by_style_a, polylines_by_style_b, step, tolerance):
+	"""
+	Compare the results of two engines, as returned by engines.Engine.find_lines().
+
+	Returns a dict mapping each style to a tuple of the total lengths of the lines found by each engine and of the lengths of the parts of the lines of each engine not found by the other engine. The lines are compared at points spaced step apart.
+	"""
+
+	segments_a = { k: _segments(v) for k, v in polylines_by_style_a.items() }
+	segments_b = { k: _segments(v) for k, v in polylines_by_style_b.items() }
+	empty = numpy.zeros((0, 2, 2))
+	result = { }
+
+	for style in sorted(set(segments_a) | set(segments_b)):
+		a = segments_a.get(style, empty)
+		b = segments_b.get(style, empty)
+
+		result[style] = (
+			numpy.linalg.norm(a[:, 1] - a[:, 0], axis = 1).sum(),
+			numpy.linalg.norm(b[:, 1] - b[:, 0], axis = 1).sum(),
+			_uncovered_length(a, b, step, tolerance),
+			_uncovered_length(b, a, step, tolerance))
+
+	return result
+
+
+def _run_engine(engine, polyhedron, projection, min_angle):
+	start = time.perf_counter()
+	polylines_by_style = engine.find_lines(polyhedron, projection, min_angle)
+
+	return polylines_by_style, time.perf_counter() - start
+
+
+def main(engine_name_a, engine_name_b, input_files, cameras, min_angle, tolerance):
+	engine_a = engines.get(engine_name_a)
+	engine_b = engines.get(engine_name_b)
+
+	if input_files:
+		meshes = [(i, scenes.load_mesh_arrays(i, False), cameras) for i in input_files]
+	else:
+		meshes = [
+			(k, sidecar.MeshArrays.from_triangles(v), cameras)
+			for k, v in _generated_meshes().items()]
+
+		meshes += [
+			(k, sidecar.MeshArrays.from_triangles(v), [camera])
+			for k, (v, camera) in _aligned_meshes().items()]
+
+	different_count = 0
+	total_time_a = 0
+	total_time_b = 0
+
+	drawing_count = 0
+
+	for name, mesh_arrays, mesh_cameras in meshes:
+		polyhedron = mesh_arrays.to_polyhedron()
+
+		for camera in mesh_cameras:
+			drawing_count += 1
+			projection = plot.get_projection(camera)
+			polylines_a, time_a = _run_engine(engine_a, polyhedron, projection, min_angle)
+			polylines_b, time_b = _run_engine(engine_b, polyhedron, projection, min_angle)
+			total_time_a += time_a
+			total_time_b += time_b
+
+			# The tolerance and the spacing of the compared points are relative to the size of the drawing.
+			projected = plot.project_vertices(mesh_arrays.vertices, projection)[:, :2]
+			size = numpy.max(projected.max(axis = 0) - projected.min(axis = 0))
+			differences = compare_lines(polylines_a, polylines_b, size / _samples_per_size, tolerance * size)
+			is_different = any(i[2] or i[3] for i in differences.values())
+			different_count += is_different
+
+			print(
+				'{} from {}: {}, {}: {:.3f} s, {}: {:.3f} s ({:.2f}x)'.format(
+					name,
+					','.join('{:g}'.format(i) for i in camera),
+					'different' if is_different else 'same',
+					engine_name_a,
+					time_a,
+					engine_name_b,
+					time_b,
+					time_a / max(time_b, 1e-9)))
+
+			for style, (length_a, length_b, only_a, only_b) in differences.items():
+				print(
+					'    {}: length {:.6g} vs. {:.6g}, only in {}: {:.6g}, only in {}: {:.6g}'.format(
+						style,
+						length_a,
+						length_b,
+						engine_name_a,
+						only_a,
+						engine_name_b,
+						only_b))
+
+	print(
+		'{} of {} drawings different, {}: {:.3f} s, {}: {:.3f} s ({:.2f}x)'.format(
+			different_count,
+			drawing_count,
+			engine_name_a,
+			total_time_a,
+			engine_name_b,
+			total_time_b,
+			total_time_a / max(total_time_b, 1e-9)))
+
+	return different_count == 0
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		prog = 'python -m stl_plot.compare_engines',
+		description = 'Run two hidden-line engines on the same meshes and report the differences between the visible lines found by them.')
+
+	parser.add_argument('engine_name_a', choices = engines.names(), metavar = 'engine_a')
+	parser.add_argument('engine_name_b', choices = engines.names(), metavar = 'engine_b')
+	parser.add_argument(
+		'input_files',
+		nargs = '*',
+		metavar = 'input_file',
+		help = 'STL files to plot. Defaults to a set of generated meshes.')
+	parser.add_argument(
+		'--camera',
+		dest = 'cameras',
+		type = stl_plot.parse_camera,
+		action = 'append',
+		help = 'Camera from which to view each mesh, as accepted by stl-plot. Can be given multiple times. Defaults to a few oblique views.')
+	parser.add_argument(
+		'--min-angle',
+		type = float,
+		default = math.degrees(6.3 / 32),
+		help = 'Minimum angle in degrees between the normals of two visible faces for the edge between them to be drawn. Defaults to about 11.3°.')
+	parser.add_argument(
+		'--tolerance',
+		type = float,
+		default = 1e-6,
+		help = 'Distance relative to the size of the drawing below which lines are considered the same. Defaults to 1e-6.')
+
+	args = parser.parse_args()
+
+	if args.cameras is None:
+		args.cameras = [[14.4, 21.6], [60, 10], [200, -20]]
+
+	args.min_angle = math.radians(args.min_angle)
+
+	return args
+
+
+if __name__ == '__main__':
+	try:
+		sys.exit(0 if main(**vars(parse_args())) else 1)
+	except util.UserError as e:
+		print('Error: {}'.format(e), file = sys.stderr)
+		sys.exit(1)
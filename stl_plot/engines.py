@@ -0,0 +1,73 @@
+"""
+Registry of hidden-line engines, which turn a mesh seen through a camera into the styled polylines of the drawing.
+"""
+
+import abc, importlib
+from stl_plot import util
+
+
+class Engine(metaclass=abc.ABCMeta):
+	"""
+	A hidden-line algorithm.
+	"""
+
+	@abc.abstractmethod
+	def find_lines(self, polyhedron, projection, min_angle):
+		"""
+		Return the visible lines of a polyhedron as a dict mapping styles to lists of arrays of shape (n, 2), each containing the points of a polyline.
+
+		The polyhedron is transformed into the drawing's coordinate system using the 4x4 matrix projection. Edges between visible faces are only drawn if the angle between the normals of the faces is larger than min_angle.
+		"""
+
+	def iter_lines(self, polyhedron, projection, min_angle):
+		"""
+		Like find_lines(), but yield pairs of a style and a polyline. Engines can override this to yield the polylines while further lines are still being found, so that they do not need to be kept in memory.
+		"""
+
+		for style, polylines in self.find_lines(polyhedron, projection, min_angle).items():
+			for i in polylines:
+				yield style, i
+
+	def find_tile_lines(self, drawn_segments, border_segments, patches, bounds):
+		"""
+		Like find_lines(), but for the part of a mesh inside a single tile, given as the Fraction-based objects created by plot.write_tiled().
+
+		Only the parts of the drawn segments inside bounds, given as (min_x, min_y, max_x, max_y), are considered, excluding segments lying on the maximum x or y edge, which belong to the adjacent tile. If bounds is None, the drawn segments are considered in full, as when processing a shard of the segments, see shards.py.
+		"""
+
+		raise util.UserError('The engine does not support rendering in tiles.')
+
+	def iter_visible_ranges(self, drawn_segments, border_segments, patches):
+		"""
+		Find the visible parts of the drawn segments, given as the Fraction-based objects created by plot.SegmentArrays.to_objects(). Yields a pair of the index of each drawn segment and a list of its visible intervals, like plot.iter_visible_ranges(), so that the results can be used while the remaining segments are still being processed.
+		"""
+
+		raise util.UserError('The engine does not support progressive rendering.')
+
+
+_engines = { }
+
+# Modules registering the built-in engines. A module is only imported when one of its engines is requested, so that the names of the engines can be listed without loading numpy and the hidden-line code.
+_builtin_engine_modules = dict(exact = 'stl_plot.plot', qi = 'stl_plot.plot', clip = 'stl_plot.clipping')
+
+
+def register(name, engine: Engine):
+	assert name not in _engines
+
+	_engines[name] = engine
+
+
+def get(name) -> Engine:
+	if name not in _engines and name in _builtin_engine_modules:
+		importlib.import_module(_builtin_engine_modules[name])
+
+	engine = _engines.get(name)
+
+	if engine is None:
+		raise util.UserError('Unknown engine: {}', name)
+
+	return engine
+
+
+def names():
+	return sorted(set(_engines) | set(_builtin_engine_modules))
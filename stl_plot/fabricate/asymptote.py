@@ -1,4 +1,4 @@
-import os, tempfile
+import numpy, os, tempfile
 from stl_plot import util
 import itertools, io, contextlib
 from . import paths
@@ -17,37 +17,80 @@ class CompileException(Exception):
 	pass
 
 
-def _asymptote(in_path, out_path, asymptote_dir, cwd):
+# Output formats supported by compile() and compile_async().
+formats = ['pdf', 'svg']
+
+
+def _asymptote_args(in_path, out_path, format):
+	return _asymptote_command, '-f', format, '-o', out_path, in_path
+
+
+def _asymptote(in_path, out_path, format, asymptote_dir, cwd):
 	try:
-		util.command(_asymptote_command, '-f', 'pdf', '-o', out_path, in_path,
+		util.command(*_asymptote_args(in_path, out_path, format),
 			set_env = dict(ASYMPTOTE_DIR = asymptote_dir), cwd = cwd)
 	except util.CommandError as e:
 		raise Exception('Compiling {} failed: {}'.format(in_path, e)) from None
 
 
-def compile(in_path: str, out_path: str = None, format = 'pdf'):
-	assert format == 'pdf'
+async def _asymptote_async(in_path, out_path, format, asymptote_dir, cwd, pool, timeout):
+	try:
+		await pool.command(*_asymptote_args(in_path, out_path, format),
+			set_env = dict(ASYMPTOTE_DIR = asymptote_dir), cwd = cwd,
+			timeout = timeout)
+	except util.CommandError as e:
+		raise Exception('Compiling {} failed: {}'.format(in_path, e)) from None
+
+
+def _get_out_path(in_path, out_path, format):
+	assert format in formats
 	
 	if out_path is None:
 		base_name, _ = os.path.splitext(in_path)
 		
 		out_path = base_name + '.' + format
 	
-	_, out_suffix = os.path.splitext(out_path)
+	return out_path
+
+
+def _move_output(in_path, temp_dir, out_path, format):
+	temp_out_path = os.path.join(temp_dir, 'out.' + format)
+	
+	if not os.path.exists(temp_out_path):
+		raise util.UserError('Asymptote did not generate a {} file.', format.upper())
+	
+	# Write output files.
+	util.rename_atomic(temp_out_path, out_path)
+
+
+def compile(in_path: str, out_path: str = None, format = 'pdf'):
+	out_path = _get_out_path(in_path, out_path, format)
 	
 	# Asymptote creates A LOT of temp files (presumably when invoking LaTeX) and leaves some of them behind. Thus we run asymptote in a temporary directory.
 	with tempfile.TemporaryDirectory() as temp_dir:
 		absolute_in_path = os.path.abspath(in_path)
-		temp_out_path = os.path.join(temp_dir, 'out.pdf')
 		
-		_asymptote(absolute_in_path, 'out', os.path.dirname(absolute_in_path),
-			temp_dir)
+		_asymptote(absolute_in_path, 'out', format,
+			os.path.dirname(absolute_in_path), temp_dir)
+		
+		_move_output(in_path, temp_dir, out_path, format)
+
+
+async def compile_async(in_path: str, out_path: str = None, format = 'pdf', *,
+		pool: util.CommandPool, timeout = None):
+	"""
+	Asynchronous version of compile(), which runs Asymptote through the specified pool.
+	"""
+	
+	out_path = _get_out_path(in_path, out_path, format)
+	
+	with tempfile.TemporaryDirectory() as temp_dir:
+		absolute_in_path = os.path.abspath(in_path)
 		
-		if not os.path.exists(temp_out_path):
-			raise util.UserError('Asymptote did not generate a PDF file.', in_path)
+		await _asymptote_async(absolute_in_path, 'out', format,
+			os.path.dirname(absolute_in_path), temp_dir, pool, timeout)
 		
-		# Write output files.
-		util.rename_atomic(temp_out_path, out_path)
+		_move_output(in_path, temp_dir, out_path, format)
 
 
 class File:
@@ -72,20 +115,51 @@ class AsymptoteFile(File):
 		
 		self._picture_stack_id_iter = itertools.count()
 	
-	def _serialize_path(self, path, closed):
-		def iter_pairs():
-			for x, y in path.vertices:
-				yield self._serialize_value((x, y), False)
+	def _serialize_vertices(self, m: numpy.ndarray):
+		"""
+		Serialize the vertices of one or more paths, given in the representation used by Path.m, as a list of strings.
+		
+		This produces the same result as calling _serialize_value() for each vertex, but without converting each vertex separately.
+		"""
+		
+		def add(*parts):
+			result, *rest = parts
 			
-			if closed:
-				yield 'cycle'
+			for i in rest:
+				result = numpy.char.add(result, i)
+			
+			return result
+		
+		x, y = m[:2].astype(numpy.float64).astype(str)
 		
+		return add('(', x, 'mm, ', y, 'mm)').tolist()
+	
+	def _serialize_pairs(self, pairs):
 		variable = self.get_variable_name()
 		
 		self.write('path {};', variable)
 		
-		for i in _group(iter_pairs(), 500):
-			self.write('{} = {} -- {};', variable, variable, ' -- '.join(i))
+		for i in range(0, len(pairs), 500):
+			self.write('{} = {} -- {};', variable, variable, ' -- '.join(pairs[i:i + 500]))
+		
+		return variable
+	
+	def _serialize_path(self, path, closed):
+		pairs = self._serialize_vertices(path.m)
+		
+		if closed:
+			pairs.append('cycle')
+		
+		return self._serialize_pairs(pairs)
+	
+	def _serialize_path_array(self, path_array: paths.PathArray):
+		pairs = self._serialize_vertices(path_array.m)
+		variable = self.get_variable_name()
+		
+		self.write('path[] {};', variable)
+		
+		for start, end in zip(path_array.offsets[:-1].tolist(), path_array.offsets[1:].tolist()):
+			self.write('{}.push({});', variable, self._serialize_pairs(pairs[start:end]))
 		
 		return variable
 	
@@ -112,6 +186,8 @@ class AsymptoteFile(File):
 	def _serialize_value(self, value, close_paths):
 		if isinstance(value, paths.Path):
 			return self._serialize_path(value, closed = close_paths)
+		elif isinstance(value, paths.PathArray):
+			return self._serialize_path_array(value)
 		elif isinstance(value, paths.Polygon):
 			return self._serialize_array('path', value.paths, 1, True)
 		elif isinstance(value, tuple):
@@ -149,6 +225,7 @@ class AsymptoteFile(File):
 		The specified statement is formatted with the specified arguments using str.format(). The following types of arguments are handled specially:
 		
 		- paths.Path (forming an open path)
+		- paths.PathArray (forming an array of open paths)
 		- paths.Polygon (forming an array of closed paths)
 		
 		Other types are serialized using the default behavior of str.format().
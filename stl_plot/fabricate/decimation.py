@@ -0,0 +1,199 @@
+import heapq, numpy
+from . import polyhedra
+
+
+def _normal(a, b, c):
+	# Calculated by hand because numpy.cross() has a large overhead for single vectors.
+	ux, uy, uz = b - a
+	vx, vy, vz = c - a
+	n = numpy.array([uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx])
+	length = numpy.linalg.norm(n)
+
+	if length == 0:
+		return None
+
+	return n / length
+
+
+def _locked_edges(faces, normals, max_angle, view_direction):
+	"""
+	Return the set of edges, as sorted pairs of vertex ids, which are either creases sharper than max_angle or lie on the boundary between faces facing towards and away from view_direction.
+	"""
+
+	edges, left_faces, right_faces = polyhedra.edge_face_arrays(faces)
+
+	cos_angles = numpy.sum(normals[left_faces] * normals[right_faces], axis = 1)
+	facing = numpy.dot(normals, view_direction) > 0
+	locked = (cos_angles < numpy.cos(max_angle)) | (facing[left_faces] != facing[right_faces])
+
+	return set(map(tuple, edges[locked].tolist()))
+
+
+def decimate(polyhedron: polyhedra.Polyhedron, max_error, max_angle, view_direction):
+	"""
+	Simplify a triangulated polyhedron by repeatedly collapsing the edge with the smallest quadric error.
+
+	An edge is collapsed by moving one of its vertices onto the other. The quadric error of a vertex is the sum of the squared distances to the planes of all original faces merged into it, so no vertex ends up farther than max_error from any of those planes.
+
+	Vertices on creases sharper than max_angle and on silhouette edges when looking along view_direction are never moved, which keeps those edges intact. Collapses which would fold a face over, turn a face towards or away from view_direction or create an angle of more than max_angle between the normals of two faces across an unlocked edge are rejected, so that no new visible edges are introduced.
+
+	Returns a new Polyhedron instance.
+	"""
+
+	vertices = polyhedron.vertex_coordinates
+	faces = numpy.array(polyhedron.face_vertex_ids, dtype = numpy.int64)
+
+	assert faces.shape[1:] == (3,)
+
+	min_cos = numpy.cos(max_angle)
+	max_cost = max_error ** 2
+
+	normals = polyhedra.face_normal_array(vertices, faces)
+	planes = numpy.column_stack([normals, -numpy.sum(normals * vertices[faces[:, 0]], axis = 1)])
+	face_quadrics = planes[:, :, None] * planes[:, None, :]
+	quadrics = numpy.zeros((len(vertices), 4, 4))
+
+	for i in range(3):
+		numpy.add.at(quadrics, faces[:, i], face_quadrics)
+
+	locked_edges = _locked_edges(faces, normals, max_angle, view_direction)
+
+	locked_vertices = set(i for edge in locked_edges for i in edge)
+
+	# Current state of the mesh. Removed faces are set to None.
+	faces = [list(i) for i in faces]
+	faces_by_vertex = [set() for _ in vertices]
+
+	for face_id, face in enumerate(faces):
+		for i in face:
+			faces_by_vertex[i].add(face_id)
+
+	# Incremented each time a vertex's neighborhood changes to invalidate entries in the queue.
+	versions = [0] * len(vertices)
+	queue = []
+
+	def neighbors(vertex_id):
+		return set(j for i in faces_by_vertex[vertex_id] for j in faces[i]) - { vertex_id }
+
+	def push(u, v):
+		if u not in locked_vertices:
+			p = numpy.append(vertices[v], 1)
+			cost = numpy.dot(p, numpy.dot(quadrics[u] + quadrics[v], p))
+
+			if cost <= max_cost:
+				heapq.heappush(queue, (cost, versions[u], versions[v], u, v))
+
+	def face_normal(face):
+		return _normal(*(vertices[i] for i in face))
+
+	def can_collapse(u, v):
+		shared_faces = faces_by_vertex[u] & faces_by_vertex[v]
+
+		# Only allow collapses which keep the mesh a 2-manifold.
+		if len(shared_faces) != 2:
+			return False
+
+		link = set(j for i in shared_faces for j in faces[i]) - { u, v }
+
+		if neighbors(u) & neighbors(v) != link:
+			return False
+
+		def new_face(face_id):
+			return [v if i == u else i for i in faces[face_id]]
+
+		def new_vertex_faces(vertex_id):
+			if vertex_id == v:
+				return (faces_by_vertex[u] | faces_by_vertex[v]) - shared_faces
+			else:
+				return faces_by_vertex[vertex_id] - shared_faces
+
+		new_normals = { }
+
+		for face_id in faces_by_vertex[u] - shared_faces:
+			normal = face_normal(new_face(face_id))
+			old_normal = face_normal(faces[face_id])
+
+			if normal is None:
+				return False
+
+			# Reject collapses which turn a face over.
+			if old_normal is not None and numpy.dot(normal, old_normal) <= 0:
+				return False
+
+			# Reject collapses which turn a face towards or away from the viewer, which would create a new silhouette.
+			if old_normal is not None and (numpy.dot(normal, view_direction) > 0) != (numpy.dot(old_normal, view_direction) > 0):
+				return False
+
+			new_normals[face_id] = normal
+
+		for face_id, normal in new_normals.items():
+			face = new_face(face_id)
+
+			for a, b in zip(face, face[1:] + face[:1]):
+				if tuple(sorted((a, b))) in locked_edges:
+					continue
+
+				other_faces = (new_vertex_faces(a) & new_vertex_faces(b)) - { face_id }
+
+				if len(other_faces) != 1:
+					return False
+
+				other_face_id, = other_faces
+				other_normal = new_normals.get(other_face_id)
+
+				if other_normal is None:
+					other_normal = face_normal(faces[other_face_id])
+
+				if other_normal is None or numpy.dot(normal, other_normal) < min_cos:
+					return False
+
+		return True
+
+	def collapse(u, v):
+		shared_faces = faces_by_vertex[u] & faces_by_vertex[v]
+
+		for face_id in shared_faces:
+			for i in faces[face_id]:
+				faces_by_vertex[i].discard(face_id)
+
+			faces[face_id] = None
+
+		for face_id in faces_by_vertex[u]:
+			faces[face_id] = [v if i == u else i for i in faces[face_id]]
+
+		faces_by_vertex[v] |= faces_by_vertex[u]
+		faces_by_vertex[u] = set()
+		quadrics[v] += quadrics[u]
+
+		versions[v] += 1
+
+		for i in neighbors(v):
+			push(i, v)
+			push(v, i)
+
+	for face in faces:
+		for a, b in zip(face, face[1:] + face[:1]):
+			push(a, b)
+
+	while queue:
+		_, version_u, version_v, u, v = heapq.heappop(queue)
+
+		if version_u == versions[u] and version_v == versions[v] \
+				and faces_by_vertex[u] and can_collapse(u, v):
+			collapse(u, v)
+
+	# Remove unused vertices.
+	new_ids = { }
+	new_vertices = []
+	new_faces = []
+
+	for face in faces:
+		if face is not None:
+			for i in face:
+				if i not in new_ids:
+					new_ids[i] = len(new_vertices)
+					new_vertices.append(vertices[i])
+
+			new_faces.append([new_ids[i] for i in face])
+
+	return polyhedra.Polyhedron(new_vertices, new_faces)
@@ -1,4 +1,4 @@
-import fractions, typing
+import fractions, numpy, typing
 
 from stl_plot.util import Hashable
 
@@ -24,6 +24,136 @@ class Segment(Hashable):
 		return self.start, self.end
 
 
+class PointArray:
+	"""
+	Compact representation of many points, storing each coordinate in a separate numpy array.
+	
+	The z coordinate is optional and represents the depth of a projected point.
+	"""
+	
+	def __init__(self, x, y, z = None):
+		self.x = numpy.asarray(x, dtype = numpy.float64)
+		self.y = numpy.asarray(y, dtype = numpy.float64)
+		self.z = None if z is None else numpy.asarray(z, dtype = numpy.float64)
+	
+	def __len__(self):
+		return len(self.x)
+	
+	def __getitem__(self, index):
+		"""
+		Select a subset of the points using a slice, an index array or a boolean mask.
+		"""
+		
+		return type(self)(
+			self.x[index],
+			self.y[index],
+			None if self.z is None else self.z[index])
+	
+	def __repr__(self):
+		return 'PointArray({})'.format(len(self))
+	
+	@classmethod
+	def from_array(cls, coordinates):
+		"""
+		Create an instance from an array of shape (n, 2) or (n, 3).
+		"""
+		
+		return cls(*numpy.asarray(coordinates).T)
+	
+	@property
+	def nbytes(self):
+		return sum(i.nbytes for i in self._columns)
+	
+	@property
+	def _columns(self):
+		if self.z is None:
+			return [self.x, self.y]
+		else:
+			return [self.x, self.y, self.z]
+	
+	def iter_coordinates(self):
+		"""
+		Iterate over the coordinates of all points as tuples of Python floats.
+		"""
+		
+		return zip(*(i.tolist() for i in self._columns))
+	
+	def bounding_box(self):
+		"""
+		Return (min_x, min_y, max_x, max_y) of all points.
+		"""
+		
+		return self.x.min(), self.y.min(), self.x.max(), self.y.max()
+
+
+def bounding_boxes(*point_arrays: PointArray):
+	"""
+	Return the element-wise bounding boxes of multiple point arrays of the same length as an array of shape (n, 4) with columns min_x, min_y, max_x, max_y.
+	"""
+	
+	xs = numpy.stack([i.x for i in point_arrays])
+	ys = numpy.stack([i.y for i in point_arrays])
+	
+	return numpy.column_stack([xs.min(axis = 0), ys.min(axis = 0), xs.max(axis = 0), ys.max(axis = 0)])
+
+
+class SegmentArray:
+	"""
+	Compact representation of many segments as two point arrays and optional columns of flags.
+	"""
+	
+	def __init__(self, starts : PointArray, ends : PointArray, is_boundary = None, is_edge = None):
+		assert len(starts) == len(ends)
+		
+		self.starts = starts
+		self.ends = ends
+		self.is_boundary = None if is_boundary is None else numpy.asarray(is_boundary, dtype = bool)
+		self.is_edge = None if is_edge is None else numpy.asarray(is_edge, dtype = bool)
+	
+	def __len__(self):
+		return len(self.starts)
+	
+	def __getitem__(self, index):
+		"""
+		Select a subset of the segments using a slice, an index array or a boolean mask.
+		"""
+		
+		return type(self)(
+			self.starts[index],
+			self.ends[index],
+			None if self.is_boundary is None else self.is_boundary[index],
+			None if self.is_edge is None else self.is_edge[index])
+	
+	def __repr__(self):
+		return 'SegmentArray({})'.format(len(self))
+	
+	@property
+	def nbytes(self):
+		flags = [i for i in [self.is_boundary, self.is_edge] if i is not None]
+		
+		return self.starts.nbytes + self.ends.nbytes + sum(i.nbytes for i in flags)
+	
+	def interpolate(self, t):
+		"""
+		Return the points at parameter t on each segment, where t is either a scalar or an array with one value per segment.
+		"""
+		
+		def interpolate(a, b):
+			return a + (b - a) * t
+		
+		return PointArray(
+			interpolate(self.starts.x, self.ends.x),
+			interpolate(self.starts.y, self.ends.y),
+			None if self.starts.z is None else interpolate(self.starts.z, self.ends.z))
+	
+	def bounding_boxes(self):
+		"""
+		Return the bounding box of each segment as an array of shape (n, 4).
+		"""
+		
+		return bounding_boxes(self.starts, self.ends)
+
+
 class Intersection:
 	def __init__(self, segment_1 : Segment, segment_2 : Segment, point : Point, t1 : fractions.Fraction, t2: fractions.Fraction):
 		self.segment_1 = segment_1
@@ -71,6 +201,38 @@ def iter_intersections(lines: typing.List[Segment], line: Segment):
 			yield intersection
 
 
+def clip_segment(segment: Segment, min_x, min_y, max_x, max_y, *, half_open = False):
+	"""
+	Return the parameters (t1, t2) delimiting the part of the segment which lies inside the specified rectangle.
+	
+	Returns None if the segment does not cross the inside of the rectangle.
+	
+	If half_open is true, a segment lying on the maximum x or y edge of the rectangle is not considered to lie inside of it, so that a segment lying on the edge shared by two adjacent rectangles is only inside of one of them.
+	"""
+	
+	sx = segment.start.x
+	sy = segment.start.y
+	dx = segment.end.x - sx
+	dy = segment.end.y - sy
+	
+	t1 = fractions.Fraction(0)
+	t2 = fractions.Fraction(1)
+	
+	for p, q, is_max_edge in (-dx, sx - min_x, False), (dx, max_x - sx, True), (-dy, sy - min_y, False), (dy, max_y - sy, True):
+		if p == 0:
+			if q < 0 or (half_open and is_max_edge and q == 0):
+				return None
+		elif p < 0:
+			t1 = max(t1, q / p)
+		else:
+			t2 = min(t2, q / p)
+	
+	if t1 < t2:
+		return t1, t2
+	else:
+		return None
+
+
 class Simplex:
 	def __init__(self, p1 : Point, p2 : Point, p3 : Point):
 		self.p1 = p1
@@ -123,3 +285,73 @@ def iter_simplex_intersections(simplexes: typing.List[Simplex], point: Point):
 
 		if intersection is not None:
 			yield intersection
+
+
+class Polygon:
+	def __init__(self, boundary : typing.List[Segment]):
+		"""
+		:param boundary: Segments forming one or more closed loops. Holes are handled using the even-odd rule.
+		"""
+		self.boundary = boundary
+		
+		xs = [j.x for i in boundary for j in (i.start, i.end)]
+		ys = [j.y for i in boundary for j in (i.start, i.end)]
+		
+		self.min_x = min(xs)
+		self.max_x = max(xs)
+		self.min_y = min(ys)
+		self.max_y = max(ys)
+
+	def __repr__(self):
+		return 'Polygon({0.boundary})'.format(self)
+
+
+class PolygonIntersection:
+	def __init__(self, polygon: Polygon, point: Point):
+		self.polygon = polygon
+		self.point = point
+	
+	@classmethod
+	def for_polygon_and_point(cls, polygon: Polygon, point: Point):
+		"""
+		Returns None unless the point lies strictly inside the polygon. Points on the boundary are considered to lie outside.
+		"""
+		x = point.x
+		y = point.y
+		
+		if not (polygon.min_x < x < polygon.max_x and polygon.min_y < y < polygon.max_y):
+			return None
+		
+		inside = False
+		
+		for i in polygon.boundary:
+			x1 = i.start.x
+			y1 = i.start.y
+			x2 = i.end.x
+			y2 = i.end.y
+			
+			if (y1 > y) != (y2 > y):
+				# x coordinate of the boundary at height y.
+				crossing_x = x1 + (x2 - x1) * (y - y1) / (y2 - y1)
+				
+				if crossing_x == x:
+					return None
+				elif crossing_x > x:
+					inside = not inside
+			elif y1 == y == y2 and min(x1, x2) <= x <= max(x1, x2):
+				return None
+			elif (x1, y1) == (x, y) or (x2, y2) == (x, y):
+				return None
+		
+		if inside:
+			return cls(polygon, point)
+		else:
+			return None
+
+
+def iter_polygon_intersections(polygons: typing.List[Polygon], point: Point):
+	for i in polygons:
+		intersection = PolygonIntersection.for_polygon_and_point(i, point)
+
+		if intersection is not None:
+			yield intersection
@@ -0,0 +1,336 @@
+"""
+Loaders for the supported mesh file formats, which return the vertices and the triangles of a mesh as arrays.
+
+Except for STL, all formats store indexed meshes, whose vertices are used directly without welding them. Polygonal faces are split into triangles around their first vertex, which is only correct for convex faces.
+
+The binary JSON format (.bjson) is a compact variant of the JSON format read by Polyhedron.load_from_json(). It starts with a line containing a JSON object, which maps the names vertices and faces to objects with the keys dtype, shape and offset. dtype is a NumPy type string like '<f8', shape is [n, 3] and offset is the position of the array's data in the file. The arrays are memory-mapped.
+"""
+
+import json, numpy, os
+from stl_plot import util
+from . import polyhedra
+
+
+# Types of the properties of PLY files.
+_ply_types = dict(
+	char = 'i1', uchar = 'u1', short = 'i2', ushort = 'u2', int = 'i4', uint = 'u4', float = 'f4', double = 'f8',
+	int8 = 'i1', uint8 = 'u1', int16 = 'i2', uint16 = 'u2', int32 = 'i4', uint32 = 'u4', float32 = 'f4', float64 = 'f8')
+
+_ply_byte_orders = dict(binary_little_endian = '<', binary_big_endian = '>')
+
+# Limits the size of the header of binary JSON files.
+_max_binary_json_header_size = 1 << 16
+
+
+def _triangulate(vertex_ids, counts):
+	"""
+	Split polygons into triangles, given as the concatenated vertex ids of all polygons and the number of vertices of each polygon.
+
+	Returns an array of shape (n, 3).
+	"""
+
+	counts = numpy.asarray(counts, dtype = numpy.int64)
+
+	if numpy.any(counts < 3):
+		raise util.UserError('Mesh contains a face with less than 3 vertices.')
+
+	starts = numpy.cumsum(counts) - counts
+	triangle_counts = counts - 2
+	firsts = numpy.repeat(starts, triangle_counts)
+
+	# Index of each triangle within its polygon.
+	offsets = numpy.arange(len(firsts)) - numpy.repeat(numpy.cumsum(triangle_counts) - triangle_counts, triangle_counts)
+
+	return numpy.column_stack([
+		vertex_ids[firsts],
+		vertex_ids[firsts + offsets + 1],
+		vertex_ids[firsts + offsets + 2]])
+
+
+def load_stl(path):
+	return polyhedra.weld_triangles(polyhedra.load_stl_triangles(path))
+
+
+def load_json(path):
+	"""
+	Load a file in the format read by Polyhedron.load_from_json().
+	"""
+
+	with util.reading_text_file(path) as file:
+		data = json.load(file)
+
+	faces = data['faces']
+
+	return (
+		numpy.array(data['vertices'], dtype = numpy.float64),
+		_triangulate(
+			numpy.array([i for face in faces for i in face], dtype = numpy.int64),
+			[len(i) for i in faces]))
+
+
+def load_obj(path):
+	"""
+	Load the vertices and faces of a Wavefront OBJ file. Texture coordinates, normals, groups and materials are ignored.
+	"""
+
+	vertex_rows = []
+	vertex_ids = []
+	counts = []
+
+	for line in util.read_file(path).splitlines():
+		if line.startswith(b'v '):
+			vertex_rows.append(line.split()[1:4])
+		elif line.startswith(b'f '):
+			ids = [int(i.split(b'/', 1)[0]) for i in line.split()[1:]]
+
+			# Negative ids count backwards from the last vertex defined so far.
+			vertex_ids.extend(i - 1 if i > 0 else len(vertex_rows) + i for i in ids)
+			counts.append(len(ids))
+
+	try:
+		vertices = numpy.array(vertex_rows, dtype = bytes).astype(numpy.float64).reshape((-1, 3))
+	except ValueError:
+		raise util.UserError('Invalid vertex in {}.', path) from None
+
+	return vertices, _triangulate(numpy.array(vertex_ids, dtype = numpy.int64), counts)
+
+
+def _read_ply_header(file):
+	"""
+	Return the format of a PLY file and a list of tuples of the name, count and properties of each element. A property is a tuple of its name, its type and, for list properties, the type of the list length, otherwise None.
+	"""
+
+	if file.readline().strip() != b'ply':
+		raise util.UserError('Not a PLY file.')
+
+	format = None
+	elements = []
+
+	while True:
+		line = file.readline()
+
+		if not line:
+			raise util.UserError('PLY header is not terminated.')
+
+		words = line.decode('ascii').split()
+
+		if not words or words[0] in ('comment', 'obj_info'):
+			pass
+		elif words[0] == 'end_header':
+			return format, elements
+		elif words[0] == 'format':
+			format = words[1]
+		elif words[0] == 'element':
+			elements.append((words[1], int(words[2]), []))
+		elif words[0] == 'property' and elements and words[1] == 'list':
+			elements[-1][2].append((words[4], _ply_types[words[3]], _ply_types[words[2]]))
+		elif words[0] == 'property' and elements:
+			elements[-1][2].append((words[2], _ply_types[words[1]], None))
+		else:
+			raise util.UserError('Invalid line in PLY header: {}', line.decode('ascii').strip())
+
+
+def _read_ply_element(data, offset, count, properties, byte_order):
+	"""
+	Read the records of an element starting at offset.
+
+	Returns a dict mapping the names of the properties to arrays of their values and the offset after the last record. List properties are returned as a tuple of the concatenated values of all lists and the length of each list.
+	"""
+
+	def dtype(list_length):
+		return numpy.dtype([
+			(name, byte_order + type) if length_type is None
+			else (name, [('length', byte_order + length_type), ('values', byte_order + type, (list_length,))])
+			for name, type, length_type in properties])
+
+	def result(records):
+		return {
+			name: records[name] if length_type is None
+			else (numpy.reshape(records[name]['values'], -1), records[name]['length'])
+			for name, _, length_type in properties}
+
+	list_names = [name for name, _, length_type in properties if length_type is not None]
+
+	if not list_names:
+		records = numpy.frombuffer(data, dtype(0), count, offset)
+
+		return result(records), offset + records.nbytes
+
+	if len(list_names) == 1 and count:
+		# Usually, all lists have the same length, e.g. in a mesh containing only triangles. Try reading the records as if they had a fixed size.
+		first_dtype = dtype(0)
+		first_record = numpy.frombuffer(data, first_dtype, 1, offset)
+		list_length = int(first_record[list_names[0]]['length'][0])
+		fixed_dtype = dtype(list_length)
+
+		if offset + count * fixed_dtype.itemsize <= len(data):
+			records = numpy.frombuffer(data, fixed_dtype, count, offset)
+
+			if numpy.all(records[list_names[0]]['length'] == list_length):
+				return result(records), offset + records.nbytes
+
+	# Read the records one by one.
+	values = { name: [] for name, _, _ in properties }
+
+	for _ in range(count):
+		for name, type, length_type in properties:
+			if length_type is None:
+				value = numpy.frombuffer(data, byte_order + type, 1, offset)
+			else:
+				length = int(numpy.frombuffer(data, byte_order + length_type, 1, offset)[0])
+				offset += numpy.dtype(length_type).itemsize
+				value = numpy.frombuffer(data, byte_order + type, length, offset)
+
+			values[name].append(value)
+			offset += value.nbytes
+
+	return {
+		name: numpy.concatenate(values[name]) if length_type is None
+		else (numpy.concatenate(values[name]), numpy.array([len(i) for i in values[name]]))
+		for name, _, length_type in properties}, offset
+
+
+def load_ply(path):
+	"""
+	Load the vertices and faces of a binary PLY file. Properties other than the vertex coordinates and vertex ids of the faces are ignored.
+	"""
+
+	with util.reading_file(path) as file:
+		format, elements = _read_ply_header(file)
+		offset = file.tell()
+
+	if format not in _ply_byte_orders:
+		raise util.UserError('Only binary PLY files are supported.')
+
+	byte_order = _ply_byte_orders[format]
+	data = numpy.memmap(path, dtype = numpy.uint8, mode = 'r')
+	vertices = None
+	faces = None
+
+	for name, count, properties in elements:
+		if vertices is not None and faces is not None:
+			break
+
+		try:
+			values, offset = _read_ply_element(data, offset, count, properties, byte_order)
+		except ValueError:
+			raise util.UserError('PLY file is truncated.') from None
+
+		if name == 'vertex':
+			if not all(i in values for i in 'xyz'):
+				raise util.UserError('PLY file contains vertices without x, y and z coordinates: {}', path)
+
+			vertices = numpy.column_stack([values[i] for i in 'xyz']).astype(numpy.float64)
+		elif name == 'face':
+			vertex_ids = values.get('vertex_indices', values.get('vertex_index'))
+
+			if vertex_ids is None:
+				raise util.UserError('PLY file contains faces without vertex indices.')
+
+			faces = _triangulate(vertex_ids[0].astype(numpy.int64), vertex_ids[1])
+
+	if vertices is None or faces is None:
+		raise util.UserError('PLY file does not contain vertices and faces.')
+
+	return vertices, faces
+
+
+def load_binary_json(path):
+	"""
+	Load the vertices and faces of a file in the binary JSON format.
+	"""
+
+	with util.reading_file(path) as file:
+		header = file.readline(_max_binary_json_header_size)
+
+	try:
+		header = json.loads(header.decode('utf-8'))
+	except ValueError:
+		raise util.UserError('Invalid binary JSON header.') from None
+
+	def load_array(name):
+		spec = header[name]
+		dtype = numpy.dtype(spec['dtype'])
+		shape = tuple(spec['shape'])
+
+		if len(shape) != 2 or shape[1] != 3:
+			raise util.UserError('The {} array must have shape [n, 3].', name)
+
+		if not shape[0]:
+			return numpy.zeros(shape, dtype)
+
+		return numpy.memmap(path, dtype = dtype, mode = 'r', offset = spec['offset'], shape = shape)
+
+	return load_array('vertices').astype(numpy.float64), load_array('faces').astype(numpy.int64)
+
+
+def save_binary_json(path, vertices, faces):
+	"""
+	Write vertices and triangles to a file in the binary JSON format.
+	"""
+
+	arrays = dict(
+		vertices = numpy.ascontiguousarray(vertices, dtype = '<f8'),
+		faces = numpy.ascontiguousarray(faces, dtype = '<u4'))
+
+	# The offsets depend on the length of the header, so the header is padded to a multiple of 64 bytes.
+	def get_header(header_size):
+		offsets = numpy.cumsum([header_size] + [i.nbytes for i in arrays.values()])
+
+		return json.dumps({
+			name: dict(dtype = array.dtype.str, shape = list(array.shape), offset = int(offset))
+			for (name, array), offset in zip(arrays.items(), offsets)}).encode('utf-8')
+
+	header_size = 64
+
+	while len(get_header(header_size)) >= header_size:
+		header_size += 64
+
+	header = get_header(header_size)
+
+	with util.writing_file(path) as file:
+		file.write(header.ljust(header_size - 1) + b'\n')
+
+		for i in arrays.values():
+			file.write(i.tobytes())
+
+
+_loaders = {
+	'.stl': load_stl,
+	'.obj': load_obj,
+	'.ply': load_ply,
+	'.json': load_json,
+	'.bjson': load_binary_json}
+
+
+def extensions():
+	return sorted(_loaders)
+
+
+def load_mesh(path):
+	"""
+	Load a mesh file, using the loader selected by the file's extension.
+
+	Returns an array of vertex coordinates and an array of shape (n, 3) of vertex ids for each triangle. Unused vertices are removed.
+	"""
+
+	_, extension = os.path.splitext(path)
+	loader = _loaders.get(extension.lower())
+
+	if loader is None:
+		raise util.UserError('Unsupported mesh file format: {}', path)
+
+	vertices, faces = loader(path)
+
+	if len(faces) and (faces.min() < 0 or faces.max() >= len(vertices)):
+		raise util.UserError('Mesh contains a face with an invalid vertex id: {}', path)
+
+	used = numpy.zeros(len(vertices), dtype = bool)
+	used[faces] = True
+
+	if not numpy.all(used):
+		new_ids = numpy.cumsum(used) - 1
+		vertices = vertices[used]
+		faces = new_ids[faces]
+
+	return vertices, faces
@@ -1,4 +1,4 @@
-import math, abc, numpy
+import math, abc, numpy, pyclipper
 from . import linalg
 
 
@@ -54,6 +54,39 @@ class Path:
 		return numpy.count_nonzero(self.m[2]) == self.m.shape[0]
 
 
+class PathArray:
+	"""
+	Represents a list of open paths whose vertices are stored in a single array.
+	
+	The vertices of the i-th path are the columns offsets[i]:offsets[i + 1] of m, which uses the same representation as Path.m.
+	"""
+	
+	def __init__(self, m: numpy.ndarray, offsets: numpy.ndarray):
+		s1, s2 = m.shape
+		
+		assert s1 == 3
+		assert offsets[0] == 0 and offsets[-1] == s2
+		
+		self.m = m
+		self.offsets = offsets
+	
+	def __len__(self):
+		return len(self.offsets) - 1
+	
+	def __getitem__(self, index):
+		return Path(self.m[:, self.offsets[index]:self.offsets[index + 1]])
+	
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+	
+	def __repr__(self):
+		return 'PathArray({}, {})'.format(self.m, self.offsets)
+	
+	def _transform(self, transformation):
+		return type(self)(numpy.dot(transformation.m, self.m), self.offsets)
+
+
 _the_one = numpy.array([1], numpy.float64)
 _the_zero = numpy.array([0], numpy.float64)
 
@@ -76,11 +109,39 @@ def path(*vertices):
 	Please not that a path without any vertices, when used in a polygon, is interpreted as the area of the whole plane. The reasoning behind this is that a (convex) polygon ca be interpreted as the intersection of the set of half-spaces created by converting each edge into a half-space. The intersection of zero half-planes is the full plane. (And it was a convenient hack solving the problem of representing the whole plane.)
 	"""
 	
-	def iter_vertices():
-		for v in vertices:
-			yield _cast_vertex(v)
+	array = numpy.array(vertices, numpy.float64)
+	
+	assert array.shape[1:] == (2,) or not vertices
+	
+	return path_from_array(array.reshape((-1, 2)))
+
+
+def path_from_array(vertices):
+	"""
+	Return a path using the coordinates from an array of shape (n, 2).
+	"""
+	
+	vertices = numpy.asarray(vertices, numpy.float64)
+	
+	assert vertices.ndim == 2 and vertices.shape[1] == 2
+	
+	return Path(numpy.vstack([vertices.T, numpy.ones(len(vertices))]))
+
+
+def path_array(arrays):
+	"""
+	Return a PathArray containing a path for each of the specified arrays of shape (n, 2).
+	"""
+	
+	arrays = [numpy.asarray(i, numpy.float64).reshape((-1, 2)) for i in arrays]
+	offsets = numpy.cumsum([0] + [len(i) for i in arrays])
+	
+	if arrays:
+		vertices = numpy.concatenate(arrays)
+	else:
+		vertices = numpy.zeros((0, 2))
 	
-	return Path(numpy.array(list(iter_vertices())).reshape((-1, 3)).T)
+	return PathArray(numpy.vstack([vertices.T, numpy.ones(len(vertices))]), offsets)
 
 
 def _cast_path(p):
@@ -114,6 +175,33 @@ _quadrant_corners = [
 
 
 class Polygon:
+	def __and__(self, other):
+		return _CombinedPolygon(self, other, pyclipper.CT_INTERSECTION)
+	
+	def __or__(self, other):
+		return _CombinedPolygon(self, other, pyclipper.CT_UNION)
+	
+	def __sub__(self, other):
+		return _CombinedPolygon(self, other, pyclipper.CT_DIFFERENCE)
+	
+	def __xor__(self, other):
+		return _CombinedPolygon(self, other, pyclipper.CT_XOR)
+	
+	def _transform(self, transformation):
+		return _TransformedPolygon(self, transformation.m)
+	
+	@classmethod
+	def _transform_coordinate(cls, tm: numpy.ndarray, v: numpy.ndarray):
+		x, y, _ = numpy.dot(tm, v)
+		
+		return x, y
+	
+	@classmethod
+	def _scale_point(cls, tm: numpy.ndarray, v: numpy.ndarray):
+		x, y = cls._transform_coordinate(tm, v)
+		
+		return round(x * _clipper_scale), round(y * _clipper_scale)
+	
 	@property
 	@abc.abstractmethod
 	def paths(self):
@@ -138,33 +226,59 @@ class _ConcretePolygon(Polygon):
 		self._paths = paths
 	
 	def _get_pyclipper_paths(self, tm: numpy.ndarray):
-		def _iter_paths():
-			for i in self._paths:
-				def _iter_vertices():
-					path = [self._scale_point(tm, j) for j in i.m.T]
-					prev = path[-1]
-					
-					for j in path:
-						if j != prev:
-							prev = j
-							
-							yield j
-				
-				vertices = list(_iter_vertices())
-				
-				if len(vertices) > 2:
-					yield vertices
-		
-		return list(_iter_paths())
+		return [i for i in _scale_paths(self._paths, tm) if i is not None]
 	
 	@property
 	def paths(self):
 		return self._paths
 
 
+def _scale_paths(paths, tm: numpy.ndarray):
+	"""
+	Convert a list of Path instances to clipper's representation.
+	
+	The vertices of all paths are transformed at once. Consecutive duplicate vertices are removed and paths with less than 3 remaining vertices are replaced with None.
+	"""
+	
+	if not paths:
+		return []
+	
+	lengths = numpy.array([i.m.shape[1] for i in paths])
+	ends = numpy.cumsum(lengths)
+	starts = ends - lengths
+	
+	vertices = numpy.round(
+		numpy.dot(tm, numpy.concatenate([i.m for i in paths], 1))[:2].T
+		* _clipper_scale).astype(numpy.int64)
+	
+	# Index of the previous vertex of each vertex on the same closed path.
+	previous = numpy.arange(len(vertices)) - 1
+	previous[starts] = ends - 1
+	
+	kept = numpy.any(vertices != vertices[previous], 1)
+	kept_lengths = numpy.add.reduceat(kept, starts).tolist()
+	kept_vertices = vertices[kept].tolist()
+	
+	def iter_paths():
+		start = 0
+		
+		for i in kept_lengths:
+			if i > 2:
+				yield kept_vertices[start:start + i]
+			else:
+				yield None
+			
+			start += i
+	
+	return list(iter_paths())
+
+
 class _CompositePolygon(Polygon):
 	def __init__(self):
 		self._cached_paths = None
+		
+		# Pair of the bytes of a transformation and the result of evaluating this polygon with it, see _evaluate().
+		self._evaluated = None
 	
 	@property
 	def paths(self):
@@ -213,7 +327,7 @@ class _TransformedPolygon(_CompositePolygon):
 		self._tm = tm
 	
 	def _get_pyclipper_paths(self, tm: numpy.ndarray):
-		return self._polygon._get_pyclipper_paths(numpy.dot(tm, self._tm))
+		return _evaluate(self, tm)
 
 
 class _CombinedPolygon(_CompositePolygon):
@@ -225,25 +339,324 @@ class _CombinedPolygon(_CompositePolygon):
 		self._operation = operation
 	
 	def _get_pyclipper_paths(self, tm: numpy.ndarray):
-		pc = pyclipper.Pyclipper()
-		# pc.StrictlySimple = True
+		return _evaluate(self, tm)
+
+
+class _UnionPolygon(_CompositePolygon):
+	def __init__(self, polygons: list):
+		super().__init__()
+		
+		self._polygons = polygons
+	
+	def _get_pyclipper_paths(self, tm: numpy.ndarray):
+		return _evaluate(self, tm)
+
+
+# Number of polygons combined in each step of a union.
+_union_group_size = 16
+
+
+def _normalize_paths(paths):
+	"""
+	Bring a list of paths in clipper's representation into the form returned by clipper, where the outer boundaries run counter-clockwise and holes run clockwise.
+	
+	This allows multiple polygons to be combined in a single operation using the non-zero rule, while each polygon has been evaluated using the even-odd rule.
+	"""
+	
+	# A triangle is always simple, so only its orientation needs to be fixed.
+	if len(paths) == 1 and len(paths[0]) == 3:
+		path, = paths
+		
+		if pyclipper.Orientation(path):
+			return paths
+		else:
+			return [path[::-1]]
+	
+	return _execute_clipper(paths, [], pyclipper.CT_UNION)
+
+
+def _union_paths(operands):
+	"""
+	Return the union of a list of polygons, each given as a list of paths in clipper's representation.
+	"""
+	
+	level = [_normalize_paths(i) for i in operands]
+	
+	# Combining the polygons one after the other would make each step as expensive as the union of all polygons so far. Instead, groups of polygons are combined and then groups of the results until a single polygon is left, which keeps the inputs of each step of similar size.
+	while len(level) > 1:
+		level = [
+			_execute_clipper(
+				[k for j in level[i:i + _union_group_size] for k in j],
+				[],
+				pyclipper.CT_UNION,
+				pyclipper.PFT_NONZERO,
+				pyclipper.PFT_NONZERO)
+			for i in range(0, len(level), _union_group_size)]
+	
+	if level:
+		return level[0]
+	else:
+		return []
+
+
+def _intersect_paths(operands):
+	# Clipper can only intersect two polygons at a time, so the polygons are intersected in pairs, then pairs of the results and so on.
+	level = operands
+	
+	while len(level) > 1:
+		next_level = [
+			_execute_clipper(a, b, pyclipper.CT_INTERSECTION)
+			for a, b in zip(level[::2], level[1::2])]
 		
-		for i in self._left._get_pyclipper_paths(tm):
-			pc.AddPath(i, pyclipper.PT_SUBJECT, True)
+		if len(level) % 2:
+			next_level.append(level[-1])
 		
-		for i in self._right._get_pyclipper_paths(tm):
-			pc.AddPath(i, pyclipper.PT_CLIP, True)
+		level = next_level
+	
+	return level[0]
+
+
+def _apply_operation(operation, operands):
+	"""
+	Apply a boolean operation to any number of polygons, each given as a list of paths in clipper's representation.
+	
+	For CT_DIFFERENCE, all polygons after the first one are subtracted from the first one.
+	"""
+	
+	if operation == pyclipper.CT_UNION:
+		return _union_paths(operands)
+	elif operation == pyclipper.CT_INTERSECTION:
+		return _intersect_paths(operands)
+	elif operation == pyclipper.CT_XOR:
+		# Under the even-odd rule, the paths of all polygons together form their symmetric difference.
+		return _execute_clipper([j for i in operands for j in i], [], pyclipper.CT_UNION)
+	elif operation == pyclipper.CT_DIFFERENCE:
+		minuend, *subtrahends = operands
+		
+		return _execute_clipper(
+			minuend,
+			[k for j in subtrahends for k in _normalize_paths(j)],
+			pyclipper.CT_DIFFERENCE,
+			pyclipper.PFT_EVENODD,
+			pyclipper.PFT_NONZERO)
+	else:
+		raise ValueError('Unknown operation: {}'.format(operation))
+
+
+def _get_operation(polygon):
+	"""
+	Return the operation combining the operands of a polygon or None, if the polygon is not the result of an operation.
+	"""
+	
+	if isinstance(polygon, _CombinedPolygon):
+		return polygon._operation
+	elif isinstance(polygon, _UnionPolygon):
+		return pyclipper.CT_UNION
+	else:
+		return None
+
+
+def _fold_transformations(polygon, tm: numpy.ndarray):
+	"""
+	Skip a chain of transformed polygons, returning the polygon at the end of the chain and the product of all transformations.
+	"""
+	
+	while isinstance(polygon, _TransformedPolygon):
+		tm = numpy.dot(tm, polygon._tm)
+		polygon = polygon._polygon
+	
+	return polygon, tm
+
+
+def _get_operands(polygon, tm: numpy.ndarray):
+	if isinstance(polygon, _CombinedPolygon):
+		operands = [polygon._left, polygon._right]
+	else:
+		operands = polygon._polygons
+	
+	return [_fold_transformations(i, tm) for i in operands]
+
+
+def _get_evaluated(polygon, tm: numpy.ndarray):
+	"""
+	Return the result of an earlier evaluation of a polygon with the specified transformation or None, if it has not been evaluated yet.
+	"""
+	
+	if isinstance(polygon, _CompositePolygon) and polygon._evaluated is not None:
+		tm_bytes, result = polygon._evaluated
+		
+		if tm_bytes == tm.tobytes():
+			return result
+	
+	return None
+
+
+def _flatten_operands(operation, operands):
+	"""
+	Replace operands which are themselves the result of the specified operation with their operands.
+	
+	Operands which have already been evaluated are kept, so that an operation extending the result of an earlier one, like a union growing by a few polygons at a time, does not need to combine all operands of the earlier operation again.
+	"""
+	
+	stack = operands[::-1]
+	flattened = []
+	
+	while stack:
+		polygon, tm = stack.pop()
+		
+		if _get_operation(polygon) == operation and _get_evaluated(polygon, tm) is None:
+			stack.extend(_get_operands(polygon, tm)[::-1])
+		else:
+			flattened.append((polygon, tm))
+	
+	return flattened
+
+
+def _flatten(polygon, tm: numpy.ndarray):
+	"""
+	Return the operation of a polygon and the list of all its operands as pairs of polygons and transformations after flattening nested operations of the same kind.
+	"""
+	
+	operation = _get_operation(polygon)
+	
+	if operation == pyclipper.CT_DIFFERENCE:
+		# (a - b) - c is evaluated as a - (b | c).
+		subtrahends = []
+		
+		while _get_operation(polygon) == pyclipper.CT_DIFFERENCE:
+			subtrahends.append(_fold_transformations(polygon._right, tm))
+			polygon, tm = _fold_transformations(polygon._left, tm)
+			
+			if _get_evaluated(polygon, tm) is not None:
+				break
+		
+		return operation, [(polygon, tm)] + _flatten_operands(pyclipper.CT_UNION, subtrahends[::-1])
+	else:
+		return operation, _flatten_operands(operation, _get_operands(polygon, tm))
+
+
+def _get_key(polygon, tm: numpy.ndarray):
+	return id(polygon), tm.tobytes()
+
+
+def _scale_concrete_polygons(operands, results):
+	"""
+	Convert all concrete polygons in a list of pairs of polygons and transformations to clipper's representation, converting all polygons using the same transformation at once.
+	"""
+	
+	operands_by_tm = { }
+	
+	for polygon, tm in operands:
+		if isinstance(polygon, _ConcretePolygon):
+			operands_by_tm.setdefault(tm.tobytes(), (tm, []))[1].append(polygon)
+	
+	for tm, polygons in operands_by_tm.values():
+		scaled_paths = _scale_paths([j for i in polygons for j in i._paths], tm)
+		start = 0
+		
+		for i in polygons:
+			end = start + len(i._paths)
+			results[_get_key(i, tm)] = [j for j in scaled_paths[start:end] if j is not None]
+			start = end
+
+
+def _evaluate(polygon, tm: numpy.ndarray):
+	"""
+	Evaluate a polygon expression into a list of paths in clipper's representation.
+	
+	Chains of transformations are folded into a single transformation and nested operations of the same kind are combined into a single operation. The result of each combination of a polygon and a transformation is only calculated once, even if it appears in multiple places of the expression. The expression is traversed using an explicit stack so that deep expressions do not hit the recursion limit.
+	
+	The result is stored in the evaluated polygon and reused when the polygon is evaluated again with the same transformation, also as part of another expression.
+	"""
+	
+	root = _fold_transformations(polygon, tm)
+	result = _get_evaluated(*root)
+	
+	if result is not None:
+		return result
+	
+	# Results by the keys returned by _get_key().
+	results = { }
+	
+	# Flattened operations by the keys returned by _get_key().
+	flattened = { }
+	
+	stack = [root]
+	
+	while stack:
+		polygon, tm = stack[-1]
+		key = _get_key(polygon, tm)
 		
-		solution = pc.Execute(self._operation, pyclipper.PFT_EVENODD,
-			pyclipper.PFT_EVENODD)
+		if key in results:
+			stack.pop()
+		elif _get_evaluated(polygon, tm) is not None:
+			stack.pop()
+			results[key] = _get_evaluated(polygon, tm)
+		elif _get_operation(polygon) is None:
+			stack.pop()
+			results[key] = polygon._get_pyclipper_paths(tm)
+		else:
+			if key not in flattened:
+				flattened[key] = _flatten(polygon, tm)
+			
+			operation, operands = flattened[key]
+			missing = [i for i in operands if _get_key(*i) not in results]
+			
+			if missing:
+				_scale_concrete_polygons(missing, results)
+				stack.extend(i for i in missing if _get_key(*i) not in results)
+			else:
+				stack.pop()
+				results[key] = _apply_operation(
+					operation,
+					[results[_get_key(*i)] for i in operands])
+	
+	polygon, tm = root
+	result = results[_get_key(polygon, tm)]
+	
+	if isinstance(polygon, _CompositePolygon):
+		polygon._evaluated = tm.tobytes(), result
+	
+	return result
+
+
+def _execute_clipper(subject_paths, clip_paths, operation,
+		subject_fill_type = pyclipper.PFT_EVENODD,
+		clip_fill_type = pyclipper.PFT_EVENODD):
+	"""
+	Run a single boolean operation on two lists of paths in clipper's representation.
+	"""
+	
+	pc = pyclipper.Pyclipper()
+	# pc.StrictlySimple = True
+	
+	def add_paths(paths, poly_type):
+		count = 0
 		
-		# Clipper can return paths that it itself considers invalid as input. ._.
-		assert all(
-			-_clipper_range <= k <= _clipper_range for i in solution for j in i for
-			k in j), solution
-		assert all(len(i) > 2 for i in solution)
+		for i in paths:
+			try:
+				pc.AddPath(i, poly_type, True)
+				count += 1
+			except pyclipper.ClipperException:
+				# Raised for paths without area.
+				pass
 		
-		return solution
+		return count
+	
+	# Clipper fails when run without any paths.
+	if not add_paths(subject_paths, pyclipper.PT_SUBJECT) \
+			+ add_paths(clip_paths, pyclipper.PT_CLIP):
+		return []
+	
+	solution = pc.Execute(operation, subject_fill_type, clip_fill_type)
+	
+	# Clipper can return paths that it itself considers invalid as input. ._.
+	assert all(
+		-_clipper_range <= k <= _clipper_range for i in solution for j in i for
+		k in j), solution
+	assert all(len(i) > 2 for i in solution)
+	
+	return solution
 
 
 class _HalfPlane(_CompositePolygon):
@@ -359,6 +772,61 @@ def polygon(*paths):
 	return _ConcretePolygon([_cast_path(i) for i in paths])
 
 
+def union(*polygons):
+	"""
+	Return the union of any number of polygons.
+	
+	Each of the polygons is evaluated using the even-odd rule on its own before the polygons are combined. This is much faster than combining many polygons using the | operator.
+	"""
+	
+	return _UnionPolygon(list(polygons))
+
+
+def clip_path(open_path: Path, polygon: Polygon, inside = True):
+	"""
+	Return the parts of an open path lying inside a polygon, or outside of it, if inside is false, as a list of paths.
+	
+	Vertices of the parts which coincide with a vertex of the path after rounding to clipper's representation are returned with the exact coordinates of that vertex, so that e.g. the ends of the path can be recognized.
+	"""
+	
+	scaled_vertices = numpy.round(open_path.m[:2].T * _clipper_scale).astype(numpy.int64).tolist()
+	vertices_by_scaled = { tuple(i): j for i, j in zip(scaled_vertices, open_path.vertices) }
+	
+	pc = pyclipper.Pyclipper()
+	
+	try:
+		pc.AddPath(scaled_vertices, pyclipper.PT_SUBJECT, False)
+	except pyclipper.ClipperException:
+		# Raised for paths without length.
+		return []
+	
+	clip_count = 0
+	
+	for i in polygon._get_pyclipper_paths(numpy.eye(3)):
+		try:
+			pc.AddPath(i, pyclipper.PT_CLIP, True)
+			clip_count += 1
+		except pyclipper.ClipperException:
+			# Raised for paths without area.
+			pass
+	
+	# Clipper fails when run without any clip paths.
+	if not clip_count:
+		return [] if inside else [open_path]
+	
+	solution = pc.Execute2(
+		pyclipper.CT_INTERSECTION if inside else pyclipper.CT_DIFFERENCE,
+		pyclipper.PFT_EVENODD,
+		pyclipper.PFT_EVENODD)
+	
+	def get_vertex(x, y):
+		return vertices_by_scaled.get((x, y), (x / _clipper_scale, y / _clipper_scale))
+	
+	return [
+		path(*(get_vertex(x, y) for x, y in i))
+		for i in pyclipper.OpenPathsFromPolyTree(solution) if len(i) > 1]
+
+
 def circle(n = 64):
 	"""
 	Return a polygon approximating a circle using a regular polygon with the specified number of sides.
@@ -366,7 +834,7 @@ def circle(n = 64):
 	
 	def iter_points():
 		for i in range(n):
-			t = i * util.tau / n
+			t = i * math.tau / n
 			
 			yield math.cos(t), math.sin(t)
 	
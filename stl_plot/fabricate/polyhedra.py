@@ -1,4 +1,4 @@
-import json, numpy, stl.mesh
+import fractions, json, os, numpy
 from . import linalg, paths
 
 
@@ -22,10 +22,11 @@ class PolyhedronView:
 	Represents the combination of a face, an adjacent edge and the vertex at the start of that edge when traversing the boundary of the face in positive order.
 	"""
 	
-	def __init__(self, polyhedron: 'Polyhedron', vertex_id, face_id):
+	def __init__(self, polyhedron: 'Polyhedron', vertex_id, face_id, half_edge_id):
 		self._polyhedron = polyhedron
 		self._vertex_id = vertex_id
 		self._face_id = face_id
+		self._half_edge_id = half_edge_id
 		
 		# These are filled by the Polyhedron.__init__()
 		self._next_view = None
@@ -62,6 +63,14 @@ class PolyhedronView:
 		
 		return self._face_id
 	
+	@property
+	def half_edge_id(self):
+		"""
+		Return the index of this view when enumerating the vertices of all faces in order (unique per polyhedron).
+		"""
+		
+		return self._half_edge_id
+	
 	@property
 	def vertex_coordinate(self):
 		"""
@@ -114,14 +123,28 @@ class PolyhedronView:
 
 
 class Polyhedron:
-	def __init__(self, vertices, faces):
+	def __init__(self, vertices, faces, *, opposite = None, face_normals = None,
+			dihedral_angles = None):
 		"""
 		:param vertices: List of coordinate triples.
 		:param faces: List of lists of vertex indexes.
+		:param opposite: Optional precomputed array of the opposite half-edge id for each half-edge id, as returned by half_edge_arrays().
+		:param face_normals: Optional precomputed array of the normals of all faces, as returned by face_normal_array().
+		:param dihedral_angles: Optional precomputed array of the dihedral angle at each half-edge id.
 		"""
 		# Store numerical geometry data
 		self._vertex_coordinates = numpy.array(vertices, dtype = numpy.float64)
 		
+		# Vertex ids of each face as passed to the constructor, indexed by face id.
+		self._face_vertex_ids = [list(i) for i in faces]
+		
+		# Cached values used by face_normal() and dihedral_angle(), if available.
+		self._face_normals = face_normals
+		self._dihedral_angles = dihedral_angles
+		
+		# All views indexed by half-edge id.
+		views_by_half_edge_id = []
+		
 		# All views as list of the form [face : [vertex : ((vertex_id : int, vertex_id : int), PolyhedronView)]]
 		view_by_face = []
 		
@@ -148,7 +171,8 @@ class Polyhedron:
 			face_views = []
 			
 			for id1, id2 in zip(face, face[1:] + face[:1]):
-				view = PolyhedronView(self, id1, face_id)
+				view = PolyhedronView(self, id1, face_id, len(views_by_half_edge_id))
+				views_by_half_edge_id.append(view)
 				
 				# Only use the first view for each face.
 				if not face_views:
@@ -174,7 +198,11 @@ class Polyhedron:
 			for ((id1, id2), view), (_, next_view) in zip(face,
 							face[1:] + face[:1]):
 				view._next_view = next_view
-				view._opposite_view = self._edges_by_id[id2, id1]
+				
+				if opposite is None:
+					view._opposite_view = self._edges_by_id[id2, id1]
+				else:
+					view._opposite_view = views_by_half_edge_id[opposite[view._half_edge_id]]
 	
 	def face_by_id(self, id: int) -> PolyhedronView:
 		"""
@@ -197,6 +225,22 @@ class Polyhedron:
 		
 		return self._vertices_by_id[id]
 	
+	@property
+	def vertex_coordinates(self) -> numpy.ndarray:
+		"""
+		Array of shape (vertex_count, 3) containing the coordinates of all vertices indexed by vertex id.
+		"""
+		
+		return self._vertex_coordinates
+	
+	@property
+	def face_vertex_ids(self):
+		"""
+		List of lists of vertex ids in positive order around each face, indexed by face id.
+		"""
+		
+		return self._face_vertex_ids
+	
 	@property
 	def all_views(self):
 		"""
@@ -250,18 +294,47 @@ class Polyhedron:
 		"""
 		return len(self.faces)
 	
+	def face_component_ids(self):
+		"""
+		Return a list containing for each face the id of the connected component of the polyhedron it belongs to. Faces are connected if they share an edge. Components are numbered in the order of their faces with the smallest id.
+		"""
+		
+		component_ids = [None] * self.face_count
+		component_count = 0
+		
+		for face_id in range(self.face_count):
+			if component_ids[face_id] is not None:
+				continue
+			
+			component_ids[face_id] = component_count
+			stack = [face_id]
+			
+			while stack:
+				for view in self.face_by_id(stack.pop()).face_cycle:
+					opposite_face_id = view.opposite.face_id
+					
+					if component_ids[opposite_face_id] is None:
+						component_ids[opposite_face_id] = component_count
+						stack.append(opposite_face_id)
+			
+			component_count += 1
+		
+		return component_ids
+	
 	@classmethod
 	def load_from_json(cls, path, scale = 1):
 		with open(path, encoding = 'utf-8') as file:
 			data = json.load(file)
 		
-		vertices = [scale * numpy.array(i) for i in data['vertices']]
+		vertices = scale * numpy.array(data['vertices'], dtype = numpy.float64)
 		faces = data['faces']
 		
 		return cls(vertices, faces)
 	
 	@classmethod
 	def load_from_stl(cls, path):
+		import stl.mesh
+		
 		your_mesh = stl.mesh.Mesh.from_file(path)
 		vertices = []
 		vertex_indices = { }
@@ -280,6 +353,124 @@ class Polyhedron:
 		return cls(vertices, faces)
 
 
+# Layout of the records of a binary STL file, the same as stl.mesh.Mesh.dtype.
+_binary_stl_dtype = numpy.dtype([
+	('normals', '<f4', (3,)),
+	('vectors', '<f4', (3, 3)),
+	('attr', '<u2', (1,))])
+
+
+def load_stl_triangles(path):
+	"""
+	Return the triangles of an STL file as an array of shape (n, 3, 3).
+	
+	Binary files are memory-mapped instead of being read into memory.
+	"""
+	
+	# Binary STL files consist of an 80 byte header, a 4 byte triangle count and 50 bytes per triangle.
+	with open(path, 'rb') as file:
+		file.seek(80)
+		count_data = file.read(4)
+	
+	if len(count_data) == 4:
+		count = int.from_bytes(count_data, 'little')
+		
+		if os.path.getsize(path) == 84 + 50 * count:
+			records = numpy.memmap(path, dtype = _binary_stl_dtype, mode = 'r',
+				offset = 84, shape = (count,))
+			
+			return records['vectors']
+	
+	# numpy-stl is slow to import and only needed to parse ASCII files.
+	import stl.mesh
+	
+	return stl.mesh.Mesh.from_file(path).vectors
+
+
+def weld_triangles(triangles):
+	"""
+	Merge the identical corners of a list of triangles.
+	
+	Returns an array of vertex coordinates and an array of shape (n, 3) of vertex ids for each triangle.
+	"""
+	
+	corners = numpy.reshape(triangles, (-1, 3))
+	
+	# Sorting the coordinates explicitly is much faster than numpy.unique(..., axis = 0).
+	order = numpy.lexsort((corners[:, 2], corners[:, 1], corners[:, 0]))
+	sorted_corners = corners[order]
+	is_new = numpy.concatenate([[True], numpy.any(sorted_corners[1:] != sorted_corners[:-1], axis = 1)])
+	
+	vertex_ids = numpy.empty(len(corners), dtype = numpy.int64)
+	vertex_ids[order] = numpy.cumsum(is_new) - 1
+	
+	return sorted_corners[is_new].astype(numpy.float64), numpy.reshape(vertex_ids, (-1, 3))
+
+
+def face_normal_array(vertices, faces):
+	"""
+	Return the normalized normals of all faces of a triangle mesh as an array of shape (n, 3).
+	
+	Degenerate faces get a zero normal.
+	"""
+	
+	a, b, c = [vertices[faces[:, i]] for i in range(3)]
+	normals = numpy.cross(b - a, c - b)
+	lengths = numpy.linalg.norm(normals, axis = 1)
+	nonzero = lengths > 0
+	normals[nonzero] /= lengths[nonzero, None]
+	normals[~nonzero] = 0
+	
+	return normals
+
+
+def half_edge_arrays(faces):
+	"""
+	Link the half-edges of a closed triangle mesh.
+	
+	Half-edge i runs from vertex faces.flat[i] to the next vertex of face i // 3, which is the same numbering as used for PolyhedronView.half_edge_id.
+	
+	Returns two arrays containing the id of the next half-edge around the same face and the id of the opposite half-edge of each half-edge.
+	"""
+	
+	vertex_count = int(faces.max()) + 1 if len(faces) else 0
+	half_edge_ids = numpy.arange(faces.size)
+	starts = numpy.reshape(faces, -1).astype(numpy.int64)
+	ends = numpy.reshape(faces[:, [1, 2, 0]], -1).astype(numpy.int64)
+	next = half_edge_ids - half_edge_ids % 3 + (half_edge_ids + 1) % 3
+	
+	keys = starts * vertex_count + ends
+	order = numpy.argsort(keys)
+	sorted_keys = keys[order]
+	opposite_keys = ends * vertex_count + starts
+	opposite_index = numpy.minimum(numpy.searchsorted(sorted_keys, opposite_keys), len(keys) - 1)
+	
+	if numpy.any(sorted_keys[opposite_index] != opposite_keys):
+		raise ValueError('Mesh is not closed.')
+	
+	return next, order[opposite_index]
+
+
+def edge_face_arrays(faces, opposite = None):
+	"""
+	Find the two faces adjacent to each edge of a closed triangle mesh.
+	
+	The result of half_edge_arrays() can be passed as opposite if it is already available.
+	
+	Returns an array of shape (n, 2) of vertex ids of the edges with the smaller id first and two arrays with the id of the face to the left and to the right of each edge.
+	"""
+	
+	if opposite is None:
+		_, opposite = half_edge_arrays(faces)
+	
+	starts = numpy.reshape(faces, -1)
+	ends = numpy.reshape(faces[:, [1, 2, 0]], -1)
+	forward = numpy.flatnonzero(starts < ends)
+	edges = numpy.column_stack([starts[forward], ends[forward]])
+	
+	return edges, forward // 3, opposite[forward] // 3
+
+
 def edge_vector(view: PolyhedronView):
 	"""
 	The vector pointing in the direction of the specified view's edge.
@@ -315,6 +506,11 @@ def face_normal(view: PolyhedronView):
 	The normalized vector representing the normal of the specified view's face pointing outwards of the polyhedron.
 	"""
 	
+	face_normals = view.polyhedron._face_normals
+	
+	if face_normals is not None:
+		return face_normals[view.face_id]
+	
 	a, b, c = [i.vertex_coordinate for i in [view, view.next, view.next.next]]
 	
 	return linalg.normalize(numpy.cross(b - a, c - b))
@@ -390,8 +586,150 @@ def dihedral_angle(view1: PolyhedronView, view2: PolyhedronView):
 	"""
 	Compute the dihedral angle between two faces.
 	"""
+	dihedral_angles = view1.polyhedron._dihedral_angles
+	
+	if dihedral_angles is not None and view2 is view1.opposite:
+		return dihedral_angles[view1.half_edge_id]
+	
 	n1 = face_normal(view1)
 	n2 = face_normal(view2)
 
 	theta = numpy.pi - numpy.arccos(numpy.clip(numpy.dot(n1, n2), -1, 1))
 	return theta
+
+
+def dihedral_angle_array(face_normals, opposite):
+	"""
+	Compute the dihedral angle at each half-edge of a triangle mesh, as dihedral_angle() does for a single pair of views.
+	"""
+	
+	n1 = numpy.repeat(face_normals, 3, axis = 0)
+	n2 = face_normals[opposite // 3]
+	
+	return numpy.pi - numpy.arccos(numpy.clip(numpy.sum(n1 * n2, axis = 1), -1, 1))
+
+
+class PlanarPatch:
+	"""
+	A maximal set of connected faces of a polyhedron which lie in a common plane.
+	"""
+	
+	def __init__(self, faces, boundary):
+		self.faces = faces
+		"""List of canonical views of the faces in this patch."""
+		
+		self.boundary = boundary
+		"""List of views whose edge separates this patch from a face outside of it, oriented in positive order around the patch."""
+
+
+def _cross_product(u, v):
+	"""
+	Return the cross product of two vectors given as sequences of their three coordinates, which may also be arrays or fractions.
+	"""
+	
+	return [
+		u[1] * v[2] - u[2] * v[1],
+		u[2] * v[0] - u[0] * v[2],
+		u[0] * v[1] - u[1] * v[0]]
+
+
+def _triple_product_terms(u, v, w):
+	"""
+	Return the six terms which sum up to the triple product of three vectors, given like to _cross_product().
+	"""
+	
+	return [
+		u[1] * v[2] * w[0], -u[2] * v[1] * w[0],
+		u[2] * v[0] * w[1], -u[0] * v[2] * w[1],
+		u[0] * v[1] * w[2], -u[1] * v[0] * w[2]]
+
+
+def find_planar_patches(polyhedron: Polyhedron):
+	"""
+	Partition the faces of a triangle mesh into planar patches.
+	
+	Faces are merged across an edge only if they lie exactly in the same plane and have the same orientation, which is tested using exact rational arithmetic. The plane of any face of a patch is thus the plane of the whole patch.
+	"""
+	
+	face_vertex_ids = numpy.array(polyhedron.face_vertex_ids, dtype = numpy.int64)
+	vertices = polyhedron.vertex_coordinates
+	_, opposite = half_edge_arrays(face_vertex_ids)
+	
+	# For each half-edge, the vertex of the face on the other side which is not on the edge.
+	apexes = face_vertex_ids.flat[opposite - opposite % 3 + (opposite + 2) % 3]
+	
+	a, b, c = [vertices[numpy.repeat(face_vertex_ids[:, i], 3)].T for i in range(3)]
+	terms = numpy.array(_triple_product_terms(b - a, c - a, vertices[apexes].T - a))
+	face_normals = face_normal_array(vertices, face_vertex_ids)
+	
+	# Each term computed using floats has a relative error of a few ulp, so the triple product can only be 0 when computed exactly if it is small compared to the terms. This skips the expensive exact test for almost all edges between faces which are not coplanar.
+	may_be_coplanar = \
+		(numpy.abs(numpy.sum(terms, axis = 0)) <= 1e-12 * numpy.sum(numpy.abs(terms), axis = 0)) \
+		& (numpy.sum(face_normals[numpy.arange(face_vertex_ids.size) // 3] * face_normals[opposite // 3], axis = 1) > 0)
+	
+	exact_coordinates = { }
+	
+	def get_exact_coordinate(view):
+		coordinate = exact_coordinates.get(view.vertex_id)
+		
+		if coordinate is None:
+			coordinate = exact_coordinates[view.vertex_id] = \
+				[fractions.Fraction(i) for i in view.vertex_coordinate.tolist()]
+		
+		return coordinate
+	
+	def get_edge_vectors(view):
+		a, b, c = [get_exact_coordinate(i) for i in [view, view.next, view.next.next]]
+		
+		return [j - i for i, j in zip(a, b)], [j - i for i, j in zip(a, c)]
+	
+	def is_coplanar(view):
+		"""
+		Return whether the faces on both sides of the view's edge lie in the same plane and have the same orientation.
+		"""
+		
+		if not may_be_coplanar[view.half_edge_id]:
+			return False
+		
+		opposite = view.opposite
+		u, v = get_edge_vectors(view)
+		opposite_u, opposite_v = get_edge_vectors(opposite)
+		apex_offset = [j - i for i, j in zip(get_exact_coordinate(view), get_exact_coordinate(opposite.next.next))]
+		normal = _cross_product(u, v)
+		opposite_normal = _cross_product(opposite_u, opposite_v)
+		
+		return sum(_triple_product_terms(u, v, apex_offset)) == 0 \
+			and sum(i * j for i, j in zip(normal, opposite_normal)) > 0
+	
+	patches = []
+	face_patches = { }
+	
+	# Iterated by id so that the patches are found in the same order on each run.
+	for face_id in range(polyhedron.face_count):
+		if face_id in face_patches:
+			continue
+		
+		face_view = polyhedron.face_by_id(face_id)
+		faces = []
+		boundary = []
+		patch_id = len(patches)
+		face_patches[face_view.face_id] = patch_id
+		stack = [face_view]
+		
+		while stack:
+			view = stack.pop()
+			faces.append(view)
+			
+			for i in view.face_cycle:
+				opposite = i.opposite
+				opposite_patch_id = face_patches.get(opposite.face_id)
+				
+				if opposite_patch_id is None and is_coplanar(i):
+					face_patches[opposite.face_id] = patch_id
+					stack.append(polyhedron.face_by_id(opposite.face_id))
+				elif opposite_patch_id != patch_id:
+					boundary.append(i)
+		
+		patches.append(PlanarPatch(faces, boundary))
+	
+	return patches
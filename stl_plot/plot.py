@@ -1,10 +1,10 @@
-import collections
-import fractions, math, numpy, os, tempfile, sys
+import asyncio, bisect, collections, itertools
+import fractions, hashlib, math, numpy, os, tempfile, sys
 import shutil
 from functools import reduce
 
-from stl_plot.fabricate import asymptote, polyhedra, linalg, geometry, paths
-from stl_plot import util
+from stl_plot.fabricate import asymptote, polyhedra, linalg, geometry, paths, decimation
+from stl_plot import util, sidecar, scenes, shading, engines, checkpoint
 
 
 def iter_progress(seq):
@@ -19,11 +19,14 @@ def iter_progress(seq):
 
 
 class Point(geometry.Point):
-	def __init__(self, *, z, **kwargs):
+	def __init__(self, *, z, vertex_id = None, **kwargs):
 		super().__init__(**kwargs)
 
 		self.z = z
 
+		self.vertex_id = vertex_id
+		"""Id of the vertex of the mesh at this point, by which lines ending at the same vertex are joined, or None for points inside of a segment. Vertices with the same x and y coordinates share an id."""
+
 
 class Segment(geometry.Segment):
 	def __init__(self, *, is_boundary, is_edge, **kwargs):
@@ -36,195 +39,1625 @@ class Segment(geometry.Segment):
 		"""Whether the segment represents a visible internal edge between two front faces."""
 
 
-class Line:
-	def __init__(self, *, points):
-		self.points = points
+class Patch(geometry.Polygon):
+	def __init__(self, *, plane, component = None, **kwargs):
+		super().__init__(**kwargs)
+
+		# Id of the connected component of the mesh containing the patch, or None if unknown.
+		self.component = component
+
+		# Three points spanning the plane of the patch.
+		p1, p2, p3 = plane
+
+		d1x = p2.x - p1.x
+		d1y = p2.y - p1.y
+		d2x = p3.x - p1.x
+		d2y = p3.y - p1.y
+		d1z = p2.z - p1.z
+		d2z = p3.z - p1.z
+
+		n = d1y * d2x - d1x * d2y
+
+		self.p1 = p1
+
+		# The vertices of faces facing the viewer are ordered counter-clockwise.
+		self.is_front = n < 0
+
+		# Range of depths covered by the patch.
+		self.min_z = min(i.start.z for i in self.boundary)
+		self.max_z = max(i.start.z for i in self.boundary)
+
+		if n == 0:
+			# The patch is seen edge-on and has no area.
+			self.dz_dx = None
+			self.dz_dy = None
+		else:
+			self.dz_dx = (d2z * d1y - d1z * d2y) / n
+			self.dz_dy = (d1z * d2x - d2z * d1x) / n
 
 	@property
-	def start(self):
-		return self.points[0]
+	def has_area(self):
+		return self.dz_dx is not None
+
+	def z_at(self, point: geometry.Point):
+		return self.p1.z \
+			+ self.dz_dx * (point.x - self.p1.x) \
+			+ self.dz_dy * (point.y - self.p1.y)
+
+
+class Line:
+	"""
+	A polyline whose ends are identified by keys, by which it is joined with other lines.
+
+	Joining and reversing lines takes constant time. A joined line keeps the lines it was joined from and is only flattened into a list of points when its points are accessed.
+	"""
+
+	def __init__(self, *, points = None, parts = None, start_key = None, end_key = None):
+		"""
+		Either points or parts must be given. The keys default to the first and the last point.
+
+		:param parts: Tuple of lines alternating with whether each line is reversed, which are concatenated to form this line.
+		"""
+
+		self._points = points
+		self._parts = parts
+		self.start_key = points[0] if start_key is None else start_key
+		self.end_key = points[-1] if end_key is None else end_key
 
 	@property
-	def end(self):
-		return self.points[-1]
+	def points(self):
+		if self._points is None:
+			points = []
+			stack = [(self, False)]
+
+			while stack:
+				line, is_reversed = stack.pop()
+
+				if line._parts is None:
+					line_points = line._points[::-1] if is_reversed else line._points
+
+					# The first point is the same as the last point of the previous line.
+					points.extend(line_points[1:] if points else line_points)
+				else:
+					parts = list(zip(line._parts[::2], line._parts[1::2]))
+
+					for part, part_reversed in parts if is_reversed else reversed(parts):
+						stack.append((part, part_reversed != is_reversed))
+
+			self._points = points
+			self._parts = None
+
+		return self._points
 
 	def reverse(self):
-		return type(self)(points=list(reversed(self.points)))
+		return type(self)(parts = (self, True), start_key = self.end_key, end_key = self.start_key)
 
 	@classmethod
 	def join(cls, line1, line2):
-		assert line1.end == line2.start
+		assert line1.end_key == line2.start_key
 
-		return cls(points=line1.points + line2.points[1:])
+		return cls(parts = (line1, False, line2, False), start_key = line1.start_key, end_key = line2.end_key)
 
 
 def join_lines(lines):
-	lines_by_ends = { }
+	"""
+	Join lines ending at the same key into longer lines, in time linear in the number of points.
+
+	At a key where more than two lines end, the lines are joined pairwise in an arbitrary order.
+	"""
+
+	lines = list(lines)
+
+	# Ends of lines are numbered 2 * i for the start and 2 * i + 1 for the end of line i. Each end is paired with at most one other end at the same key.
+	partners = [None] * (2 * len(lines))
+	unpaired_ends = { }
+
+	for i, line in enumerate(lines):
+		for end, key in (2 * i, line.start_key), (2 * i + 1, line.end_key):
+			other_end = unpaired_ends.pop(key, None)
+
+			if other_end is None:
+				unpaired_ends[key] = end
+			else:
+				partners[end] = other_end
+				partners[other_end] = end
+
+	is_used = [False] * len(lines)
+
+	def iter_chain(end):
+		"""
+		Yield the ends at which the lines of a chain of unused lines are entered, continuing from the specified end.
+		"""
 
-	for line in lines:
 		while True:
-			other_line = lines_by_ends.pop(line.end, None)
+			end = partners[end]
 
-			if other_line is None:
-				line = line.reverse()
-				other_line = lines_by_ends.pop(line.end, None)
+			if end is None or is_used[end // 2]:
+				return
 
-				if other_line is None:
-					break
+			is_used[end // 2] = True
 
-			if other_line.start != line.end:
-				other_line = other_line.reverse()
+			yield end
 
-			# May not exist, if the line is cyclic.
-			lines_by_ends.pop(other_line.end, None)
+			# Continue from the other end of the same line.
+			end ^= 1
 
-			line = Line.join(line, other_line)
+	result = []
 
-		for end in line.start, line.end:
-			# We may overwrite the start, if this line's start and end overlap.
-			# But we handle this case in the logic above.
-			lines_by_ends[end] = line
+	for i, line in enumerate(lines):
+		if not is_used[i]:
+			is_used[i] = True
 
-	return set(lines_by_ends.values())
+			# A line entered at its end is traversed in reverse.
+			preceding = [(lines[j // 2], j % 2 == 0) for j in iter_chain(2 * i)]
+			following = [(lines[j // 2], j % 2 == 1) for j in iter_chain(2 * i + 1)]
 
+			if preceding or following:
+				parts = preceding[::-1] + [(line, False)] + following
+				points = []
 
-def main(input_file, output_file):
-	projection = reduce(
-		numpy.dot,
-		[
-			# Look slightly from above
-			linalg.rotation_matrix(.06, [1, 0, 0]),
-			# Turn a bit to the right.
-			linalg.rotation_matrix(.04, [0, 1, 0]),
-			# Make upright.
-			linalg.rotation_matrix(-.25, [1, 0, 0])])
+				for part, is_reversed in parts:
+					part_points = part.points[::-1] if is_reversed else part.points
+					points.extend(part_points[1:] if points else part_points)
 
-	# Slightly more than 2 * pi divided by $fn.
-	min_angle = 6.3 / 32
-	
-	polyhedron = polyhedra.Polyhedron.load_from_stl(input_file)
+				start_part, start_reversed = parts[0]
+				end_part, end_reversed = parts[-1]
 
-	def project(vector):
-		return numpy.dot(projection, numpy.concatenate([vector, [0]]))[:3]
+				line = Line(
+					points = points,
+					start_key = start_part.end_key if start_reversed else start_part.start_key,
+					end_key = end_part.start_key if end_reversed else end_part.end_key)
 
-	def normal_z(view):
-		return project(polyhedra.face_normal(view))[2]
+			result.append(line)
 
-	def make_point(vertex_view : polyhedra.PolyhedronView):
-		x, y, z = map(fractions.Fraction, project(vertex_view.vertex_coordinate))
+	return result
 
-		return Point(x = x, y = y, z = z)
-	
-	def make_segment(edge_view : polyhedra.PolyhedronView):
-		dihedral_angle = polyhedra.dihedral_angle(edge_view, edge_view.opposite)
-		left_face_visible = normal_z(edge_view) > 0
-		right_face_visible = normal_z(edge_view.opposite) > 0
 
-		# We need to orient this so that the edge is closed (i.e. no points are missing because two segment ending at the same point).
-		if left_face_visible:
-			oriented_edge_view = edge_view
+def merge_ranges(segment_ranges):
+	"""
+	Sort the visible intervals of a segment and merge adjacent intervals.
+	"""
+
+	merged_ranges = []
+
+	for a, b in sorted(segment_ranges):
+		if merged_ranges and merged_ranges[-1][1] == a:
+			merged_ranges[-1] = merged_ranges[-1][0], b
 		else:
-			oriented_edge_view = edge_view.opposite
-
-		return Segment(
-			start = make_point(oriented_edge_view),
-			end = make_point(oriented_edge_view.opposite),
-			is_boundary = left_face_visible != right_face_visible,
-			is_edge = left_face_visible
-					  and right_face_visible
-					  and math.pi - dihedral_angle > min_angle)
-	
-	def make_simplex(face_view : polyhedra.PolyhedronView):
-		assert len(face_view.face_cycle) == 3
-		
-		return geometry.Simplex(
-			p1 = make_point(face_view),
-			p2 = make_point(face_view.next),
-			p3 = make_point(face_view.next.next))
-	
-	drawn_segments = []
-	border_segments = []
-	
-	util.log('Detecting edges ...')
-	
-	for segment in polyhedron.edges:
-		segment = make_segment(segment)
-		
-		if segment.is_edge or segment.is_boundary:
-			drawn_segments.append(segment)
-		
-		if segment.is_boundary:
-			border_segments.append(segment)
-
-	simplexes = sorted(
-		[make_simplex(i) for i in polyhedron.faces],
-		key=lambda x: x.p1.z)
-
-	def iter_border_intersections(segment: Segment):
-		yield fractions.Fraction(0)
-		yield fractions.Fraction(1)
-
-		for i in geometry.iter_intersections(border_segments, segment):
-			border_z = linalg.interpolate(i.segment_1.start.z, i.segment_1.end.z, i.t1)
-			drawn_z = linalg.interpolate(i.segment_2.start.z, i.segment_2.end.z, i.t2)
-
-			if drawn_z <= border_z:
-				yield i.t2
-
-	def has_face_intersections(point: Point):
-		for i in geometry.iter_simplex_intersections(simplexes, point):
-			simplex_p1_z = i.simplex.p1.z
-			simplex_p2_z = i.simplex.p2.z
-			simplex_p3_z = i.simplex.p3.z
-			simplex_z = simplex_p1_z + (simplex_p2_z - simplex_p1_z) * i.t1 + (simplex_p3_z - simplex_p1_z) * i.t2
-
-			if i.point.z < simplex_z:
-				return True
+			merged_ranges.append((a, b))
+
+	return merged_ranges
+
+
+def get_segment_line(segment: Segment, a, b, new_keys):
+	"""
+	Return the part of a segment between two positions as a line. Its ends are keyed by the vertex ids of the segment's end points. Ends inside of the segment get a new key from the iterator new_keys, as the adjacent visible intervals of a segment are merged and such an end is never joined with another line.
+	"""
+
+	return Line(
+		points = [point_on_segment(segment, a), point_on_segment(segment, b)],
+		start_key = segment.start.vertex_id if a == 0 else next(new_keys),
+		end_key = segment.end.vertex_id if b == 1 else next(new_keys))
+
+
+def iter_joined_lines(drawn_segments, visible_ranges):
+	"""
+	Join the visible parts of the drawn segments into lines like join_lines(), while the visible parts are being found.
+
+	visible_ranges yields a pair of the index of each drawn segment and a list of its visible intervals, as yielded by iter_visible_ranges(). Yields pairs of a style and a line as soon as neither end of the line can be extended anymore, i.e. when all drawn segments ending at the same vertex have been processed. Lines are only joined at vertices, see get_segment_line().
+	"""
+
+	# Number of drawn segments not yet processed, by the vertex ids they end at.
+	pending_counts = collections.Counter()
+
+	for i in drawn_segments:
+		pending_counts[i.start.vertex_id] += 1
+		pending_counts[i.end.vertex_id] += 1
+
+	# Lines which may still be extended, by their style and the key of each end.
+	lines_by_ends = { }
+
+	# Keys for the ends of lines inside of segments, which are distinct from all vertex ids.
+	new_keys = itertools.count(-1, -1)
+
+	def is_complete(line):
+		return not pending_counts[line.start_key] and not pending_counts[line.end_key]
+
+	def pop(style, line):
+		for end in line.start_key, line.end_key:
+			if lines_by_ends.get((style, end)) is line:
+				del lines_by_ends[style, end]
+
+	for index, segment_ranges in visible_ranges:
+		segment = drawn_segments[index]
+		style = get_style(segment.is_edge)
+		segment_ends = segment.start.vertex_id, segment.end.vertex_id
+
+		for i in segment_ends:
+			pending_counts[i] -= 1
+
+		for a, b in merge_ranges(segment_ranges):
+			line = get_segment_line(segment, a, b, new_keys)
+
+			while True:
+				other_line = lines_by_ends.get((style, line.end_key))
+
+				if other_line is not None:
+					pop(style, other_line)
+
+					if other_line.start_key != line.end_key:
+						other_line = other_line.reverse()
+
+					line = Line.join(line, other_line)
+				else:
+					other_line = lines_by_ends.get((style, line.start_key))
+
+					if other_line is None:
+						break
+
+					pop(style, other_line)
+
+					if other_line.end_key != line.start_key:
+						other_line = other_line.reverse()
+
+					line = Line.join(other_line, line)
+
+			if is_complete(line):
+				yield style, line
+			else:
+				for end in line.start_key, line.end_key:
+					lines_by_ends[style, end] = line
+
+		# Lines ending at the end points of this segment may be complete now.
+		for end in segment_ends:
+			if not pending_counts[end]:
+				for i in get_style(False), get_style(True):
+					line = lines_by_ends.get((i, end))
+
+					if line is not None and is_complete(line):
+						pop(i, line)
+
+						yield i, line
+
+	# Lines are only left if visible_ranges did not yield all drawn segments.
+	remaining_lines = { id(line): (style, line) for (style, _), line in lines_by_ends.items() }
+
+	yield from remaining_lines.values()
+
+
+def iter_border_intersections(border_segments, segment: Segment):
+	yield fractions.Fraction(0)
+	yield fractions.Fraction(1)
+
+	for i in geometry.iter_intersections(border_segments, segment):
+		border_z = linalg.interpolate(i.segment_1.start.z, i.segment_1.end.z, i.t1)
+		drawn_z = linalg.interpolate(i.segment_2.start.z, i.segment_2.end.z, i.t2)
+
+		if drawn_z <= border_z:
+			yield i.t2
+
+
+class BorderCrossing:
+	def __init__(self, *, t, delta):
+		self.t = t
+		"""Position of the crossing on the drawn segment."""
+
+		self.delta = delta
+		"""Change of the quantitative invisibility when passing the crossing in the direction of the drawn segment, or None if the change cannot be determined from the crossing alone."""
+
+
+def iter_border_crossings(border_segments, segment: Segment):
+	"""
+	Iterate the places where the specified segment passes behind or through a border segment, including crossings at the end points of both segments.
+
+	Border segments are oriented so that the front face adjacent to them lies to their left. Passing behind a border segment from its right to its left side thus increases the quantitative invisibility by one. Crossings through the end points of a border segment or at the same depth are ambiguous, as are border segments lying on the same line as the drawn segment. Border segments which merely share an end point with the drawn segment are skipped, as their effect is local to the faces around that vertex.
+	"""
+
+	sx = segment.start.x
+	sy = segment.start.y
+	dx = segment.end.x - sx
+	dy = segment.end.y - sy
+
+	if dx == 0 and dy == 0:
+		# The segment is seen end-on.
+		yield BorderCrossing(t = fractions.Fraction(0), delta = None)
+		yield BorderCrossing(t = fractions.Fraction(1), delta = None)
+
+		return
+
+	def is_shared_end(border, t, u):
+		return t in (0, 1) and u in (0, 1) \
+			and (segment.start if t == 0 else segment.end) is (border.start if u == 0 else border.end)
+
+	for i in border_segments:
+		if i is segment:
+			continue
+
+		ox = i.start.x - sx
+		oy = i.start.y - sy
+		ex = i.end.x - i.start.x
+		ey = i.end.y - i.start.y
+
+		# Positive if the drawn segment runs towards the left side of the border segment.
+		v = ex * dy - ey * dx
+
+		if v == 0:
+			if ox * dy - oy * dx == 0:
+				# Both segments lie on the same line. Mark the ends of the overlap as ambiguous.
+				length_squared = dx * dx + dy * dy
+				t1 = (ox * dx + oy * dy) / length_squared
+				t2 = ((ox + ex) * dx + (oy + ey) * dy) / length_squared
+				t_min = max(min(t1, t2), 0)
+				t_max = min(max(t1, t2), 1)
+
+				if t_min < t_max:
+					yield BorderCrossing(t = t_min, delta = None)
+					yield BorderCrossing(t = t_max, delta = None)
+				elif t_min == t_max and not is_shared_end(i, t_min, 0 if t_min == t1 else 1):
+					yield BorderCrossing(t = t_min, delta = None)
+		else:
+			t = (oy * ex - ox * ey) / v
+			u = (oy * dx - ox * dy) / v
+
+			if 0 <= t <= 1 and 0 <= u <= 1 and not is_shared_end(i, t, u):
+				border_z = linalg.interpolate(i.start.z, i.end.z, u)
+				drawn_z = linalg.interpolate(segment.start.z, segment.end.z, t)
+
+				if drawn_z < border_z and 0 < u < 1:
+					yield BorderCrossing(t = t, delta = 1 if v > 0 else -1)
+				elif drawn_z <= border_z:
+					yield BorderCrossing(t = t, delta = None)
+
+
+class _ComponentPatches:
+	"""
+	The patches of a connected component of the mesh, sorted by their maximum depth, together with the bounding box and maximum depth of the component.
+	"""
+
+	def __init__(self, patches):
+		# Nearest patches first, as these are the most likely to hide a point.
+		self.patches = sorted(patches, key = lambda x: x.max_z, reverse = True)
+
+		# Negated, so that the list is sorted in ascending order as needed by bisect.
+		self.negated_max_zs = [-i.max_z for i in self.patches]
+
+		self.max_z = self.patches[0].max_z
+		self.min_x = min(i.min_x for i in patches)
+		self.max_x = max(i.max_x for i in patches)
+		self.min_y = min(i.min_y for i in patches)
+		self.max_y = max(i.max_y for i in patches)
+
+
+class PatchIndex:
+	"""
+	Patches grouped by the connected component of the mesh they belong to and sorted by their maximum depth, so that only the patches reaching in front of a point need to be tested when checking whether that point is hidden.
+
+	Components whose bounding box does not contain the point or which lie entirely behind it are skipped without testing any of their patches. Patches without a component are treated as a single component.
+	"""
+
+	def __init__(self, patches):
+		patches_by_component = collections.defaultdict(list)
+
+		for i in patches:
+			patches_by_component[i.component].append(i)
+
+		# Nearest components first.
+		self._components = sorted(
+			map(_ComponentPatches, patches_by_component.values()),
+			key = lambda x: x.max_z,
+			reverse = True)
+
+	def iter_patches_in_front(self, point: Point):
+		"""
+		Iterate the patches which have a part in front of the specified point, nearest first within each component.
+		"""
+
+		for i in self._components:
+			if i.max_z <= point.z:
+				# This and all following components lie entirely behind the point.
+				break
+
+			# Patches only contain the points strictly inside of them.
+			if i.min_x < point.x < i.max_x and i.min_y < point.y < i.max_y:
+				count = bisect.bisect_left(i.negated_max_zs, -point.z)
+
+				yield from itertools.islice(i.patches, count)
+
+
+def has_face_intersections(patch_index: PatchIndex, point: Point):
+	for i in geometry.iter_polygon_intersections(patch_index.iter_patches_in_front(point), point):
+		if i.point.z < i.polygon.z_at(i.point):
+			return True
+	else:
+		return False
+
+
+def count_faces_in_front(patch_index: PatchIndex, point: Point):
+	"""
+	Return the number of patches hiding the specified point.
+	"""
+
+	return sum(
+		1 for i in geometry.iter_polygon_intersections(patch_index.iter_patches_in_front(point), point)
+		if i.point.z < i.polygon.z_at(i.point))
+
+
+def point_on_segment(segment: Segment, t):
+	# The end points are returned as is, so that they keep their vertex ids.
+	if t == 0:
+		return segment.start
+	elif t == 1:
+		return segment.end
+
+	return Point(
+		x = linalg.interpolate(segment.start.x, segment.end.x, t),
+		y = linalg.interpolate(segment.start.y, segment.end.y, t),
+		z = linalg.interpolate(segment.start.z, segment.end.z, t))
+
+
+def get_style(is_edge):
+	"""
+	Return the style of the lines of a drawn segment.
+	"""
+
+	if is_edge:
+		return 'blue + 0.05mm'
+	else:
+		return 'black + 0.05mm'
+
+
+def get_visible_lines(drawn_segments, visible_ranges):
+	"""
+	Return the lines of the visible parts of the drawn segments, given as a list of pairs of positions along each segment, as lists of lines indexed by style.
+	"""
+
+	lines_by_style = collections.defaultdict(list)
+	new_keys = itertools.count(-1, -1)
+
+	for segment, segment_ranges in zip(drawn_segments, visible_ranges):
+		lines_by_style[get_style(segment.is_edge)].extend(
+			get_segment_line(segment, a, b, new_keys) for a, b in merge_ranges(segment_ranges))
+
+	return lines_by_style
+
+
+def collect_visible_ranges(drawn_segments, visible_ranges):
+	"""
+	Return a list containing the visible intervals of each drawn segment, given as pairs of the index of a segment and its visible intervals, as yielded by iter_visible_ranges().
+	"""
+
+	result = [[] for _ in drawn_segments]
+
+	for i, segment_ranges in visible_ranges:
+		result[i] = segment_ranges
+
+	return result
+
+
+def iter_visible_ranges(drawn_segments, border_segments, patches, bounds = None, checkpoint = None):
+	"""
+	Find the visible parts of the drawn segments. Yields a pair of the index of each drawn segment and a list of pairs of positions along the segment delimiting its visible parts.
+
+	If bounds is given as (min_x, min_y, max_x, max_y), only the parts of the segments inside that rectangle are considered. Segments lying on its maximum x or y edge are not considered to be inside of it, see geometry.clip_segment().
+
+	If a checkpoint.Checkpoint instance is given, the segments it contains are not processed again and the visible parts of each segment processed are added to it.
+	"""
+
+	patch_index = PatchIndex(patches)
+
+	for i, segment in enumerate(iter_progress(drawn_segments)):
+		if checkpoint is not None and i in checkpoint.completed:
+			yield i, checkpoint.completed[i]
+
+			continue
+
+		if bounds is None:
+			t_min, t_max = fractions.Fraction(0), fractions.Fraction(1)
+		else:
+			clipped = geometry.clip_segment(segment, *bounds, half_open = True)
+
+			if clipped is None:
+				yield i, []
+
+				continue
+
+			t_min, t_max = clipped
+
+		positions = sorted(
+			set(i for i in iter_border_intersections(border_segments, segment) if t_min < i < t_max)
+			| { t_min, t_max })
+
+		segment_ranges = [
+			(a, b) for a, b in zip(positions[:-1], positions[1:])
+			if not has_face_intersections(patch_index, point_on_segment(segment, (a + b) / 2))]
+
+		if checkpoint is not None:
+			checkpoint.add(i, segment_ranges)
+
+		yield i, segment_ranges
+
+
+def find_visible_lines(drawn_segments, border_segments, patches, bounds = None, checkpoint = None):
+	"""
+	Return the visible parts of the drawn segments as lists of lines indexed by style, see iter_visible_ranges().
+	"""
+
+	return get_visible_lines(
+		drawn_segments,
+		collect_visible_ranges(
+			drawn_segments,
+			iter_visible_ranges(drawn_segments, border_segments, patches, bounds, checkpoint)))
+
+
+def get_line_key(segment: Segment):
+	"""
+	Return a key identifying the line through the start and end point of a segment in the drawing, which is the same for all segments on that line, or None if the segment is seen end-on.
+	"""
+
+	a = segment.end.y - segment.start.y
+	b = segment.start.x - segment.end.x
+
+	if a == 0 and b == 0:
+		return None
+
+	# Scaled so that the first non-zero coefficient is 1.
+	scale = a if a != 0 else b
+	a /= scale
+	b /= scale
+
+	return a, b, a * segment.start.x + b * segment.start.y
+
+
+def iter_visible_ranges_qi(drawn_segments, border_segments, patches, bounds = None, checkpoint = None):
+	"""
+	Alternative to iter_visible_ranges(), which propagates the quantitative invisibility along chains of connected segments (Appel's algorithm).
+
+	The quantitative invisibility of a point is the number of front faces hiding it. It is computed exactly for one point of each chain and changes only where a segment passes behind a border segment, as reported by iter_border_crossings(), or at a vertex, where only the faces around the vertex need to be considered. Where this is ambiguous, and at the borders of the tile, it is computed exactly again.
+
+	This assumes a closed mesh whose faces do not intersect each other and whose patches contain their vertices. Segments lying exactly behind a boundary segment of a front patch are tested like in iter_visible_ranges() instead, see get_line_key().
+
+	A checkpoint is used as by iter_visible_ranges(). The quantitative invisibility is not propagated through the vertices of segments restored from the checkpoint. The segments are yielded in the order in which the quantitative invisibility is propagated.
+	"""
+
+	# Behind a point hidden by any face, there is always a front face hiding it too, unless the point lies behind the boundary of a front patch. Only the segments lying behind such a boundary need all patches.
+	front_patches = [i for i in patches if i.is_front]
+	patch_index = PatchIndex(front_patches)
+	all_patch_index = None
+
+	# The boundary segments of the front patches, by the line on which they lie in the drawing.
+	boundaries_by_line = collections.defaultdict(list)
+
+	for patch in front_patches:
+		for i in patch.boundary:
+			key = get_line_key(i)
+
+			if key is not None:
+				boundaries_by_line[key].append(i)
+
+	def lies_behind_boundary(segment: Segment):
+		"""
+		Return whether a part of the segment lies exactly behind a boundary segment of a front patch other than the segment itself. A point there is not inside of any front patch, even if it is hidden by a back face.
+		"""
+
+		dx = segment.end.x - segment.start.x
+		dy = segment.end.y - segment.start.y
+		length_squared = dx * dx + dy * dy
+
+		for i in boundaries_by_line.get(get_line_key(segment), []):
+			if { id(i.start), id(i.end) } == { id(segment.start), id(segment.end) }:
+				continue
+
+			t1 = ((i.start.x - segment.start.x) * dx + (i.start.y - segment.start.y) * dy) / length_squared
+			t2 = ((i.end.x - segment.start.x) * dx + (i.end.y - segment.start.y) * dy) / length_squared
+
+			overlap = max(min(t1, t2), 0), min(max(t1, t2), 1)
+
+			if overlap[0] >= overlap[1]:
+				continue
+
+			# The depths of both segments change linearly along the overlap, so it is enough to compare them at its ends.
+			for t in overlap:
+				if linalg.interpolate(i.start.z, i.end.z, (t - t1) / (t2 - t1)) > linalg.interpolate(segment.start.z, segment.end.z, t):
+					return True
+
+		return False
+
+	# The patches around each vertex, by the id of the vertex's point, together with the preceding and following points on the boundary of the patch.
+	patches_by_point = collections.defaultdict(list)
+
+	# Ids of the points visited more than once by the boundary of a single patch.
+	pinched_points = set()
+
+	for patch in front_patches:
+		segments_by_start = { }
+
+		for i in patch.boundary:
+			if id(i.start) in segments_by_start:
+				pinched_points.add(id(i.start))
+
+			segments_by_start[id(i.start)] = i
+
+		for i in patch.boundary:
+			patches_by_point[id(i.end)].append((patch, i.start, segments_by_start[id(i.end)].end))
+
+	def count_faces_at_vertex(point: Point, towards: Point):
+		"""
+		Return the number of patches around the vertex at the specified point which hide the points on the segment from it to towards arbitrarily close to the vertex, or None if this cannot be determined.
+		"""
+
+		if id(point) in pinched_points:
+			return None
+
+		dx = towards.x - point.x
+		dy = towards.y - point.y
+		dz = towards.z - point.z
+		count = 0
+
+		for patch, previous, next in patches_by_point[id(point)]:
+			ax = previous.x - point.x
+			ay = previous.y - point.y
+			bx = next.x - point.x
+			by = next.y - point.y
+
+			# The inside of the patch lies counter-clockwise from the direction to the next point up to the direction to the previous point.
+			sector = bx * ay - by * ax
+			cross_b = bx * dy - by * dx
+			cross_a = dx * ay - dy * ax
+
+			if sector > 0:
+				inside = cross_b > 0 and cross_a > 0
+			elif sector < 0 or ax * bx + ay * by < 0:
+				inside = cross_b > 0 or cross_a > 0
+			else:
+				return None
+
+			if inside:
+				# Faces merged into a patch are not exactly coplanar, so the plane of the patch may miss the vertex.
+				if patch.z_at(point) != point.z:
+					return None
+
+				if patch.dz_dx * dx + patch.dz_dy * dy > dz:
+					count += 1
+
+		return count
+
+	ranges = []
+	crossings = []
+
+	# Indices of the segments by the ids of their end points.
+	segments_by_point = collections.defaultdict(list)
+
+	# Ids of the points where the quantitative invisibility cannot be carried over from one segment to the next.
+	ambiguous_points = set()
+
+	# Indices of the segments whose visible parts are found without the quantitative invisibility.
+	exact_indices = set()
+
+	for i, segment in enumerate(iter_progress(drawn_segments)):
+		if checkpoint is not None and i in checkpoint.completed:
+			# The segment is neither processed nor entered from its neighbors, which compute their quantitative invisibility exactly instead.
+			ranges.append(None)
+			crossings.append(None)
+			ambiguous_points.add(id(segment.start))
+			ambiguous_points.add(id(segment.end))
+
+			continue
+
+		if bounds is None:
+			t_min, t_max = fractions.Fraction(0), fractions.Fraction(1)
+		else:
+			clipped = geometry.clip_segment(segment, *bounds, half_open = True)
+
+			if clipped is None:
+				ranges.append(None)
+				crossings.append(None)
+
+				continue
+
+			t_min, t_max = clipped
+
+		if get_line_key(segment) is not None and lies_behind_boundary(segment):
+			exact_indices.add(i)
+
+		segment_crossings = list(iter_border_crossings(border_segments, segment))
+
+		for j in segment_crossings:
+			if j.t == 0:
+				ambiguous_points.add(id(segment.start))
+			elif j.t == 1:
+				ambiguous_points.add(id(segment.end))
+
+		ranges.append((t_min, t_max))
+		crossings.append(segment_crossings)
+		segments_by_point[id(segment.start)].append(i)
+		segments_by_point[id(segment.end)].append(i)
+
+	for i, segment_range in enumerate(ranges):
+		if segment_range is None:
+			if checkpoint is not None and i in checkpoint.completed:
+				yield i, checkpoint.completed[i]
+			else:
+				yield i, []
+
+	interval_count = 0
+	computed_count = 0
+
+	def propagate(index, invisibility, reverse):
+		"""
+		Find the visible parts of a segment given the quantitative invisibility at the end it is entered from, or None. Returns the quantitative invisibility at the other end, or None, and the visible intervals of the segment.
+		"""
+
+		nonlocal interval_count, computed_count, all_patch_index
+
+		segment = drawn_segments[index]
+		t_min, t_max = ranges[index]
+
+		if index in exact_indices:
+			if all_patch_index is None:
+				all_patch_index = PatchIndex(patches)
+
+			positions = sorted(
+				set(i for i in iter_border_intersections(border_segments, segment) if t_min < i < t_max)
+				| { t_min, t_max })
+
+			return None, [
+				(a, b) for a, b in zip(positions[:-1], positions[1:])
+				if not has_face_intersections(all_patch_index, point_on_segment(segment, (a + b) / 2))]
+		deltas = collections.defaultdict(int)
+		ambiguous_positions = set()
+
+		for i in crossings[index]:
+			if i.delta is None:
+				ambiguous_positions.add(i.t)
+			else:
+				deltas[i.t] += i.delta
+
+		positions = sorted(
+			set(i.t for i in crossings[index] if t_min < i.t < t_max) | { t_min, t_max })
+
+		intervals = list(zip(positions[:-1], positions[1:]))
+
+		if reverse:
+			intervals.reverse()
+			sign = -1
 		else:
-			return False
+			sign = 1
+
+		# Only the ends of the whole segment are shared with other segments.
+		is_whole = (t_min, t_max) == (0, 1)
+
+		if not is_whole:
+			invisibility = None
+
+		segment_ranges = []
+
+		for a, b in intervals:
+			interval_count += 1
+
+			if invisibility is None:
+				computed_count += 1
+				invisibility = count_faces_in_front(patch_index, point_on_segment(segment, (a + b) / 2))
+
+			if invisibility == 0:
+				segment_ranges.append((a, b))
+
+			position = a if reverse else b
+
+			if position in ambiguous_positions:
+				invisibility = None
+			elif invisibility is not None:
+				invisibility += sign * deltas[position]
+
+		if not is_whole:
+			return None, segment_ranges
+
+		return invisibility, segment_ranges
 
-	def point_on_segment(segment: Segment, t):
-		return Point(
-			x = linalg.interpolate(segment.start.x, segment.end.x, t),
-			y = linalg.interpolate(segment.start.y, segment.end.y, t),
-			z = linalg.interpolate(segment.start.z, segment.end.z, t))
+	def enter(index, invisibility, point):
+		"""
+		Propagate the quantitative invisibility from one segment through the vertex at the specified point into the segment with the specified index.
+		"""
+
+		segment = drawn_segments[index]
+		reverse = segment.end is point
+
+		if invisibility is not None:
+			entered_count = count_faces_at_vertex(point, segment.start if reverse else segment.end)
+
+			if entered_count is None:
+				invisibility = None
+			else:
+				invisibility += entered_count
+
+		return index, invisibility, reverse
+
+	done = [i is None for i in ranges]
+
+	for i in range(len(drawn_segments)):
+		if done[i]:
+			continue
+
+		done[i] = True
+		stack = [(i, None, False)]
+
+		while stack:
+			index, invisibility, reverse = stack.pop()
+			invisibility, segment_ranges = propagate(index, invisibility, reverse)
+
+			if checkpoint is not None:
+				checkpoint.add(index, segment_ranges)
+
+			yield index, segment_ranges
+
+			segment = drawn_segments[index]
+			point, other_point = (segment.start, segment.end) if reverse else (segment.end, segment.start)
+
+			if invisibility is not None and id(point) not in ambiguous_points:
+				# Not counting the faces around the vertex, which only hide points close to it.
+				left_count = count_faces_at_vertex(point, other_point)
+
+				if left_count is not None:
+					for j in segments_by_point[id(point)]:
+						if not done[j]:
+							done[j] = True
+							stack.append(enter(j, invisibility - left_count, point))
 
-	util.log('Detecting boundary intersections ...')
 	util.log(
-		'border: {}, draw: {}, simplexes: {}',
-		len(border_segments),
-		len(drawn_segments),
-		len(simplexes))
+		'Computed quantitative invisibility of {} of {} intervals.',
+		computed_count,
+		interval_count)
+
+
+def find_visible_lines_qi(drawn_segments, border_segments, patches, bounds = None, checkpoint = None):
+	"""
+	Like find_visible_lines(), but using iter_visible_ranges_qi().
+	"""
+
+	return get_visible_lines(
+		drawn_segments,
+		collect_visible_ranges(
+			drawn_segments,
+			iter_visible_ranges_qi(drawn_segments, border_segments, patches, bounds, checkpoint)))
+
+
+def get_polylines(lines_by_style):
+	"""
+	Join the lines returned by find_visible_lines() into polylines, as returned by engines.Engine.find_lines().
+	"""
+
+	return {
+		style: [
+			numpy.array([(i.x, i.y) for i in line.points], dtype = numpy.float64)
+			for line in join_lines(lines)]
+		for style, lines in lines_by_style.items()}
+
+
+def merge_polylines(results):
+	"""
+	Merge multiple dicts of polylines by style, as returned by engines.Engine.find_lines(), joining the polylines which end at the same point.
+	"""
 
 	lines_by_style = collections.defaultdict(list)
 
-	for segment in iter_progress(drawn_segments):
-		positions = sorted(set(iter_border_intersections(segment)))
+	for polylines_by_style in results:
+		for style, polylines in polylines_by_style.items():
+			lines_by_style[style].extend(Line(points = list(map(tuple, i.tolist()))) for i in polylines)
 
-		for a, b in zip(positions[:-1], positions[1:]):
-			if not has_face_intersections(point_on_segment(segment, (a + b) / 2)):
-				if segment.is_edge:
-					style = 'blue + 0.05mm'
-				else:
-					style = 'black + 0.05mm'
+	return {
+		style: [numpy.array(line.points, dtype = numpy.float64) for line in join_lines(lines)]
+		for style, lines in lines_by_style.items()}
+
+
+def write_lines(file: asymptote.AsymptoteFile, polylines_by_style):
+	for style, polylines in polylines_by_style.items():
+		file.write('draw({}, {});', paths.path_array(polylines), style)
+
+
+# Maximum number of polylines drawn by a single statement written by write_line_stream().
+_polylines_per_statement = 1000
+
+
+def write_line_stream(file: asymptote.AsymptoteFile, styled_polylines):
+	"""
+	Write polylines given as pairs of a style and an array of shape (n, 2), as yielded by engines.Engine.iter_lines(), without keeping all of them in memory.
+	"""
+
+	polylines_by_style = collections.defaultdict(list)
+
+	for style, polyline in styled_polylines:
+		polylines = polylines_by_style[style]
+		polylines.append(polyline)
+
+		if len(polylines) >= _polylines_per_statement:
+			write_lines(file, { style: polylines })
+			polylines.clear()
+
+	write_lines(file, { k: v for k, v in polylines_by_style.items() if v })
+
+
+# Estimates of the memory used by the Fraction-based objects created for each face and each drawn segment of a tile, including the data structures built by the engines. Measured using tracemalloc as the peak memory used by write_tiled() for single tiles of meshes with a few thousand faces, taking the largest values of the engines exact, qi and clip (about 2000 and 700 bytes) rounded up.
+_tile_bytes_per_face = 2048
+_tile_bytes_per_segment = 1024
+
+# Tiles are not split further than this, even if they exceed the memory budget.
+_max_tile_depth = 12
+
+
+def classify_edges(face_normals, left_faces, right_faces, view_direction, min_angle):
+	"""
+	Classify edges by the normals of the faces on both sides of each edge.
+
+	Returns three boolean arrays, whether the left face of each edge is visible, whether the edge lies on the boundary between front and back faces and whether it is a visible crease with an angle of more than min_angle between the normals of the two faces.
+	"""
+
+	normal_z = numpy.dot(face_normals, view_direction)
+	left_visible = normal_z[left_faces] > 0
+	right_visible = normal_z[right_faces] > 0
+	cos_angles = numpy.sum(face_normals[left_faces] * face_normals[right_faces], axis = 1)
+
+	is_boundary = left_visible != right_visible
+	is_edge = left_visible & right_visible & (cos_angles < math.cos(min_angle))
+
+	return left_visible, is_boundary, is_edge
+
+
+def _overlapping(boxes, bounds):
+	"""
+	Return which of the boxes overlap the tile with the specified bounds. Tiles include their minimum edges but not their maximum edges, as when clipping the drawn segments to a tile.
+	"""
+
+	min_x, min_y, max_x, max_y = bounds
+
+	return (boxes[:, 0] < max_x) & (boxes[:, 2] >= min_x) \
+		& (boxes[:, 1] < max_y) & (boxes[:, 3] >= min_y)
+
+
+def iter_tiles(bounds, face_boxes, segment_boxes, budget):
+	"""
+	Split the specified rectangle into tiles whose estimated memory usage is below budget.
+
+	Yields the bounds of each tile together with boolean masks of the faces and segments overlapping it.
+	"""
+
+	stack = [(bounds, 0)]
+
+	while stack:
+		bounds, depth = stack.pop()
+		face_mask = _overlapping(face_boxes, bounds)
+		segment_mask = _overlapping(segment_boxes, bounds)
+		size = numpy.count_nonzero(face_mask) * _tile_bytes_per_face \
+			+ numpy.count_nonzero(segment_mask) * _tile_bytes_per_segment
+
+		if size > budget and depth < _max_tile_depth:
+			min_x, min_y, max_x, max_y = bounds
+			mid_x = (min_x + max_x) / 2
+			mid_y = (min_y + max_y) / 2
+
+			for x1, x2 in (min_x, mid_x), (mid_x, max_x):
+				for y1, y2 in (min_y, mid_y), (mid_y, max_y):
+					stack.append(((x1, y1, x2, y2), depth + 1))
+		else:
+			if size > budget:
+				util.log('Warning: Tile exceeds the memory budget: {} bytes', size)
+
+			yield bounds, face_mask, segment_mask
+
+
+def write_tiled(file: asymptote.AsymptoteFile, mesh_arrays: sidecar.MeshArrays, projection, min_angle, max_memory, engine: engines.Engine):
+	"""
+	Plot the mesh tile by tile, only keeping the Fraction-based objects of a single tile in memory.
+
+	The whole mesh is only kept as compact numpy arrays. Unlike SegmentArrays.to_objects(), each face becomes a patch of its own and the patches have no connected component, as merging coplanar faces and finding the components needs the whole mesh as a Polyhedron instance. The engines therefore test more patches per segment than when not rendering in tiles.
+	"""
+
+	vertices = mesh_arrays.vertices
+	faces = mesh_arrays.faces
+	projected = project_vertices(vertices, projection)
+
+	util.log('Detecting edges ...')
+
+	edges, left_faces, right_faces = polyhedra.edge_face_arrays(faces, mesh_arrays.opposite)
+	left_visible, is_boundary, is_edge = classify_edges(
+		mesh_arrays.face_normals, left_faces, right_faces, projection[2, :3], min_angle)
+	drawn = is_boundary | is_edge
+
+	# Orient the edges as in make_segment().
+	edges = numpy.where(left_visible[:, None], edges, edges[:, ::-1])[drawn]
+
+	drawn_segment_array = geometry.SegmentArray(
+		geometry.PointArray.from_array(projected[edges[:, 0]]),
+		geometry.PointArray.from_array(projected[edges[:, 1]]),
+		is_boundary[drawn],
+		is_edge[drawn])
+
+	del edges, left_faces, right_faces, left_visible, is_boundary, is_edge, drawn
+
+	face_boxes = geometry.bounding_boxes(
+		*(geometry.PointArray.from_array(projected[faces[:, i]]) for i in range(3)))
+	segment_boxes = drawn_segment_array.bounding_boxes()
+
+	base_size = drawn_segment_array.nbytes + sum(i.nbytes for i in [
+		vertices, faces, projected, face_boxes, segment_boxes])
+
+	if base_size >= max_memory:
+		raise util.UserError('The mesh needs at least {} bytes of memory.', base_size)
+
+	# The maximum edges are moved outwards by the smallest possible amount, as they are not part of the tiles.
+	bounds = tuple(numpy.concatenate([
+		face_boxes[:, :2].min(axis = 0),
+		numpy.nextafter(face_boxes[:, 2:].max(axis = 0), numpy.inf)]).tolist())
+
+	tiles = iter_tiles(bounds, face_boxes, segment_boxes, max_memory - base_size)
+
+	for i, (tile_bounds, face_mask, segment_mask) in enumerate(tiles):
+		if not numpy.any(segment_mask):
+			continue
+
+		# Points by coordinates, so that each vertex is converted to Fractions only once per tile.
+		points = { }
+
+		# Vertex ids by x and y coordinates, numbered per tile.
+		vertex_ids = { }
+
+		def make_point(coordinates):
+			point = points.get(coordinates)
+
+			if point is None:
+				x, y, z = map(fractions.Fraction, coordinates)
+				vertex_id = vertex_ids.setdefault(coordinates[:2], len(vertex_ids))
+				point = points[coordinates] = Point(x = x, y = y, z = z, vertex_id = vertex_id)
+
+			return point
+
+		tile_segment_array = drawn_segment_array[segment_mask]
+
+		drawn_segments = [
+			Segment(
+				start = make_point(start),
+				end = make_point(end),
+				is_boundary = is_boundary,
+				is_edge = is_edge)
+			for start, end, is_boundary, is_edge in zip(
+				tile_segment_array.starts.iter_coordinates(),
+				tile_segment_array.ends.iter_coordinates(),
+				tile_segment_array.is_boundary.tolist(),
+				tile_segment_array.is_edge.tolist())]
+
+		border_segments = [j for j in drawn_segments if j.is_boundary]
+
+		def make_patch(face):
+			corners = [make_point(tuple(projected[j].tolist())) for j in face]
+
+			return Patch(
+				boundary = [
+					geometry.Segment(start = a, end = b)
+					for a, b in zip(corners, corners[1:] + corners[:1])],
+				plane = corners)
+
+		patches = [j for j in map(make_patch, faces[face_mask].tolist()) if j.has_area]
+
+		util.log(
+			'Tile {}: border: {}, draw: {}, faces: {}',
+			i + 1,
+			len(border_segments),
+			len(drawn_segments),
+			len(patches))
+
+		polylines_by_style = engine.find_tile_lines(
+			drawn_segments,
+			border_segments,
+			patches,
+			tuple(map(fractions.Fraction, tile_bounds)))
+
+		write_lines(file, polylines_by_style)
+
+
+# Maximum deviation of the entries of the product of a camera matrix and its transpose from the identity matrix. Allows for rotation matrices whose entries are given with only a few digits.
+_camera_tolerance = 1e-3
+
+
+def get_projection(camera):
+	"""
+	Return the 4x4 matrix transforming the model's coordinate system into the drawing's coordinate system for the specified camera setting.
+
+	The camera is either given as a list containing the azimuth and elevation in degrees, or as a list containing the 9 or 16 entries of a 3x3 or 4x4 matrix in row-major order. The matrix needs to be a rotation, as the visibility of the faces is determined from the direction of the z axis of the drawing in the model's coordinate system, so a 4x4 matrix cannot contain a translation or perspective part.
+	"""
+
+	if len(camera) == 2:
+		azimuth, elevation = camera
+
+		return reduce(
+			numpy.dot,
+			[
+				# Look from above.
+				linalg.rotation_matrix(elevation / 360, [1, 0, 0]),
+				# Turn to the right.
+				linalg.rotation_matrix(azimuth / 360, [0, 1, 0]),
+				# Make upright.
+				linalg.rotation_matrix(-.25, [1, 0, 0])])
+
+	matrix = numpy.array(camera, dtype = numpy.float64)
+	matrix = numpy.reshape(matrix, (3, 3) if len(camera) == 9 else (4, 4))
+	rotation = matrix[:3, :3]
+
+	if matrix.shape == (4, 4) and not numpy.array_equal(matrix[3], [0, 0, 0, 1]):
+		raise util.UserError('The camera matrix must not contain a perspective part.')
+
+	if matrix.shape == (4, 4) and numpy.any(matrix[:3, 3]):
+		raise util.UserError('The camera matrix must not contain a translation.')
+
+	if numpy.abs(numpy.dot(rotation, rotation.T) - numpy.eye(3)).max() > _camera_tolerance or numpy.linalg.det(rotation) < 0:
+		raise util.UserError('The camera matrix must be a rotation.')
+
+	# Remove the rounding errors of the entries, so that the view direction is exactly perpendicular to the drawing.
+	u, _, vt = numpy.linalg.svd(rotation)
+	projection = numpy.eye(4)
+	projection[:3, :3] = numpy.dot(u, vt)
+
+	return projection
+
+
+def project_vertices(vertices, projection):
+	"""
+	Transform an array of vertex coordinates of shape (n, 3) into the drawing's coordinate system, where larger z coordinates are nearer to the viewer.
+	"""
+
+	return numpy.dot(vertices, projection[:3, :3].T)
+
+
+class SegmentArrays:
+	"""
+	The drawn segments of a mesh seen through a camera and the patches which can hide them, as arrays of vertex ids.
+
+	This is the input of the Fraction-based engines in a compact form, which can be stored and converted into Fraction-based objects for any subset of the drawn segments.
+	"""
+
+	array_names = [
+		'projected', 'segments', 'is_boundary', 'is_edge', 'patch_segments', 'patch_offsets', 'patch_planes', 'patch_components']
+
+	def __init__(self, *, projected, segments, is_boundary, is_edge, patch_segments, patch_offsets, patch_planes, patch_components):
+		self.projected = projected
+		"""Array of shape (n, 3) containing the vertices transformed into the drawing's coordinate system."""
+
+		self.segments = segments
+		"""Array of shape (m, 2) containing the ids of the start and end vertex of each drawn segment, oriented so that the adjacent front face lies to the left."""
+
+		self.is_boundary = is_boundary
+		self.is_edge = is_edge
+
+		self.patch_segments = patch_segments
+		"""Array of shape (k, 2) containing the vertex ids of the boundary segments of all patches. The segments of patch i are those from patch_offsets[i] to patch_offsets[i + 1]."""
+
+		self.patch_offsets = patch_offsets
+
+		self.patch_planes = patch_planes
+		"""Array of shape (l, 3) containing the ids of three vertices spanning the plane of each patch."""
 
-				start = point_on_segment(segment, a)
-				end = point_on_segment(segment, b)
+		self.patch_components = patch_components
+		"""Array containing the id of the connected component of the mesh each patch belongs to."""
 
-				lines_by_style[style].append(Line(points=[start, end]))
+	@classmethod
+	def from_polyhedron(cls, polyhedron, projection, min_angle):
+		util.log('Merging coplanar faces ...')
+
+		planar_patches = polyhedra.find_planar_patches(polyhedron)
+
+		# Edges inside a patch are never drawn, so only the edges on patch boundaries are considered.
+		patch_edges = [
+			i for patch in planar_patches for i in patch.boundary
+			if i in polyhedron.edges]
+
+		util.log('Detecting edges ...')
+
+		face_vertex_ids = numpy.array(polyhedron.face_vertex_ids, dtype = numpy.int64)
+		face_normals = polyhedra.face_normal_array(polyhedron.vertex_coordinates, face_vertex_ids)
+
+		left_visible, is_boundary, is_edge = classify_edges(
+			face_normals,
+			numpy.array([i.face_id for i in patch_edges], dtype = numpy.int64),
+			numpy.array([i.opposite.face_id for i in patch_edges], dtype = numpy.int64),
+			projection[2, :3],
+			min_angle)
+
+		drawn = numpy.flatnonzero(is_boundary | is_edge)
+
+		# We need to orient this so that the edge is closed (i.e. no points are missing because two segment ending at the same point).
+		edge_views = [
+			patch_edges[i] if left_visible[i] else patch_edges[i].opposite
+			for i in drawn.tolist()]
+
+		def plane(patch : polyhedra.PlanarPatch):
+			face_view = patch.faces[0]
+
+			assert len(face_view.face_cycle) == 3
+
+			return [face_view.vertex_id, face_view.next.vertex_id, face_view.next.next.vertex_id]
+
+		util.log('Finding connected components ...')
+
+		face_component_ids = polyhedron.face_component_ids()
+
+		return cls(
+			projected = project_vertices(polyhedron.vertex_coordinates, projection),
+			segments = numpy.array(
+				[(i.vertex_id, i.opposite.vertex_id) for i in edge_views], dtype = numpy.int64).reshape((-1, 2)),
+			is_boundary = is_boundary[drawn],
+			is_edge = is_edge[drawn],
+			patch_segments = numpy.array(
+				[(i.vertex_id, i.next.vertex_id) for patch in planar_patches for i in patch.boundary],
+				dtype = numpy.int64).reshape((-1, 2)),
+			patch_offsets = numpy.cumsum([0] + [len(i.boundary) for i in planar_patches]),
+			patch_planes = numpy.array(list(map(plane, planar_patches)), dtype = numpy.int64).reshape((-1, 3)),
+			patch_components = numpy.array(
+				[face_component_ids[i.faces[0].face_id] for i in planar_patches], dtype = numpy.int64))
+
+	def update_hash(self, hash):
+		"""
+		Feed the contents of all arrays into a hashlib hash object.
+		"""
+
+		for i in self.array_names:
+			hash.update(numpy.ascontiguousarray(getattr(self, i)).tobytes())
+
+	def to_objects(self, drawn_ids = None):
+		"""
+		Return the drawn segments with the specified ids, or all of them, all border segments and all patches which have an area as Fraction-based objects.
+		"""
+
+		# Each vertex is only converted to a Point once, when first used. Segments sharing a vertex must share the Point instance.
+		points = [None] * len(self.projected)
+
+		# Vertices projected to the same point are identified by the smallest id among them, so that lines ending there are joined.
+		order = numpy.lexsort((self.projected[:, 1], self.projected[:, 0]))
+		sorted_xy = self.projected[order, :2]
+		is_new = numpy.ones(len(order), dtype = bool)
+		is_new[1:] = numpy.any(sorted_xy[1:] != sorted_xy[:-1], axis = 1)
+		point_ids = numpy.empty(len(order), dtype = numpy.int64)
+
+		# The sort is stable, so the first vertex of each group has the smallest id.
+		point_ids[order] = order[is_new][numpy.cumsum(is_new) - 1]
+
+		def make_point(vertex_id):
+			point = points[vertex_id]
+
+			if point is None:
+				x, y, z = map(fractions.Fraction, self.projected[vertex_id].tolist())
+				point = points[vertex_id] = Point(x = x, y = y, z = z, vertex_id = int(point_ids[vertex_id]))
+
+			return point
+
+		segments = { }
+
+		def make_segment(id):
+			# Border segments must also be the same instances as the corresponding drawn segments.
+			segment = segments.get(id)
+
+			if segment is None:
+				start, end = self.segments[id].tolist()
+				segment = segments[id] = Segment(
+					start = make_point(start),
+					end = make_point(end),
+					is_boundary = bool(self.is_boundary[id]),
+					is_edge = bool(self.is_edge[id]))
+
+			return segment
+
+		if drawn_ids is None:
+			drawn_ids = range(len(self.segments))
+
+		drawn_segments = [make_segment(i) for i in drawn_ids]
+		border_segments = [make_segment(i) for i in numpy.flatnonzero(self.is_boundary).tolist()]
+
+		def make_patch(i):
+			start, end = self.patch_offsets[i:i + 2].tolist()
+
+			return Patch(
+				boundary = [
+					geometry.Segment(start = make_point(a), end = make_point(b))
+					for a, b in self.patch_segments[start:end].tolist()],
+				plane = [make_point(j) for j in self.patch_planes[i].tolist()],
+				component = int(self.patch_components[i]))
+
+		patches = [i for i in map(make_patch, range(len(self.patch_planes))) if i.has_area]
+
+		return drawn_segments, border_segments, patches
+
+
+class SegmentEngine(engines.Engine):
+	"""
+	Engine which converts the edges and faces of the mesh into Fraction-based segments and patches and finds the visible parts of the segments using a function like iter_visible_ranges().
+	"""
+
+	def __init__(self, *, iter_visible_ranges, checkpoint_path = None, resume = False):
+		self._iter_visible_ranges = iter_visible_ranges
+		self._checkpoint_path = checkpoint_path
+		self._resume = resume
+
+	def with_checkpoint(self, checkpoint_path, resume):
+		"""
+		Return a copy of this engine, which writes a checkpoint to the specified path while finding the visible lines and, if resume is true, resumes from an existing checkpoint.
+		"""
+
+		return SegmentEngine(
+			iter_visible_ranges = self._iter_visible_ranges,
+			checkpoint_path = checkpoint_path,
+			resume = resume)
+
+	def find_lines(self, polyhedron, projection, min_angle):
+		polylines_by_style = collections.defaultdict(list)
+
+		for style, polyline in self.iter_lines(polyhedron, projection, min_angle):
+			polylines_by_style[style].append(polyline)
+
+		return dict(polylines_by_style)
+
+	def iter_lines(self, polyhedron, projection, min_angle):
+		segment_arrays = SegmentArrays.from_polyhedron(polyhedron, projection, min_angle)
+		drawn_segments, border_segments, patches = segment_arrays.to_objects()
+
+		util.log('Detecting boundary intersections ...')
+		util.log(
+			'border: {}, draw: {}, faces: {}, patches: {}',
+			len(border_segments),
+			len(drawn_segments),
+			polyhedron.face_count,
+			len(patches))
+
+		def iter_polylines(open_checkpoint):
+			visible_ranges = self._iter_visible_ranges(drawn_segments, border_segments, patches, checkpoint = open_checkpoint)
+
+			for style, line in iter_joined_lines(drawn_segments, visible_ranges):
+				yield style, numpy.array([(i.x, i.y) for i in line.points], dtype = numpy.float64)
+
+		if self._checkpoint_path is None:
+			yield from iter_polylines(None)
+		else:
+			# The segment arrays depend on the input mesh and all settings affecting the found lines.
+			hash = hashlib.sha256()
+			hash.update(self._iter_visible_ranges.__name__.encode())
+			segment_arrays.update_hash(hash)
+
+			with checkpoint.open_checkpoint(self._checkpoint_path, hash.hexdigest(), self._resume) as open_checkpoint:
+				yield from iter_polylines(open_checkpoint)
+
+	def find_tile_lines(self, drawn_segments, border_segments, patches, bounds):
+		visible_ranges = self._iter_visible_ranges(drawn_segments, border_segments, patches, bounds)
+
+		return get_polylines(get_visible_lines(drawn_segments, collect_visible_ranges(drawn_segments, visible_ranges)))
+
+	def iter_visible_ranges(self, drawn_segments, border_segments, patches):
+		return self._iter_visible_ranges(drawn_segments, border_segments, patches)
+
+
+# The exact engine is the reference all other engines are compared against.
+engines.register('exact', SegmentEngine(iter_visible_ranges = iter_visible_ranges))
+engines.register('qi', SegmentEngine(iter_visible_ranges = iter_visible_ranges_qi))
+
+
+def get_checkpoint_path(output_file):
+	return output_file + '.checkpoint'
 
+
+# Names of the settings of DrawingSettings which enable a feature, as used in error messages.
+_feature_names = dict(
+	max_error = 'decimation',
+	max_memory = 'a memory limit',
+	shade_count = 'shading',
+	shard_dir = 'sharding',
+	resume = 'resuming',
+	progressive = 'progressive rendering')
+
+# Pairs of features which cannot be used together.
+_incompatible_features = [
+	('max_error', 'max_memory'),
+	('shade_count', 'max_memory'),
+	('shard_dir', 'max_memory'),
+	('resume', 'max_memory'),
+	('progressive', 'max_memory'),
+	('shade_count', 'progressive'),
+	('shard_dir', 'progressive'),
+	('resume', 'progressive')]
+
+
+class DrawingSettings:
+	"""
+	The settings used to produce the drawing of each input file.
+	"""
+
+	def __init__(self, *, projection, max_error, max_memory, min_angle, shade_count, use_sidecar, engine_name, shard_dir, shard_count, shard_timeout, resume, progressive, time_budget):
+		self.projection = projection
+		"""4x4 matrix transforming the model's coordinate system into the drawing's coordinate system, see get_projection()."""
+
+		self.max_error = max_error
+		"""Maximum error in mm on the drawing allowed when decimating the mesh, or None to not decimate the mesh."""
+
+		self.max_memory = max_memory
+		"""Approximate amount of memory in bytes to which rendering in tiles is limited, or None to not render in tiles."""
+
+		self.min_angle = min_angle
+		"""Minimum angle in radians between the normals of two visible faces for the edge between them to be drawn."""
+
+		self.shade_count = shade_count
+		"""Number of shades of gray used to fill the visible faces, or None to not fill them."""
+
+		self.use_sidecar = use_sidecar
+		self.engine_name = engine_name
+
+		self.shard_dir = shard_dir
+		"""Directory to which the shards are written, or None to not split the work into shards, see shards.py."""
+
+		self.shard_count = shard_count
+		self.shard_timeout = shard_timeout
+		self.resume = resume
+		self.progressive = progressive
+
+		self.time_budget = time_budget
+		"""Number of seconds after which progressive rendering stops refining the drawing, or None."""
+
+	def check(self):
+		"""
+		Raise a UserError if features are enabled which cannot be used together.
+		"""
+
+		def is_enabled(name):
+			value = getattr(self, name)
+
+			return value is not None and value is not False
+
+		for a, b in _incompatible_features:
+			if is_enabled(a) and is_enabled(b):
+				raise util.UserError('{} is not supported together with {}.', _feature_names[a].capitalize(), _feature_names[b])
+
+
+def write_drawing(input_file, asy_file, output_file, settings: DrawingSettings, compile_intermediate):
+	"""
+	Run the hidden-line removal on the specified mesh and write the resulting drawing to an Asymptote file, which is compiled to output_file by the caller.
+
+	If settings.resume is true, a checkpoint file output_file + '.checkpoint' is created while the lines are being found, from which the run is resumed if it is interrupted and started again with the same settings. The file is removed once output_file has been compiled. If settings.progressive is true, intermediate drawings are compiled to output_file using compile_intermediate while the lines are being found, see progressive.py.
+	"""
+
+	engine = engines.get(settings.engine_name)
+
+	if settings.shard_dir is not None:
+		# Imported here because the shards module depends on this module.
+		from stl_plot import shards
+
+		engine = shards.ShardedEngine(
+			engine_name = settings.engine_name,
+			shard_dir = settings.shard_dir,
+			shard_count = settings.shard_count,
+			timeout = settings.shard_timeout)
+	elif settings.resume:
+		if not isinstance(engine, SegmentEngine):
+			raise util.UserError('The engine {} does not support resuming.', settings.engine_name)
+
+		engine = engine.with_checkpoint(get_checkpoint_path(output_file), True)
+
+	util.log('Loading mesh ...')
+
+	mesh_arrays = scenes.load_mesh_arrays(input_file, settings.use_sidecar)
+
+	if settings.max_memory is not None:
+		with asymptote.open_write(asy_file) as file:
+			write_tiled(file, mesh_arrays, settings.projection, settings.min_angle, settings.max_memory, engine)
+	elif settings.progressive:
+		# Imported here because the progressive module depends on this module.
+		from stl_plot import progressive
+
+		polyhedron = decimate_for_drawing(mesh_arrays.to_polyhedron(), settings.projection, settings.max_error, settings.min_angle)
+		progressive.write_progressive_drawing(asy_file, output_file, polyhedron, settings.projection, settings.min_angle, engine, settings.time_budget, compile_intermediate)
+	else:
+		write_polyhedron_drawing(asy_file, mesh_arrays.to_polyhedron(), settings.projection, settings.max_error, settings.min_angle, settings.shade_count, engine)
+
+
+def decimate_for_drawing(polyhedron, projection, max_error, min_angle):
+	"""
+	Return a decimated copy of the polyhedron whose drawing deviates at most by max_error from the drawing of the original polyhedron, or the polyhedron itself if max_error is None.
+	"""
+
+	if max_error is None:
+		return polyhedron
+
+	util.log('Decimating mesh ...')
+
+	# Scale from the model's coordinate system to the drawing's coordinate system.
+	projection_scale = numpy.linalg.norm(projection[:2, :3], 2)
+
+	polyhedron = decimation.decimate(
+		polyhedron,
+		max_error / projection_scale,
+		min_angle,
+		# Direction along which visibility of faces is determined.
+		projection[2, :3])
+
+	util.log('Faces after decimation: {}', polyhedron.face_count)
+
+	return polyhedron
+
+
+def write_polyhedron_drawing(asy_file, polyhedron, projection, max_error, min_angle, shade_count, engine: engines.Engine):
+	"""
+	Write the drawing of an already loaded polyhedron to an Asymptote file. The polyhedron is not modified and can be drawn again from a different camera.
+	"""
+
+	polyhedron = decimate_for_drawing(polyhedron, projection, max_error, min_angle)
 	util.log('Generating drawing ...')
 
+	with asymptote.open_write(asy_file) as file:
+		if shade_count is not None:
+			# Written first so that the lines are drawn on top of the filled regions.
+			shading.write_shading(
+				file,
+				project_vertices(polyhedron.vertex_coordinates, projection),
+				numpy.array(polyhedron.face_vertex_ids, dtype = numpy.int64),
+				shade_count)
+
+		# The lines are written while they are being found.
+		write_line_stream(file, engine.iter_lines(polyhedron, projection, min_angle))
+
+
+async def _compile(asy_file, output_file, pool, compile_timeout):
+	await asymptote.compile_async(asy_file, output_file, pool = pool, timeout = compile_timeout)
+
+	# Only removed once the output file exists, so that the hidden-line removal does not need to run again if the compilation fails.
+	try:
+		os.unlink(get_checkpoint_path(output_file))
+	except FileNotFoundError:
+		pass
+
+
+async def _plot_files(input_files, output_files, settings: DrawingSettings, jobs, compile_timeout):
+	"""
+	Plot multiple files, running the hidden-line removal for one file while the drawings of the previous files are being compiled.
+	"""
+
+	pool = util.CommandPool(jobs)
+	loop = asyncio.get_running_loop()
+	compile_tasks = []
+
+	def compile_intermediate(asy_file, output_file):
+		# Called from the thread running the hidden-line removal.
+		return asyncio.run_coroutine_threadsafe(
+			asymptote.compile_async(asy_file, output_file, pool = pool, timeout = compile_timeout),
+			loop)
+
 	with tempfile.TemporaryDirectory() as tempdir:
-		asy_file = os.path.join(tempdir, 'out.asy')
+		try:
+			for i, (input_file, output_file) in enumerate(zip(input_files, output_files)):
+				util.log('Plotting {} ...', input_file)
 
-		with asymptote.open_write(asy_file) as file:
-			for style, lines in lines_by_style.items():
-				lines = join_lines(lines)
+				asy_file = os.path.join(tempdir, '{}.asy'.format(i))
+
+				# Run in a thread so that the event loop can keep supervising the compilation of the previous files.
+				await loop.run_in_executor(
+					None, write_drawing, input_file, asy_file, output_file, settings, compile_intermediate)
+
+				compile_tasks.append(asyncio.create_task(
+					_compile(asy_file, output_file, pool, compile_timeout)))
+
+			await asyncio.gather(*compile_tasks)
+		finally:
+			# Kill the compilations still running if an error occurred.
+			for i in compile_tasks:
+				i.cancel()
+
+			await asyncio.gather(*compile_tasks, return_exceptions = True)
+
+
+def main(input_files, output_files, camera, min_angle, shading, sidecar, engine, jobs, compile_timeout, **options):
+	"""
+	Plot the input files using the settings parsed from the command line. The options are passed on to DrawingSettings under the same names.
+	"""
 
-				for line in lines:
-					path = paths.path(*((i.x, i.y) for i in line.points))
+	settings = DrawingSettings(
+		projection = get_projection(camera),
+		min_angle = math.radians(min_angle),
+		shade_count = shading,
+		use_sidecar = sidecar,
+		engine_name = engine,
+		**options)
 
-					file.write('draw({}, {});', path, style)
+	# Checked before any of the files is processed.
+	settings.check()
 
-		asymptote.compile(asy_file, output_file)
+	asyncio.run(_plot_files(input_files, output_files, settings, jobs, compile_timeout))
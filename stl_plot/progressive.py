@@ -0,0 +1,224 @@
+"""
+Progressive rendering, which quickly writes a draft of a drawing and then refines it towards the exact result, replacing the output file at intervals.
+
+The draft only contains the silhouettes of the mesh, i.e. the drawn segments between front and back faces. Their visibility is tested approximately at points sampled along each segment, using floating-point arithmetic. The drawn segments are then processed by a single pass of the engine, which is given the silhouettes first. Each intermediate drawing contains the exact lines of the segments processed so far and the draft lines of the remaining silhouettes.
+"""
+
+import numpy, os, time
+from stl_plot.fabricate import asymptote
+from stl_plot import util, plot, engines
+
+
+# Minimum interval in seconds between intermediate drawings.
+_update_interval = 10
+
+# Number of points at which the visibility of a silhouette is tested along a distance equal to the size of the drawing.
+_samples_per_size = 500
+
+# Maximum number of point-triangle pairs tested at once.
+_max_pairs = 1 << 20
+
+
+def _hidden_points(points, triangles, tolerance):
+	"""
+	Return for each point of the array of shape (n, 3) whether it lies behind one of the counter-clockwise triangles of the array of shape (m, 3, 3) by more than tolerance.
+
+	The triangles are sorted into a grid of cells and each point is only compared to the triangles overlapping the cell containing it.
+	"""
+
+	hidden = numpy.zeros(len(points), dtype = bool)
+	mins = triangles[:, :, :2].min(axis = 1)
+	maxs = triangles[:, :, :2].max(axis = 1)
+	extents = numpy.max(maxs - mins, axis = 1)
+
+	if not len(points) or not numpy.any(extents > 0):
+		return hidden
+
+	cell_size = numpy.median(extents[extents > 0])
+	origin = mins.min(axis = 0)
+	cell_mins = numpy.floor((mins - origin) / cell_size).astype(numpy.int64)
+	cell_maxs = numpy.floor((maxs - origin) / cell_size).astype(numpy.int64)
+	grid_width, grid_height = cell_maxs.max(axis = 0) + 1
+
+	# Enumerate all cells covered by the bounding box of each triangle, as in shading._box_pairs().
+	widths = cell_maxs[:, 0] - cell_mins[:, 0] + 1
+	counts = widths * (cell_maxs[:, 1] - cell_mins[:, 1] + 1)
+	triangle_ids = numpy.repeat(numpy.arange(len(triangles)), counts)
+	offsets = numpy.arange(len(triangle_ids)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+	keys = (cell_mins[triangle_ids, 0] + offsets % widths[triangle_ids]) * grid_height \
+		+ cell_mins[triangle_ids, 1] + offsets // widths[triangle_ids]
+
+	order = numpy.argsort(keys, kind = 'stable')
+	keys = keys[order]
+	triangle_ids = triangle_ids[order]
+
+	point_cells = numpy.floor((points[:, :2] - origin) / cell_size).astype(numpy.int64)
+	in_grid = numpy.all((point_cells >= 0) & (point_cells < [grid_width, grid_height]), axis = 1)
+	point_keys = point_cells[:, 0] * grid_height + point_cells[:, 1]
+	starts = numpy.searchsorted(keys, point_keys, 'left')
+	pair_counts = numpy.where(in_grid, numpy.searchsorted(keys, point_keys, 'right') - starts, 0)
+
+	# Split the points into chunks with a limited number of pairs.
+	cumulative_counts = numpy.cumsum(pair_counts)
+	boundaries = numpy.searchsorted(cumulative_counts, numpy.arange(_max_pairs, cumulative_counts[-1], _max_pairs))
+
+	for chunk in numpy.split(numpy.arange(len(points)), numpy.unique(boundaries + 1)):
+		point_ids = numpy.repeat(chunk, pair_counts[chunk])
+		pair_offsets = numpy.arange(len(point_ids)) \
+			- numpy.repeat(numpy.cumsum(pair_counts[chunk]) - pair_counts[chunk], pair_counts[chunk])
+		corners = triangles[triangle_ids[starts[point_ids] + pair_offsets]]
+		p = points[point_ids]
+
+		inside = numpy.ones(len(point_ids), dtype = bool)
+
+		for i in range(3):
+			a = corners[:, i]
+			b = corners[:, (i + 1) % 3]
+			inside &= (b[:, 0] - a[:, 0]) * (p[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (p[:, 0] - a[:, 0]) >= 0
+
+		normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+		z = corners[:, 0, 2] - (
+			normals[:, 0] * (p[:, 0] - corners[:, 0, 0])
+			+ normals[:, 1] * (p[:, 1] - corners[:, 0, 1])) / normals[:, 2]
+
+		hidden[point_ids[inside & (z > p[:, 2] + tolerance)]] = True
+
+	return hidden
+
+
+def find_draft_lines(segment_arrays: plot.SegmentArrays, segment_ids, triangles, size):
+	"""
+	Approximate the visible parts of the drawn segments with the specified ids, hidden by the front faces given as an array of shape (n, 3, 3).
+
+	Returns a dict mapping each segment id to a list of arrays of shape (2, 2), each containing the start and end point of a visible part.
+	"""
+
+	if not len(segment_ids):
+		return { }
+
+	starts = segment_arrays.projected[segment_arrays.segments[segment_ids, 0]]
+	ends = segment_arrays.projected[segment_arrays.segments[segment_ids, 1]]
+	lengths = numpy.linalg.norm(ends[:, :2] - starts[:, :2], axis = 1)
+	counts = numpy.maximum(numpy.ceil(lengths * _samples_per_size / size).astype(numpy.int64), 1)
+
+	# Sample each segment at the centers of counts parts of equal length.
+	sample_segments = numpy.repeat(numpy.arange(len(segment_ids)), counts)
+	sample_offsets = numpy.arange(len(sample_segments)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+	t = (sample_offsets + .5) / counts[sample_segments]
+	samples = starts[sample_segments] + (ends - starts)[sample_segments] * t[:, None]
+	visible = ~_hidden_points(samples, triangles, size * 1e-9)
+
+	# Runs of consecutive visible samples of the same segment.
+	is_first = numpy.concatenate([[True], sample_segments[1:] != sample_segments[:-1]])
+	is_last = numpy.concatenate([is_first[1:], [True]])
+	run_starts = numpy.flatnonzero(visible & (is_first | ~numpy.roll(visible, 1)))
+	run_ends = numpy.flatnonzero(visible & (is_last | ~numpy.roll(visible, -1)))
+
+	lines_by_segment = { i: [] for i in segment_ids.tolist() }
+
+	for start, end in zip(run_starts.tolist(), run_ends.tolist()):
+		index = sample_segments[start]
+		a = sample_offsets[start] / counts[index]
+		b = (sample_offsets[end] + 1) / counts[index]
+		segment_start = starts[index, :2]
+		direction = ends[index, :2] - segment_start
+
+		lines_by_segment[int(segment_ids[index])].append(
+			numpy.array([segment_start + direction * a, segment_start + direction * b]))
+
+	return lines_by_segment
+
+
+def write_progressive_drawing(asy_file, output_file, polyhedron, projection, min_angle, engine: engines.Engine, time_budget, compile_intermediate):
+	"""
+	Write the drawing of a polyhedron to an Asymptote file, like plot.write_polyhedron_drawing(), while compiling intermediate drawings to output_file.
+
+	compile_intermediate is called with the paths of an Asymptote file and of output_file and starts compiling the former to the latter without blocking. It returns a concurrent.futures.Future, so that the hidden-line removal continues while an intermediate drawing is being compiled.
+
+	If time_budget is not None, the refinement stops when the specified number of seconds have passed and the draft lines are used for the silhouettes not processed by then.
+	"""
+
+	start_time = time.monotonic()
+	segment_arrays = plot.SegmentArrays.from_polyhedron(polyhedron, projection, min_angle)
+	projected = segment_arrays.projected
+	corners = projected[numpy.array(polyhedron.face_vertex_ids, dtype = numpy.int64)]
+	normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+	# Behind a point hidden by any face, there is always a front face hiding it too.
+	triangles = corners[normals[:, 2] > 0]
+	size = numpy.max(projected[:, :2].max(axis = 0) - projected[:, :2].min(axis = 0))
+
+	util.log('Finding draft lines ...')
+
+	silhouette_ids = numpy.flatnonzero(segment_arrays.is_boundary)
+	draft_lines = find_draft_lines(segment_arrays, silhouette_ids, triangles, size)
+
+	# Silhouettes first, as they replace draft lines. Engines which choose their own order may still process them later.
+	order = numpy.concatenate([silhouette_ids, numpy.flatnonzero(~segment_arrays.is_boundary)]).tolist()
+
+	# Visible parts of the segments processed so far, by their index in order.
+	ranges_by_index = { }
+
+	# Compiled from a separate file, so that it is not replaced while being compiled.
+	intermediate_asy_file = os.path.splitext(asy_file)[0] + '-intermediate.asy'
+	pending_compilation = None
+
+	def write(path, drawn_segments):
+		indices = sorted(ranges_by_index)
+		draft_polylines_by_style = { }
+
+		for i in range(len(order)):
+			if i not in ranges_by_index and order[i] in draft_lines:
+				draft_polylines_by_style.setdefault(plot.get_style(segment_arrays.is_edge[order[i]]), []).extend(draft_lines[order[i]])
+
+		lines_by_style = plot.get_visible_lines(
+			[drawn_segments[i] for i in indices],
+			[ranges_by_index[i] for i in indices])
+
+		with asymptote.open_write(path) as file:
+			plot.write_lines(file, plot.merge_polylines([plot.get_polylines(lines_by_style), draft_polylines_by_style]))
+
+	def update(drawn_segments):
+		nonlocal pending_compilation
+
+		util.log('Writing intermediate drawing with {} of {} segments refined ...', len(ranges_by_index), len(order))
+
+		write(intermediate_asy_file, drawn_segments)
+		pending_compilation = compile_intermediate(intermediate_asy_file, output_file)
+
+		return time.monotonic()
+
+	def wait_for_compilation():
+		if pending_compilation is not None:
+			# Raises the exception if the compilation failed.
+			pending_compilation.result()
+
+	last_update_time = update([])
+
+	# Converted only after the draft has been written, as this takes a while for large meshes.
+	drawn_segments, border_segments, patches = segment_arrays.to_objects()
+	drawn_segments = [drawn_segments[i] for i in order]
+
+	# A single pass of the engine, so that the data structures it builds are reused for all segments.
+	visible_ranges = engine.iter_visible_ranges(drawn_segments, border_segments, patches)
+
+	for i, segment_ranges in visible_ranges:
+		ranges_by_index[i] = segment_ranges
+		now = time.monotonic()
+
+		if time_budget is not None and now - start_time >= time_budget and len(ranges_by_index) < len(order):
+			util.log('Time budget exhausted with {} of {} segments refined.', len(ranges_by_index), len(order))
+
+			break
+
+		# An intermediate drawing is only started when the previous one has been compiled.
+		if len(ranges_by_index) < len(order) and now - last_update_time >= _update_interval and pending_compilation.done():
+			wait_for_compilation()
+			last_update_time = update(drawn_segments)
+
+	# Waited for, so that it does not replace the final drawing compiled by the caller.
+	wait_for_compilation()
+
+	util.log('Generating drawing ...')
+
+	write(asy_file, drawn_segments)
@@ -0,0 +1,100 @@
+"""
+Scene files, which describe an assembly of parts, each of which is a mesh file placed with a transform. A mesh used by multiple parts is only loaded and preprocessed once and then instantiated for each part, instead of baking all parts into a single mesh file.
+
+A scene file has the extension .scene and contains a JSON object like this:
+
+	{
+		"parts": [
+			{ "mesh": "bolt.stl", "transform": [[1, 0, 0, 10], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]] },
+			{ "mesh": "plate.obj" }
+		]
+	}
+
+The paths of the meshes are relative to the directory containing the scene file. A transform is an affine 4x4 matrix given as a list of rows, which transforms the part into the coordinate system of the scene. It defaults to the identity.
+
+The parts are combined into a single mesh, so that parts hide each other as if they were part of the same mesh file.
+"""
+
+import json, numpy, os
+from stl_plot import util, sidecar
+
+
+_extension = '.scene'
+
+
+def is_scene_file(path):
+	return os.path.splitext(path)[1].lower() == _extension
+
+
+def _read_scene(path):
+	"""
+	Return a list of pairs of the path of the mesh file and the transform of each part of a scene.
+	"""
+
+	try:
+		data = json.loads(util.read_text_file(path))
+	except ValueError as e:
+		raise util.UserError('Invalid scene file: {}: {}', path, e)
+
+	parts = data.get('parts') if isinstance(data, dict) else None
+
+	if not isinstance(parts, list) or not parts:
+		raise util.UserError('Scene file contains no parts: {}', path)
+
+	base_dir = os.path.dirname(path)
+	result = []
+
+	for i, part in enumerate(parts):
+		if not isinstance(part, dict) or not isinstance(part.get('mesh'), str):
+			raise util.UserError('Part {} of scene file has no mesh: {}', i, path)
+
+		try:
+			transform = numpy.array(part.get('transform', numpy.eye(4)), dtype = numpy.float64)
+		except (TypeError, ValueError):
+			transform = None
+
+		if transform is None or transform.shape != (4, 4) or not numpy.array_equal(transform[3], [0, 0, 0, 1]):
+			raise util.UserError('Part {} of scene file does not have an affine 4x4 transform: {}', i, path)
+
+		if numpy.linalg.det(transform[:3, :3]) == 0:
+			raise util.UserError('Part {} of scene file has a singular transform: {}', i, path)
+
+		result.append((os.path.join(base_dir, part['mesh']), transform))
+
+	return result
+
+
+def load_scene(path, use_sidecar):
+	"""
+	Load a scene file as a single sidecar.MeshArrays instance containing all parts.
+
+	Each distinct mesh file is loaded once, using its sidecar if use_sidecar is true.
+	"""
+
+	parts = _read_scene(path)
+	mesh_arrays_by_path = { }
+
+	for mesh_path, _ in parts:
+		key = os.path.realpath(mesh_path)
+
+		if key not in mesh_arrays_by_path:
+			util.log('Loading part {} ...', mesh_path)
+
+			mesh_arrays_by_path[key] = sidecar.load_mesh_arrays(mesh_path, use_sidecar)
+
+	util.log('Instantiating {} parts of {} meshes ...', len(parts), len(mesh_arrays_by_path))
+
+	return sidecar.MeshArrays.concatenate([
+		mesh_arrays_by_path[os.path.realpath(mesh_path)].transformed(transform)
+		for mesh_path, transform in parts])
+
+
+def load_mesh_arrays(path, use_sidecar):
+	"""
+	Load a scene file or a mesh file as a sidecar.MeshArrays instance.
+	"""
+
+	if is_scene_file(path):
+		return load_scene(path, use_sidecar)
+
+	return sidecar.load_mesh_arrays(path, use_sidecar)
@@ -0,0 +1,460 @@
+"""
+Rendering service started by `stl-plot serve`. It keeps recently used meshes in memory, so that the same mesh can be drawn again from a different camera without loading it again.
+
+Requests are answered over HTTP on a local TCP port or a Unix socket:
+
+- `POST /render` renders the STL file sent as the request body. `GET /render?path=...` renders a file read by the server from the specified path, relative to the directory passed to --root. Paths outside of that directory are rejected and without --root, only POST requests are accepted. Both return the PDF or SVG file. The query parameters camera, min_angle, max_error, shading and engine have the same meaning as the command line options. format selects between pdf and svg.
+- `GET /health` returns the state of the queue, the workers and the cache as JSON.
+- `GET /metrics` returns the request counts and timings as JSON, including those of the most recent requests.
+
+The response to a render request contains a Server-Timing header with the time spent waiting in the queue, loading the mesh, writing the drawing and compiling it.
+"""
+
+import argparse, asyncio, collections, concurrent.futures, hashlib, http, json
+import math, os, stat, tempfile, threading, time, urllib.parse
+
+import stl_plot
+from stl_plot.fabricate import asymptote, polyhedra
+from stl_plot import util, sidecar, plot, engines
+
+
+# Limits the size of the STL files sent in a request body.
+_max_body_size = 1 << 30
+
+# Number of requests whose timings are reported by /metrics.
+_recent_request_count = 100
+
+_content_types = dict(pdf = 'application/pdf', svg = 'image/svg+xml')
+
+
+class _HTTPError(Exception):
+	def __init__(self, status: http.HTTPStatus, message, *args):
+		super().__init__(message.format(*args))
+
+		self.status = status
+
+
+class PolyhedronCache:
+	"""
+	LRU cache of polyhedra.Polyhedron instances keyed by the hash of the file they were loaded from.
+
+	The cache can be used from multiple threads. A polyhedron loaded by two threads at the same time is loaded twice.
+	"""
+
+	def __init__(self, *, max_size):
+		self._max_size = max_size
+		self._polyhedra = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+		self.hit_count = 0
+		self.miss_count = 0
+
+	def get(self, key, load):
+		"""
+		Return a tuple of the polyhedron stored under the specified key and whether it was already cached. Otherwise, load() is called to load it.
+		"""
+
+		with self._lock:
+			polyhedron = self._polyhedra.get(key)
+
+			if polyhedron is not None:
+				self._polyhedra.move_to_end(key)
+				self.hit_count += 1
+
+				return polyhedron, True
+
+			self.miss_count += 1
+
+		polyhedron = load()
+
+		with self._lock:
+			self._polyhedra[key] = polyhedron
+
+			while len(self._polyhedra) > self._max_size:
+				self._polyhedra.popitem(last = False)
+
+		return polyhedron, False
+
+	def get_stats(self):
+		with self._lock:
+			return dict(
+				size = len(self._polyhedra),
+				max_size = self._max_size,
+				faces = sum(i.face_count for i in self._polyhedra.values()),
+				hits = self.hit_count,
+				misses = self.miss_count)
+
+
+class _RenderJob:
+	def __init__(self, *, path, body, settings, future):
+		self.path = path
+		self.body = body
+		self.settings = settings
+		self.future = future
+		self.timings = { }
+		self.cache_hit = None
+		self.queued_time = time.perf_counter()
+
+
+def _parse_settings(query):
+	"""
+	Parse the query parameters of a render request into a dict of settings.
+	"""
+
+	def get(name, type, default):
+		values = query.get(name)
+
+		if not values:
+			return default
+
+		try:
+			return type(values[-1])
+		except (ValueError, argparse.ArgumentTypeError):
+			raise _HTTPError(http.HTTPStatus.BAD_REQUEST, 'Invalid value for {}: {}', name, values[-1])
+
+	settings = dict(
+		# Same defaults as the command line options.
+		camera = get('camera', stl_plot.parse_camera, [14.4, 21.6]),
+		min_angle = math.radians(get('min_angle', float, math.degrees(6.3 / 32))),
+		max_error = get('max_error', float, None),
+		shade_count = get('shading', int, None),
+		engine_name = get('engine', str, 'exact'),
+		format = get('format', str, 'pdf'))
+
+	if settings['engine_name'] not in engines.names():
+		raise _HTTPError(http.HTTPStatus.BAD_REQUEST, 'Unknown engine: {}', settings['engine_name'])
+
+	if settings['format'] not in asymptote.formats:
+		raise _HTTPError(http.HTTPStatus.BAD_REQUEST, 'Unsupported format: {}', settings['format'])
+
+	return settings
+
+
+class Server:
+	"""
+	Answers render requests using a fixed number of workers, which take the requests from a bounded queue.
+
+	The hidden-line removal of each request runs in a thread, so that the event loop stays responsive. Because of the global interpreter lock, these threads do not run in parallel, but they share the cache of loaded meshes. The drawings are compiled by Asymptote processes running in parallel.
+	"""
+
+	def __init__(self, *, jobs, max_queue, cache_size, use_sidecar, compile_timeout, root_dir):
+		self._jobs = jobs
+
+		# Resolved, so that paths reaching outside of it through symlinks are detected.
+		self._root_dir = None if root_dir is None else os.path.realpath(root_dir)
+		self._use_sidecar = use_sidecar
+		self._compile_timeout = compile_timeout
+
+		self._queue = asyncio.Queue(max_queue)
+		self._pool = util.CommandPool(jobs)
+		self._executor = concurrent.futures.ThreadPoolExecutor(jobs)
+		self._cache = PolyhedronCache(max_size = cache_size)
+
+		self._start_time = time.monotonic()
+		self._busy_count = 0
+		self._request_counts = collections.Counter()
+		self._total_timings = collections.Counter()
+
+		# Number of requests contributing to each entry of _total_timings, as requests failing early do not have all timings.
+		self._timing_counts = collections.Counter()
+		self._recent_requests = collections.deque(maxlen = _recent_request_count)
+
+	def _resolve_path(self, path):
+		"""
+		Return the absolute path of a file requested relative to the root directory, rejecting paths outside of it.
+		"""
+
+		if self._root_dir is None:
+			raise _HTTPError(http.HTTPStatus.FORBIDDEN, 'Reading files is disabled. Start the server with --root to enable it.')
+
+		resolved_path = os.path.realpath(os.path.join(self._root_dir, path))
+
+		if os.path.commonpath([resolved_path, self._root_dir]) != self._root_dir:
+			raise _HTTPError(http.HTTPStatus.FORBIDDEN, 'Path outside of the root directory: {}', path)
+
+		return resolved_path
+
+	def _load_polyhedron(self, path, body):
+		if body is None:
+			if not os.path.isfile(path):
+				raise _HTTPError(http.HTTPStatus.NOT_FOUND, 'File not found: {}', path)
+
+			def load():
+				return sidecar.load_mesh_arrays(path, self._use_sidecar).to_polyhedron()
+
+			return self._cache.get(sidecar.hash_file(path), load)
+		else:
+			def load():
+				with tempfile.TemporaryDirectory() as temp_dir:
+					stl_path = os.path.join(temp_dir, 'mesh.stl')
+					util.write_file(stl_path, body)
+
+					return sidecar.MeshArrays.from_triangles(
+						polyhedra.load_stl_triangles(stl_path)).to_polyhedron()
+
+			return self._cache.get(hashlib.sha256(body).hexdigest(), load)
+
+	def _write_drawing(self, job: _RenderJob, asy_file):
+		settings = job.settings
+		start = time.perf_counter()
+		polyhedron, job.cache_hit = self._load_polyhedron(job.path, job.body)
+		job.timings['load'] = time.perf_counter() - start
+
+		start = time.perf_counter()
+
+		plot.write_polyhedron_drawing(
+			asy_file,
+			polyhedron,
+			plot.get_projection(settings['camera']),
+			settings['max_error'],
+			settings['min_angle'],
+			settings['shade_count'],
+			engines.get(settings['engine_name']))
+
+		job.timings['render'] = time.perf_counter() - start
+
+	async def _render(self, job: _RenderJob):
+		loop = asyncio.get_running_loop()
+		format = job.settings['format']
+
+		with tempfile.TemporaryDirectory() as temp_dir:
+			asy_file = os.path.join(temp_dir, 'drawing.asy')
+			out_file = os.path.join(temp_dir, 'drawing.' + format)
+
+			await loop.run_in_executor(self._executor, self._write_drawing, job, asy_file)
+
+			start = time.perf_counter()
+
+			await asymptote.compile_async(
+				asy_file,
+				out_file,
+				format,
+				pool = self._pool,
+				timeout = self._compile_timeout)
+
+			job.timings['compile'] = time.perf_counter() - start
+
+			return util.read_file(out_file)
+
+	async def _run_worker(self):
+		while True:
+			job = await self._queue.get()
+			job.timings['queue'] = time.perf_counter() - job.queued_time
+			self._busy_count += 1
+
+			try:
+				job.future.set_result(await self._render(job))
+			except Exception as e:
+				job.future.set_exception(e)
+			finally:
+				self._busy_count -= 1
+				self._queue.task_done()
+
+	def _record(self, job: _RenderJob, status):
+		job.timings['total'] = time.perf_counter() - job.queued_time
+		self._request_counts[status.value] += 1
+		self._total_timings.update(job.timings)
+		self._timing_counts.update(job.timings.keys())
+
+		self._recent_requests.append(dict(
+			path = job.path,
+			size = None if job.body is None else len(job.body),
+			status = status.value,
+			cache_hit = job.cache_hit,
+			timings = job.timings))
+
+		util.log(
+			'Rendered {} with status {} in {:.3f} s.',
+			'request body' if job.path is None else job.path,
+			status.value,
+			job.timings['total'])
+
+	async def _handle_render(self, method, query, body):
+		if method == 'POST':
+			path = None
+		elif method == 'GET':
+			path = query.get('path', [None])[-1]
+			body = None
+
+			if path is None:
+				raise _HTTPError(http.HTTPStatus.BAD_REQUEST, 'Either send the mesh as the request body or specify a path.')
+
+			path = self._resolve_path(path)
+		else:
+			raise _HTTPError(http.HTTPStatus.METHOD_NOT_ALLOWED, 'Method not allowed: {}', method)
+
+		job = _RenderJob(
+			path = path,
+			body = body,
+			settings = _parse_settings(query),
+			future = asyncio.get_running_loop().create_future())
+
+		try:
+			self._queue.put_nowait(job)
+		except asyncio.QueueFull:
+			self._request_counts[http.HTTPStatus.SERVICE_UNAVAILABLE.value] += 1
+
+			raise _HTTPError(http.HTTPStatus.SERVICE_UNAVAILABLE, 'Too many requests queued.') from None
+
+		try:
+			data = await job.future
+		except _HTTPError as e:
+			self._record(job, e.status)
+
+			raise
+		except util.UserError as e:
+			self._record(job, http.HTTPStatus.BAD_REQUEST)
+
+			raise _HTTPError(http.HTTPStatus.BAD_REQUEST, '{}', e) from None
+		except Exception as e:
+			self._record(job, http.HTTPStatus.INTERNAL_SERVER_ERROR)
+
+			raise _HTTPError(http.HTTPStatus.INTERNAL_SERVER_ERROR, '{}', e) from None
+
+		self._record(job, http.HTTPStatus.OK)
+
+		server_timing = ', '.join(
+			'{};dur={:.1f}'.format(k, v * 1000) for k, v in job.timings.items())
+
+		headers = [
+			('Server-Timing', server_timing),
+			('X-Cache', 'hit' if job.cache_hit else 'miss')]
+
+		return http.HTTPStatus.OK, _content_types[job.settings['format']], data, headers
+
+	def get_health(self):
+		return dict(
+			status = 'ok',
+			uptime = time.monotonic() - self._start_time,
+			queued = self._queue.qsize(),
+			max_queue = self._queue.maxsize,
+			busy_workers = self._busy_count,
+			workers = self._jobs,
+			cache = self._cache.get_stats())
+
+	def get_metrics(self):
+		return dict(
+			requests = sum(self._request_counts.values()),
+			requests_by_status = { str(k): v for k, v in sorted(self._request_counts.items()) },
+			total_timings = dict(self._total_timings),
+			mean_timings = {
+				k: v / self._timing_counts[k] for k, v in self._total_timings.items() },
+			recent_requests = list(self._recent_requests))
+
+	async def _handle(self, method, target, body):
+		url = urllib.parse.urlsplit(target)
+		query = urllib.parse.parse_qs(url.query)
+
+		if url.path == '/render':
+			return await self._handle_render(method, query, body)
+		elif url.path in ('/health', '/metrics'):
+			if method != 'GET':
+				raise _HTTPError(http.HTTPStatus.METHOD_NOT_ALLOWED, 'Method not allowed: {}', method)
+
+			if url.path == '/health':
+				result = self.get_health()
+			else:
+				result = self.get_metrics()
+
+			return http.HTTPStatus.OK, 'application/json', json.dumps(result, indent = 2).encode() + b'\n', []
+		else:
+			raise _HTTPError(http.HTTPStatus.NOT_FOUND, 'Not found: {}', url.path)
+
+	async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		try:
+			try:
+				method, target, body = await _read_request(reader)
+				response = await self._handle(method, target, body)
+			except _HTTPError as e:
+				response = e.status, 'text/plain', '{}\n'.format(e).encode(), []
+
+			await _write_response(writer, *response)
+		except (ConnectionError, asyncio.IncompleteReadError):
+			# The client went away.
+			pass
+		finally:
+			writer.close()
+
+	async def serve(self, *, host, port, socket_path):
+		workers = [asyncio.create_task(self._run_worker()) for _ in range(self._jobs)]
+
+		try:
+			if socket_path is None:
+				server = await asyncio.start_server(self._handle_connection, host, port)
+				util.log('Listening on http://{}:{}/ ...', host, port)
+			else:
+				# Remove the socket left behind by a previous instance.
+				if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+					os.unlink(socket_path)
+
+				server = await asyncio.start_unix_server(self._handle_connection, socket_path)
+				util.log('Listening on {} ...', socket_path)
+
+			async with server:
+				await server.serve_forever()
+		finally:
+			for i in workers:
+				i.cancel()
+
+			await asyncio.gather(*workers, return_exceptions = True)
+			self._executor.shutdown(wait = False)
+
+
+async def _read_request(reader: asyncio.StreamReader):
+	"""
+	Read an HTTP request and return a tuple of its method, target and body.
+	"""
+
+	request_line = (await reader.readline()).decode('latin-1').split()
+
+	if len(request_line) != 3:
+		raise _HTTPError(http.HTTPStatus.BAD_REQUEST, 'Invalid request line.')
+
+	method, target, _ = request_line
+	headers = { }
+
+	while True:
+		line = (await reader.readline()).decode('latin-1')
+
+		if not line.strip():
+			break
+
+		name, _, value = line.partition(':')
+		headers[name.strip().lower()] = value.strip()
+
+	try:
+		content_length = int(headers.get('content-length', '0'))
+	except ValueError:
+		content_length = -1
+
+	if content_length < 0:
+		raise _HTTPError(http.HTTPStatus.BAD_REQUEST, 'Invalid Content-Length.')
+
+	if content_length > _max_body_size:
+		raise _HTTPError(http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large.')
+
+	return method, target, await reader.readexactly(content_length)
+
+
+async def _write_response(writer: asyncio.StreamWriter, status: http.HTTPStatus, content_type, body, headers):
+	lines = [
+		'HTTP/1.1 {} {}'.format(status.value, status.phrase),
+		'Content-Type: {}'.format(content_type),
+		'Content-Length: {}'.format(len(body)),
+		'Connection: close',
+		*('{}: {}'.format(k, v) for k, v in headers)]
+
+	writer.write(''.join(i + '\r\n' for i in lines + ['']).encode('latin-1') + body)
+	await writer.drain()
+
+
+def main(host, port, socket, jobs, max_queue, cache_size, sidecar, compile_timeout, root):
+	server = Server(
+		jobs = jobs,
+		max_queue = max_queue,
+		cache_size = cache_size,
+		use_sidecar = sidecar,
+		compile_timeout = compile_timeout,
+		root_dir = root)
+
+	asyncio.run(server.serve(host = host, port = port, socket_path = socket))
@@ -0,0 +1,219 @@
+"""
+Filled regions covering the visible faces of a mesh, with faces of similar brightness merged into a single region per shade.
+"""
+
+import numpy
+from stl_plot.fabricate import asymptote, paths
+from stl_plot import util
+
+
+# Direction towards the light in the coordinate system of the drawing. The light comes from the upper left and from slightly in front of the viewer.
+_light_direction = numpy.array([-1, 1, 2]) / numpy.linalg.norm([-1, 1, 2])
+
+# Gray levels of the darkest and the brightest shade.
+_min_gray = .5
+_max_gray = .95
+
+
+def _box_pairs(mins, maxs):
+	"""
+	Return an array of shape (n, 2) containing the index pairs i < j of all boxes whose interiors overlap.
+
+	The boxes are sorted into a grid of cells and only boxes sharing a cell are compared.
+	"""
+
+	extents = numpy.max(maxs - mins, axis = 1)
+
+	if not len(extents) or not numpy.any(extents > 0):
+		return numpy.zeros((0, 2), dtype = numpy.int64)
+
+	cell_size = numpy.median(extents[extents > 0])
+	cell_mins = numpy.floor(mins / cell_size).astype(numpy.int64)
+	cell_maxs = numpy.floor(maxs / cell_size).astype(numpy.int64)
+	origin = cell_mins.min(axis = 0)
+	cell_mins -= origin
+	cell_maxs -= origin
+
+	# Enumerate all cells covered by each box.
+	widths = cell_maxs[:, 0] - cell_mins[:, 0] + 1
+	counts = widths * (cell_maxs[:, 1] - cell_mins[:, 1] + 1)
+	box_ids = numpy.repeat(numpy.arange(len(mins)), counts)
+	offsets = numpy.arange(len(box_ids)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+	cells = numpy.column_stack([
+		cell_mins[box_ids, 0] + offsets % widths[box_ids],
+		cell_mins[box_ids, 1] + offsets // widths[box_ids]])
+	keys = cells[:, 0] * (int(cell_maxs[:, 1].max()) + 1) + cells[:, 1]
+
+	order = numpy.argsort(keys, kind = 'stable')
+	keys = keys[order]
+	box_ids = box_ids[order]
+	cells = cells[order]
+
+	# Pair each entry with all following entries of the same cell.
+	group_ends = numpy.searchsorted(keys, keys, 'right')
+	pair_counts = group_ends - numpy.arange(len(keys)) - 1
+	firsts = numpy.repeat(numpy.arange(len(keys)), pair_counts)
+	seconds = firsts + 1 + numpy.arange(len(firsts)) - numpy.repeat(numpy.cumsum(pair_counts) - pair_counts, pair_counts)
+
+	a = box_ids[firsts]
+	b = box_ids[seconds]
+	overlapping = numpy.all((mins[a] < maxs[b]) & (mins[b] < maxs[a]), axis = 1)
+
+	# Boxes sharing multiple cells are only reported in the cell containing the lower left corner of their intersection.
+	corner_cells = numpy.floor(numpy.maximum(mins[a], mins[b]) / cell_size).astype(numpy.int64) - origin
+	overlapping &= numpy.all(corner_cells == cells[firsts], axis = 1)
+
+	return numpy.column_stack([numpy.minimum(a, b), numpy.maximum(a, b)])[overlapping]
+
+
+def _triangles_overlap(triangles1, triangles2):
+	"""
+	Return for each pair of triangles from the two arrays of shape (n, 3, 2) whether their interiors overlap.
+
+	Uses the separating axis theorem with the normals of all edges of both triangles as axes.
+	"""
+
+	separated = numpy.zeros(len(triangles1), dtype = bool)
+
+	for triangles in [triangles1, triangles2]:
+		for i in range(3):
+			dx, dy = (triangles[:, (i + 1) % 3] - triangles[:, i]).T
+			axes = numpy.column_stack([-dy, dx])
+			projected1 = numpy.einsum('nij,nj->ni', triangles1, axes)
+			projected2 = numpy.einsum('nij,nj->ni', triangles2, axes)
+
+			separated |= (projected1.max(axis = 1) <= projected2.min(axis = 1)) \
+				| (projected2.max(axis = 1) <= projected1.min(axis = 1))
+
+	return ~separated
+
+
+def _overlap_points(triangles1, triangles2):
+	"""
+	Return an array of shape (n, 2) containing a point inside the intersection of each pair of counter-clockwise triangles from the two arrays of shape (n, 3, 2).
+
+	The point is the average of the corners of each triangle lying inside the other triangle and the intersections between the edges of the triangles. These are the corners of the convex intersection, so their average lies inside of it.
+	"""
+
+	def cross(u, v):
+		return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+	def edges(triangles):
+		return numpy.roll(triangles, -1, axis = 1) - triangles
+
+	def inside(triangles, points):
+		# Whether each of the 3 points of each pair lies inside the triangle of the pair.
+		return numpy.all(
+			cross(edges(triangles)[:, None, :, :], points[:, :, None, :] - triangles[:, None, :, :]) >= 0,
+			axis = 2)
+
+	sums = numpy.zeros((len(triangles1), 2))
+	counts = numpy.zeros(len(triangles1))
+
+	for triangles, other in [(triangles1, triangles2), (triangles2, triangles1)]:
+		mask = inside(other, triangles)
+		sums += numpy.sum(triangles * mask[:, :, None], axis = 1)
+		counts += numpy.sum(mask, axis = 1)
+
+	# Intersections between each of the 3 edges of the first triangle and each of the 3 edges of the second triangle.
+	p = triangles1[:, :, None, :]
+	r = edges(triangles1)[:, :, None, :]
+	q = triangles2[:, None, :, :]
+	s = edges(triangles2)[:, None, :, :]
+	denominators = cross(r, s)
+	nonzero_denominators = numpy.where(denominators == 0, 1, denominators)
+	t = cross(q - p, s) / nonzero_denominators
+	u = cross(q - p, r) / nonzero_denominators
+	mask = (denominators != 0) & (t > 0) & (t < 1) & (u > 0) & (u < 1)
+	sums += numpy.sum((p + r * t[..., None]) * mask[..., None], axis = (1, 2))
+	counts += numpy.sum(mask, axis = (1, 2))
+
+	return sums / numpy.maximum(counts, 1)[:, None]
+
+
+def find_shaded_regions(projected_vertices, faces, shade_count):
+	"""
+	Return a list of pairs of gray levels and paths.Polygon instances covering the visible parts of all faces with that shade.
+
+	The vertex coordinates must already be transformed into the drawing's coordinate system. The faces are shaded according to the angle between their normal and the direction of the light. Where two faces facing the viewer overlap in the drawing, the parts of the farther face hidden by the nearer face are removed.
+	"""
+
+	corners = projected_vertices[faces]
+	normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+	# Only faces facing the viewer can be visible.
+	visible_ids = numpy.flatnonzero(normals[:, 2] > 0)
+	corners = corners[visible_ids]
+	normals = normals[visible_ids]
+	triangles = corners[:, :, :2]
+
+	# Homogeneous coordinates of the corners of each triangle as columns, as used by paths.Path.
+	path_matrices = numpy.concatenate(
+		[numpy.transpose(triangles, (0, 2, 1)), numpy.ones((len(triangles), 1, 3))],
+		axis = 1)
+
+	polygons = [paths.polygon(paths.Path(i)) for i in path_matrices]
+
+	def z_at(indices, points):
+		# Depth of the planes of the faces at the specified points in the drawing.
+		nx, ny, nz = normals[indices].T
+		x1, y1, z1 = corners[indices, 0].T
+
+		return z1 - (nx * (points[:, 0] - x1) + ny * (points[:, 1] - y1)) / nz
+
+	pairs = _box_pairs(triangles.min(axis = 1), triangles.max(axis = 1))
+
+	# Faces sharing an edge in opposite directions lie on opposite sides of it in the drawing, as both are counter-clockwise. Faces only sharing a vertex can still overlap, e.g. near a silhouette, and are tested below.
+	faces1 = faces[visible_ids[pairs[:, 0]]]
+	faces2 = faces[visible_ids[pairs[:, 1]]]
+	edges1 = numpy.stack([faces1, numpy.roll(faces1, -1, axis = 1)], axis = 2)
+	reversed_edges2 = numpy.stack([numpy.roll(faces2, -1, axis = 1), faces2], axis = 2)
+
+	pairs = pairs[~numpy.any(
+		numpy.all(edges1[:, :, None] == reversed_edges2[:, None], axis = 3),
+		axis = (1, 2))]
+
+	pairs = pairs[_triangles_overlap(triangles[pairs[:, 0]], triangles[pairs[:, 1]])]
+
+	util.log('Shading {} faces with {} overlaps ...', len(visible_ids), len(pairs))
+
+	# Decide for each pair of overlapping faces which one is in front by comparing their depth at a point where they overlap.
+	a, b = pairs.T
+	points = _overlap_points(triangles[a], triangles[b])
+	a_in_front = z_at(a, points) > z_at(b, points)
+	occluded_ids = numpy.where(a_in_front, b, a)
+	occluder_ids = numpy.where(a_in_front, a, b)
+
+	order = numpy.argsort(occluded_ids, kind = 'stable')
+	occluded_ids = occluded_ids[order]
+	occluder_ids = occluder_ids[order]
+
+	visible_polygons = list(polygons)
+
+	for i, j in zip(*numpy.unique(occluded_ids, return_index = True)):
+		end = numpy.searchsorted(occluded_ids, i, 'right')
+
+		visible_polygons[i] = polygons[i] - paths.union(*(polygons[k] for k in occluder_ids[j:end]))
+
+	brightness = numpy.clip(
+		numpy.dot(normals / numpy.linalg.norm(normals, axis = 1)[:, None], _light_direction),
+		0,
+		1)
+
+	shades = numpy.minimum((brightness * shade_count).astype(int), shade_count - 1)
+
+	def iter_regions():
+		for i in range(shade_count):
+			region = paths.union(*(visible_polygons[j] for j in numpy.flatnonzero(shades == i)))
+
+			if region.paths:
+				gray = _min_gray + (_max_gray - _min_gray) * (i + .5) / shade_count
+
+				yield gray, region
+
+	return list(iter_regions())
+
+
+def write_shading(file: asymptote.AsymptoteFile, projected_vertices, faces, shade_count):
+	for gray, region in find_shaded_regions(projected_vertices, faces, shade_count):
+		file.write('fill({}, {});', region, 'gray({}) + evenodd'.format(gray))
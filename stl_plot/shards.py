@@ -0,0 +1,356 @@
+"""
+Rendering split into shards, which can be processed by independent worker processes on this or other hosts sharing a directory.
+
+The coordinator writes a job directory containing the drawn segments and patches of a drawing as plot.SegmentArrays and a marker file for each shard of the drawn segments:
+
+- job.json: The engine and the partition of the drawn segments. Written last, workers ignore jobs without it.
+- segments.npz: The stored plot.SegmentArrays instance.
+- todo/<shard>: Shards which have not been claimed yet.
+- claimed/<shard>.<worker>: Shards being processed. The worker refreshes the modification time of the file while processing the shard. A claim which has not been refreshed for longer than the timeout is considered stale and can be taken over by another worker.
+- results/<shard>.npz: The visible lines found in each shard.
+
+Shards are claimed by renaming their marker file, which succeeds for only one of multiple workers trying to claim the same shard. When all results exist, the coordinator merges them into the lines of the drawing and removes the job directory.
+"""
+
+import hashlib, json, numpy, os, shutil, socket, threading, time
+from stl_plot import util, plot, engines
+
+
+# Incremented whenever the format of the job directory changes.
+_version = 2
+
+# Interval in seconds in which the coordinator checks whether all shards are done.
+_poll_interval = 1
+
+
+def _list_dir(path):
+	try:
+		return sorted(os.listdir(path))
+	except FileNotFoundError:
+		return []
+
+
+def _shard_name(index):
+	return '{:06d}'.format(index)
+
+
+def _filesystem_time(job_dir, worker_id):
+	"""
+	Return the current time as seen by the file system, so that the modification times of files written by workers on hosts with differing clocks can be compared.
+	"""
+
+	# Written next to the job directory, which may be removed at any time.
+	path = os.path.join(os.path.dirname(job_dir), '.clock-{}'.format(worker_id))
+
+	with open(path, 'wb'):
+		pass
+
+	try:
+		return os.stat(path).st_mtime
+	finally:
+		os.unlink(path)
+
+
+def _save_polylines(path, polylines_by_style):
+	styles = sorted(polylines_by_style)
+	arrays = { }
+
+	for i, style in enumerate(styles):
+		polylines = polylines_by_style[style]
+		arrays['points_{}'.format(i)] = numpy.concatenate(polylines) if polylines else numpy.zeros((0, 2))
+		arrays['offsets_{}'.format(i)] = numpy.cumsum([0] + [len(j) for j in polylines])
+
+	with util.writing_file(path) as file:
+		numpy.savez(file, styles = numpy.array(styles, dtype = str), **arrays)
+
+
+def _load_polylines(path):
+	with numpy.load(path) as data:
+		polylines_by_style = { }
+
+		for i, style in enumerate(data['styles'].tolist()):
+			points = data['points_{}'.format(i)]
+			offsets = data['offsets_{}'.format(i)].tolist()
+
+			polylines_by_style[style] = [points[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+		return polylines_by_style
+
+
+def create_job(shard_dir, segment_arrays: plot.SegmentArrays, engine_name, shard_count):
+	"""
+	Write a job directory for the specified segments into shard_dir and return its path.
+
+	The name of the job directory is derived from its contents. If a job directory with the same contents already exists, it is reused together with the results already found.
+	"""
+
+	arrays = { i: getattr(segment_arrays, i) for i in plot.SegmentArrays.array_names }
+
+	hash = hashlib.sha256()
+	hash.update(json.dumps([_version, engine_name, shard_count]).encode())
+	segment_arrays.update_hash(hash)
+
+	job_dir = os.path.join(shard_dir, hash.hexdigest()[:16])
+
+	if os.path.exists(os.path.join(job_dir, 'job.json')):
+		util.log('Reusing job {} ...', job_dir)
+
+		return job_dir
+
+	# Contiguous ranges of drawn segments, so that chains of connected segments mostly end up in the same shard.
+	segment_count = len(segment_arrays.segments)
+	shard_count = max(1, min(shard_count, segment_count))
+	offsets = [segment_count * i // shard_count for i in range(shard_count + 1)]
+
+	for i in 'todo', 'claimed', 'results':
+		os.makedirs(os.path.join(job_dir, i), exist_ok = True)
+
+	with util.writing_file(os.path.join(job_dir, 'segments.npz')) as file:
+		numpy.savez(file, **arrays)
+
+	for i in range(shard_count):
+		util.write_file(os.path.join(job_dir, 'todo', _shard_name(i)), b'')
+
+	util.write_text_file(
+		os.path.join(job_dir, 'job.json'),
+		json.dumps(dict(version = _version, engine = engine_name, offsets = offsets), sort_keys = True))
+
+	util.log('Created job {} with {} shards.', job_dir, shard_count)
+
+	return job_dir
+
+
+class _Job:
+	"""
+	A job directory as seen by a worker. The segments are only loaded when the first shard is processed.
+	"""
+
+	def __init__(self, job_dir):
+		self.job_dir = job_dir
+
+		with util.reading_text_file(os.path.join(job_dir, 'job.json')) as file:
+			metadata = json.load(file)
+
+		if metadata['version'] != _version:
+			raise util.UserError('Job {} was created by an incompatible version.', job_dir)
+
+		self.engine = engines.get(metadata['engine'])
+		self.offsets = metadata['offsets']
+		self._segment_arrays = None
+
+	@property
+	def segment_arrays(self):
+		if self._segment_arrays is None:
+			with numpy.load(os.path.join(self.job_dir, 'segments.npz')) as data:
+				self._segment_arrays = plot.SegmentArrays(**{ i: data[i] for i in plot.SegmentArrays.array_names })
+
+		return self._segment_arrays
+
+	def is_done(self):
+		results = set(_list_dir(os.path.join(self.job_dir, 'results')))
+
+		return all(_shard_name(i) + '.npz' in results for i in range(len(self.offsets) - 1))
+
+	def process(self, shard, claim_path, timeout):
+		"""
+		Find the visible lines of a claimed shard and write them to the results directory.
+		"""
+
+		index = int(shard)
+		start, end = self.offsets[index:index + 2]
+		stop_heartbeat = threading.Event()
+
+		def heartbeat():
+			while not stop_heartbeat.wait(timeout / 4):
+				try:
+					os.utime(claim_path)
+				except FileNotFoundError:
+					# The claim has been taken over by another worker, which will find the same result.
+					pass
+
+		heartbeat_thread = threading.Thread(target = heartbeat, daemon = True)
+		heartbeat_thread.start()
+
+		try:
+			drawn_segments, border_segments, patches = self.segment_arrays.to_objects(range(start, end))
+
+			util.log('Processing shard {} of {} with {} segments ...', shard, self.job_dir, len(drawn_segments))
+
+			polylines_by_style = self.engine.find_tile_lines(drawn_segments, border_segments, patches, None)
+
+			# Another worker may have processed the same shard after taking over the claim, and the coordinator may already have merged the results and removed the job.
+			if not os.path.exists(os.path.join(self.job_dir, 'job.json')):
+				return
+
+			_save_polylines(os.path.join(self.job_dir, 'results', shard + '.npz'), polylines_by_style)
+		finally:
+			stop_heartbeat.set()
+			heartbeat_thread.join()
+
+		try:
+			os.unlink(claim_path)
+		except FileNotFoundError:
+			pass
+
+
+def _claim(job_dir, worker_id, timeout):
+	"""
+	Claim an unclaimed shard or take over a stale claim. Returns the name of the shard and the path of the claim, or None, if no shard could be claimed.
+	"""
+
+	claimed_dir = os.path.join(job_dir, 'claimed')
+
+	for shard in _list_dir(os.path.join(job_dir, 'todo')):
+		claim_path = os.path.join(claimed_dir, '{}.{}'.format(shard, worker_id))
+
+		try:
+			util.rename_atomic(os.path.join(job_dir, 'todo', shard), claim_path)
+		except FileNotFoundError:
+			# Claimed by another worker.
+			continue
+
+		return shard, claim_path
+
+	claims = _list_dir(claimed_dir)
+
+	if claims:
+		now = _filesystem_time(job_dir, worker_id)
+		results = set(_list_dir(os.path.join(job_dir, 'results')))
+
+		for i in claims:
+			shard = i.split('.', 1)[0]
+			path = os.path.join(claimed_dir, i)
+
+			try:
+				is_stale = shard + '.npz' not in results and os.stat(path).st_mtime < now - timeout
+			except FileNotFoundError:
+				continue
+
+			if is_stale:
+				claim_path = os.path.join(claimed_dir, '{}.{}'.format(shard, worker_id))
+
+				try:
+					util.rename_atomic(path, claim_path)
+				except FileNotFoundError:
+					continue
+
+				# Refresh the claim, as renaming keeps the modification time.
+				os.utime(claim_path)
+				util.log('Taking over stale shard {} of {} ...', shard, job_dir)
+
+				return shard, claim_path
+
+	return None
+
+
+def _get_worker_id():
+	return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+
+def work(job_dirs, timeout, worker_id = None):
+	"""
+	Process shards of the specified jobs until no more shards can be claimed. Returns the number of shards processed.
+	"""
+
+	if worker_id is None:
+		worker_id = _get_worker_id()
+
+	jobs = { }
+	count = 0
+
+	while True:
+		for job_dir in job_dirs:
+			if not os.path.exists(os.path.join(job_dir, 'job.json')):
+				continue
+
+			try:
+				# Loaded before claiming a shard, so that a job which cannot be loaded does not keep a shard claimed until the timeout.
+				if job_dir not in jobs:
+					jobs[job_dir] = _Job(job_dir)
+
+				claim = _claim(job_dir, worker_id, timeout)
+
+				if claim is not None:
+					jobs[job_dir].process(*claim, timeout)
+					count += 1
+
+					break
+			except FileNotFoundError:
+				# The job has been merged and removed by the coordinator.
+				pass
+		else:
+			return count
+
+
+def merge(job_dir):
+	"""
+	Merge the results of all shards of a job, as returned by engines.Engine.find_lines().
+	"""
+
+	job = _Job(job_dir)
+
+	return plot.merge_polylines([
+		_load_polylines(os.path.join(job_dir, 'results', _shard_name(i) + '.npz'))
+		for i in range(len(job.offsets) - 1)])
+
+
+class ShardedEngine(engines.Engine):
+	"""
+	Engine which acts as the coordinator of a sharded rendering using another engine. The coordinator processes shards itself and waits until the shards claimed by other workers are done.
+	"""
+
+	def __init__(self, *, engine_name, shard_dir, shard_count, timeout):
+		self._engine_name = engine_name
+		self._shard_dir = shard_dir
+		self._shard_count = shard_count
+		self._timeout = timeout
+
+	def find_lines(self, polyhedron, projection, min_angle):
+		segment_arrays = plot.SegmentArrays.from_polyhedron(polyhedron, projection, min_angle)
+		job_dir = create_job(self._shard_dir, segment_arrays, self._engine_name, self._shard_count)
+		job = _Job(job_dir)
+
+		is_waiting = False
+
+		while True:
+			# Also takes over the shards of workers which have crashed.
+			work([job_dir], self._timeout)
+
+			if job.is_done():
+				break
+
+			if not is_waiting:
+				util.log('Waiting for shards processed by other workers ...')
+				is_waiting = True
+
+			time.sleep(_poll_interval)
+
+		util.log('Merging results of {} ...', job_dir)
+
+		polylines_by_style = merge(job_dir)
+		shutil.rmtree(job_dir, ignore_errors = True)
+
+		return polylines_by_style
+
+
+def main(shard_dir, timeout, wait):
+	"""
+	Process the shards of all jobs in shard_dir. If wait is set, keep waiting for new jobs instead of exiting when no more shards can be claimed.
+	"""
+
+	worker_id = _get_worker_id()
+
+	while True:
+		job_dirs = [
+			os.path.join(shard_dir, i) for i in _list_dir(shard_dir)
+			if os.path.isdir(os.path.join(shard_dir, i))]
+
+		count = work(job_dirs, timeout, worker_id)
+
+		if count:
+			util.log('Processed {} shards.', count)
+
+		if not wait:
+			break
+
+		time.sleep(_poll_interval)
@@ -0,0 +1,237 @@
+"""
+Preprocessed mesh data stored next to an input file, so that the same mesh can be plotted repeatedly without parsing and welding it again.
+
+The sidecar is a directory containing one .npy file per array, which can be memory-mapped, and a metadata file identifying the input file the arrays were generated from.
+"""
+
+import hashlib, json, numpy, os
+from stl_plot.fabricate import polyhedra, mesh_formats
+from stl_plot import util
+
+
+# Incremented whenever the format or contents of the stored arrays change.
+_version = 1
+
+_array_names = [
+	'vertices', 'faces', 'next', 'opposite', 'face_normals', 'dihedral_angles']
+
+
+class MeshArrays:
+	"""
+	Preprocessed representation of a closed triangle mesh.
+
+	Half-edges are numbered as described in polyhedra.half_edge_arrays().
+	"""
+
+	def __init__(self, *, vertices, faces, next, opposite, face_normals,
+			dihedral_angles):
+		self.vertices = vertices
+		self.faces = faces
+		self.next = next
+		self.opposite = opposite
+		self.face_normals = face_normals
+		self.dihedral_angles = dihedral_angles
+
+	@classmethod
+	def from_triangles(cls, triangles):
+		return cls.from_indexed(*polyhedra.weld_triangles(triangles))
+
+	@classmethod
+	def from_indexed(cls, vertices, faces):
+		next, opposite = polyhedra.half_edge_arrays(faces)
+		face_normals = polyhedra.face_normal_array(vertices, faces)
+
+		return cls(
+			vertices = vertices,
+			faces = faces,
+			next = next,
+			opposite = opposite,
+			face_normals = face_normals,
+			dihedral_angles = polyhedra.dihedral_angle_array(face_normals, opposite))
+
+	@classmethod
+	def concatenate(cls, mesh_arrays_list):
+		"""
+		Combine multiple meshes into a single mesh with a connected component for each of them.
+		"""
+
+		vertex_offsets = numpy.cumsum([0] + [len(i.vertices) for i in mesh_arrays_list])
+		half_edge_offsets = numpy.cumsum([0] + [len(i.next) for i in mesh_arrays_list])
+
+		def concatenate_ids(name, offsets):
+			return numpy.concatenate([
+				numpy.asarray(getattr(i, name), dtype = numpy.int64) + offset
+				for i, offset in zip(mesh_arrays_list, offsets.tolist())])
+
+		return cls(
+			vertices = numpy.concatenate([i.vertices for i in mesh_arrays_list]),
+			faces = concatenate_ids('faces', vertex_offsets),
+			next = concatenate_ids('next', half_edge_offsets),
+			opposite = concatenate_ids('opposite', half_edge_offsets),
+			face_normals = numpy.concatenate([i.face_normals for i in mesh_arrays_list]),
+			dihedral_angles = numpy.concatenate([i.dihedral_angles for i in mesh_arrays_list]))
+
+	def transformed(self, transform):
+		"""
+		Return a copy of the mesh transformed by the affine, non-singular 4x4 matrix transform.
+
+		The topology of the mesh is reused. If the transform mirrors the mesh, the order of the vertices of each face is reversed, so that the faces still point outwards. The dihedral angles are only computed again if the transform does not preserve angles.
+		"""
+
+		linear = transform[:3, :3]
+		determinant = numpy.linalg.det(linear)
+		vertices = numpy.asarray(self.vertices) @ linear.T + transform[:3, 3]
+		faces = numpy.asarray(self.faces, dtype = numpy.int64)
+		opposite = numpy.asarray(self.opposite, dtype = numpy.int64)
+		dihedral_angles = numpy.asarray(self.dihedral_angles)
+
+		if determinant < 0:
+			# Reversing a face as [0, 2, 1] maps half-edge i of the face to the reverse of half-edge 2 - i.
+			half_edge_ids = numpy.arange(len(opposite))
+			reversed_ids = half_edge_ids - 2 * (half_edge_ids % 3) + 2
+			faces = faces[:, [0, 2, 1]]
+			opposite = reversed_ids[opposite[reversed_ids]]
+			dihedral_angles = dihedral_angles[reversed_ids]
+
+		# Normals are transformed by the inverse transpose.
+		face_normals = numpy.asarray(self.face_normals) @ numpy.linalg.inv(linear)
+		lengths = numpy.linalg.norm(face_normals, axis = 1)
+		nonzero = lengths > 0
+		face_normals[nonzero] /= lengths[nonzero, None]
+
+		gram = linear.T @ linear
+
+		if not numpy.allclose(gram / (gram.trace() / 3), numpy.eye(3)):
+			dihedral_angles = polyhedra.dihedral_angle_array(face_normals, opposite)
+
+		return MeshArrays(
+			vertices = vertices,
+			faces = faces,
+			next = numpy.asarray(self.next, dtype = numpy.int64),
+			opposite = opposite,
+			face_normals = face_normals,
+			dihedral_angles = dihedral_angles)
+
+	def to_polyhedron(self):
+		return polyhedra.Polyhedron(
+			self.vertices,
+			self.faces.tolist(),
+			opposite = self.opposite,
+			face_normals = self.face_normals,
+			dihedral_angles = self.dihedral_angles)
+
+
+def hash_file(path):
+	"""
+	Return the SHA-256 hash of the contents of a file as a hex string.
+	"""
+
+	hash = hashlib.sha256()
+
+	with util.reading_file(path) as file:
+		while True:
+			data = file.read(1 << 20)
+
+			if not data:
+				break
+
+			hash.update(data)
+
+	return hash.hexdigest()
+
+
+def get_sidecar_path(path):
+	return path + '.stl-plot'
+
+
+def _read_metadata(sidecar_path):
+	try:
+		return json.loads(util.read_text_file(os.path.join(sidecar_path, 'meta.json')))
+	except (OSError, ValueError):
+		return None
+
+
+def _load(sidecar_path):
+	return MeshArrays(**{
+		i: numpy.load(os.path.join(sidecar_path, i + '.npy'), mmap_mode = 'r')
+		for i in _array_names})
+
+
+def _save(sidecar_path, mesh_arrays, metadata):
+	os.makedirs(sidecar_path, exist_ok = True)
+	metadata_path = os.path.join(sidecar_path, 'meta.json')
+
+	# Removed before replacing the arrays, so that the metadata of an existing sidecar does not describe a mix of old and new arrays if writing is interrupted.
+	try:
+		os.unlink(metadata_path)
+	except FileNotFoundError:
+		pass
+
+	for i in _array_names:
+		with util.writing_file(os.path.join(sidecar_path, i + '.npy')) as file:
+			numpy.save(file, getattr(mesh_arrays, i))
+
+	# Written last so that an incomplete sidecar is never considered valid.
+	util.write_text_file(metadata_path, json.dumps(metadata, sort_keys = True))
+
+
+def _load_mesh_file(path):
+	vertices, faces = mesh_formats.load_mesh(path)
+
+	try:
+		return MeshArrays.from_indexed(vertices, faces)
+	except ValueError:
+		pass
+
+	# Some exporters duplicate vertices along seams of texture coordinates or normals.
+	welded_vertices, welded_faces = polyhedra.weld_triangles(vertices[faces])
+
+	if len(welded_vertices) < len(vertices):
+		try:
+			mesh_arrays = MeshArrays.from_indexed(welded_vertices, welded_faces)
+		except ValueError:
+			pass
+		else:
+			util.log('Merged {} duplicate vertices.', len(vertices) - len(welded_vertices))
+
+			return mesh_arrays
+
+	raise util.UserError('Mesh is not closed: {}', path)
+
+
+def load_mesh_arrays(path, use_sidecar):
+	"""
+	Load the mesh file at the specified path as a MeshArrays instance. The format is selected by the file's extension, see mesh_formats.load_mesh().
+
+	If use_sidecar is true, the arrays are loaded from the sidecar of the file, which is created or replaced if it does not match the file's size and hash.
+	"""
+
+	if not use_sidecar:
+		return _load_mesh_file(path)
+
+	sidecar_path = get_sidecar_path(path)
+	stat = os.stat(path)
+	metadata = _read_metadata(sidecar_path)
+
+	# The modification time is only used to skip hashing the file, the sidecar is identified by the size and hash.
+	if metadata is not None and metadata.get('version') == _version \
+			and metadata.get('size') == stat.st_size:
+		if metadata.get('mtime_ns') == stat.st_mtime_ns \
+				or metadata.get('hash') == hash_file(path):
+			return _load(sidecar_path)
+
+	util.log('Preprocessing mesh ...')
+
+	mesh_arrays = _load_mesh_file(path)
+	metadata = dict(
+		version = _version,
+		size = stat.st_size,
+		mtime_ns = stat.st_mtime_ns,
+		hash = hash_file(path))
+
+	try:
+		_save(sidecar_path, mesh_arrays, metadata)
+	except OSError as e:
+		util.log('Warning: Could not write {}: {}', sidecar_path, e)
+
+	return mesh_arrays
@@ -0,0 +1,110 @@
+"""
+Startup benchmark, which measures the time spent importing modules when the stl-plot entry point only parses its arguments, using `python -X importtime`.
+
+Run as `python -m stl_plot.startup_benchmark`. The command fails if the median import time exceeds the budget or if one of the modules only needed to plot a file is imported.
+"""
+
+import argparse, re, statistics, subprocess, sys
+
+
+# Runs the entry point as the stl-plot script would, with arguments which make it exit after parsing them.
+_entry_point_code = 'import sys; sys.argv[0] = "stl-plot"; import stl_plot; stl_plot.script_main()'
+
+_commands = {
+	'--help': ['--help'],
+	'serve --help': ['serve', '--help'],
+	'worker --help': ['worker', '--help'],
+	'invalid arguments': ['--engine', 'invalid', 'file.stl']}
+
+# Modules which should only be imported once the arguments have been parsed.
+_deferred_modules = ['numpy', 'stl', 'asyncio', 'stl_plot.plot', 'stl_plot.fabricate.asymptote']
+
+_import_time_pattern = re.compile(r'import time: +(\d+) \| +(\d+) \|( +)(.*)')
+
+
+def _run_importtime(code, args):
+	"""
+	Return a dict mapping the names of the modules imported at the top level to their cumulative import time in seconds.
+	"""
+
+	process = subprocess.run(
+		[sys.executable, '-X', 'importtime', '-c', code, *args],
+		stdout = subprocess.DEVNULL,
+		stderr = subprocess.PIPE,
+		universal_newlines = True)
+
+	times = { }
+
+	for line in process.stderr.splitlines():
+		match = _import_time_pattern.fullmatch(line)
+
+		if match is not None:
+			_, cumulative, indentation, name = match.groups()
+
+			times[name.strip()] = len(indentation) == 1, int(cumulative) / 1e6
+
+	return times
+
+
+def measure(args, repeat):
+	"""
+	Run the entry point with the specified arguments repeat times and return the median import time in seconds of the modules not already imported by the interpreter on startup, together with the set of all modules imported.
+	"""
+
+	totals = []
+	modules = set()
+
+	for _ in range(repeat):
+		startup_modules = _run_importtime('pass', [])
+		times = _run_importtime(_entry_point_code, args)
+
+		totals.append(sum(
+			time for name, (is_top_level, time) in times.items()
+			if is_top_level and name not in startup_modules))
+
+		modules.update(times)
+
+	return statistics.median(totals), modules
+
+
+def main(repeat, budget):
+	success = True
+
+	for name, args in _commands.items():
+		total, modules = measure(args, repeat)
+		deferred_modules = [i for i in _deferred_modules if i in modules]
+
+		print('{}: {:.1f} ms'.format(name, total * 1000))
+
+		if total > budget / 1000:
+			print('    Exceeds the budget of {:g} ms.'.format(budget))
+			success = False
+
+		for i in deferred_modules:
+			print('    Imports {}.'.format(i))
+			success = False
+
+	return success
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		prog = 'python -m stl_plot.startup_benchmark',
+		description = 'Measure the time spent importing modules before stl-plot has parsed its arguments.')
+
+	parser.add_argument(
+		'--repeat',
+		type = int,
+		default = 5,
+		help = 'Number of runs of which the median is reported. Defaults to 5.')
+	parser.add_argument(
+		'--budget',
+		type = float,
+		default = 100,
+		help = 'Maximum import time in milliseconds. Defaults to 100.')
+
+	return parser.parse_args()
+
+
+if __name__ == '__main__':
+	sys.exit(0 if main(**vars(parse_args())) else 1)
@@ -73,9 +73,7 @@ class CommandError(Exception):
 	pass
 
 
-@contextlib.contextmanager
-def command_context(*args, remove_env = [], set_env = { }, cwd = None,
-		stdout = None, stderr = None):
+def _command_env(remove_env, set_env):
 	env = dict(os.environ)
 	
 	for i in remove_env:
@@ -85,6 +83,14 @@ def command_context(*args, remove_env = [], set_env = { }, cwd = None,
 	for k, v in set_env.items():
 		env[k] = v
 	
+	return env
+
+
+@contextlib.contextmanager
+def command_context(*args, remove_env = [], set_env = { }, cwd = None,
+		stdout = None, stderr = None):
+	env = _command_env(remove_env, set_env)
+	
 	try:
 		process = subprocess.Popen(args, env = env, cwd = cwd, stdout = stdout,
 			stderr = stderr)
@@ -112,6 +118,76 @@ def command(*args, remove_env = [], set_env = { }, cwd = None, stdout = None,
 		return process.communicate()
 
 
+@contextlib.asynccontextmanager
+async def async_command_context(*args, remove_env = [], set_env = { },
+		cwd = None, stdout = None, stderr = None):
+	"""
+	Asynchronous version of command_context() yielding an asyncio.subprocess.Process instance.
+	
+	The process is killed if the block is left early, e.g. because the task running it was cancelled.
+	"""
+	
+	# Imported here because asyncio is slow to import and not needed by most users of this module.
+	import asyncio
+	
+	env = _command_env(remove_env, set_env)
+	
+	try:
+		process = await asyncio.create_subprocess_exec(*args, env = env,
+			cwd = cwd, stdout = stdout, stderr = stderr)
+	except OSError as e:
+		raise CommandError('Error running {}: {}'.format(args[0], e))
+	
+	try:
+		yield process
+	finally:
+		if process.returncode is None:
+			try:
+				process.kill()
+			except OSError:
+				# Ignore exceptions here so we don't mask the already-being-thrown exception.
+				pass
+			
+			# Shield the wait so that a second cancellation does not leave a zombie behind.
+			await asyncio.shield(process.wait())
+	
+	if process.returncode:
+		raise CommandError('Command failed: {}'.format(' '.join(args)))
+
+
+async def async_command(*args, remove_env = [], set_env = { }, cwd = None,
+		stdout = None, stderr = None, timeout = None):
+	"""
+	Asynchronous version of command(). The process is killed and CommandError is raised if it does not terminate within timeout seconds.
+	"""
+	
+	import asyncio
+	
+	async with async_command_context(*args, remove_env = remove_env,
+			set_env = set_env, cwd = cwd, stdout = stdout,
+			stderr = stderr) as process:
+		try:
+			return await asyncio.wait_for(process.communicate(), timeout)
+		except asyncio.TimeoutError:
+			raise CommandError('Command timed out after {} seconds: {}'.format(
+				timeout, ' '.join(args))) from None
+
+
+class CommandPool:
+	"""
+	Runs commands using async_command() while limiting the number of commands running at the same time.
+	"""
+	
+	def __init__(self, max_jobs):
+		import asyncio
+		
+		self._semaphore = asyncio.Semaphore(max_jobs)
+	
+	async def command(self, *args, **kwargs):
+		async with self._semaphore:
+			return await async_command(*args, **kwargs)
+
+
 def bash_escape_string(string):
 	return "'{}'".format(re.sub("'", "'"'"'"'"'"'"'", string))
 